@@ -0,0 +1,19 @@
+"""Benchmarks of phelel.
+
+Benchmarks are written in the style of airspeed velocity (asv), i.e., classes
+with ``setup`` and ``time_*`` / ``peakmem_*`` methods and optional ``params``.
+They run with asv using ``asv.conf.json`` at the repository root::
+
+    asv run
+    asv continuous main HEAD
+
+or without asv by the simple runner in this directory::
+
+    python -m benchmarks
+    python -m benchmarks DLocalPotential --repeat 5
+
+The bundled test data in ``test`` directory are used for small benchmarks and
+synthetic data generated by ``benchmarks.synthetic`` are used for larger
+supercells.
+
+"""
@@ -0,0 +1,74 @@
+"""Simple runner of benchmarks without asv.
+
+Usage::
+
+    python -m benchmarks [pattern ...] [--repeat N]
+
+Benchmark classes whose names contain one of the patterns are run. Each
+``time_*`` method is run ``N`` times for each combination of parameters after
+calling ``setup`` and the minimum time is reported. ``peakmem_*`` methods are
+skipped because peak memory is measured only by asv.
+
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+import inspect
+import itertools
+import pathlib
+import time
+
+
+def _get_suites(patterns: list[str]):
+    for path in sorted(pathlib.Path(__file__).parent.glob("bench_*.py")):
+        module = importlib.import_module(f"benchmarks.{path.stem}")
+        for name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__ or name.startswith("_"):
+                continue
+            if patterns and not any(p in name for p in patterns):
+                continue
+            yield f"{path.stem}.{name}", cls
+
+
+def _get_param_sets(cls) -> list[tuple]:
+    params = getattr(cls, "params", None)
+    if params is None:
+        return [()]
+    if isinstance(params, tuple):
+        return list(itertools.product(*params))
+    return [(p,) for p in params]
+
+
+def _run_suite(name: str, cls, repeat: int):
+    methods = [m for m in dir(cls) if m.startswith("time_")]
+    for param_set in _get_param_sets(cls):
+        suite = cls()
+        if hasattr(suite, "setup"):
+            suite.setup(*param_set)
+        try:
+            for method in methods:
+                times = []
+                for _ in range(repeat):
+                    t0 = time.perf_counter()
+                    getattr(suite, method)(*param_set)
+                    times.append(time.perf_counter() - t0)
+                print(f"{name}.{method}{param_set}: {min(times):.4f} s", flush=True)
+        finally:
+            if hasattr(suite, "teardown"):
+                suite.teardown(*param_set)
+
+
+def main():
+    """Run benchmarks."""
+    parser = argparse.ArgumentParser(description="Run phelel benchmarks.")
+    parser.add_argument("patterns", nargs="*", help="Patterns of class names")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs")
+    args = parser.parse_args()
+    for name, cls in _get_suites(args.patterns):
+        _run_suite(name, cls, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
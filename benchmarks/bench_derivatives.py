@@ -0,0 +1,133 @@
+"""Benchmarks of dV/du and dDij/du calculations."""
+
+from __future__ import annotations
+
+from phelel import Phelel
+from phelel.api_phelel import PhelelDataset
+from phelel.base.Dij_qij import DDijQij
+from phelel.base.local_potential import DLocalPotential
+
+from .common import get_phelel, get_phelel_dataset, systems
+from .synthetic import get_synthetic_phelel
+
+
+def _get_DLocalPotential(phe: Phelel, **kwargs) -> DLocalPotential:
+    assert phe.fft_mesh is not None
+    return DLocalPotential(
+        phe.fft_mesh,
+        phe.p2s_matrix,
+        phe.supercell,
+        symmetry=phe.symmetry,
+        atom_indices=phe.atom_indices_in_derivatives,
+        verbose=False,
+        **kwargs,
+    )
+
+
+def _get_DDijQij(phe: Phelel) -> DDijQij:
+    return DDijQij(
+        phe.supercell,
+        symmetry=phe.symmetry,
+        atom_indices=phe.atom_indices_in_derivatives,
+        verbose=False,
+    )
+
+
+def _run_dVdu(dvdu: DLocalPotential, phe: Phelel, dataset: PhelelDataset):
+    loc_pots = dataset.local_potentials
+    dvdu.run(loc_pots[0], loc_pots[1:], phe.dataset["first_atoms"])
+
+
+def _run_dDijdu(ddijdu: DDijQij, phe: Phelel, dataset: PhelelDataset):
+    ddijdu.run(
+        dataset.Dijs[0],
+        dataset.Dijs[1:],
+        dataset.qijs[0],
+        dataset.qijs[1:],
+        phe.dataset["first_atoms"],
+        dataset.lm_channels,
+    )
+
+
+class DLocalPotentialSuite:
+    """DLocalPotential.run with bundled test data."""
+
+    params = (list(systems), ["finufft", None], ["double", "single"])
+    param_names = ["system", "nufft", "precision"]
+    timeout = 300
+
+    def setup(self, system, nufft, precision):
+        """Read test data."""
+        self.phe = get_phelel(system)
+        self.dataset = get_phelel_dataset(system)
+        self.nufft = nufft
+        self.precision = precision
+
+    def time_run(self, system, nufft, precision):
+        """Time DLocalPotential.run."""
+        dvdu = _get_DLocalPotential(self.phe, nufft=self.nufft, precision=precision)
+        _run_dVdu(dvdu, self.phe, self.dataset)
+
+    def peakmem_run(self, system, nufft, precision):
+        """Peak memory of DLocalPotential.run."""
+        self.time_run(system, nufft, precision)
+
+
+class DLocalPotentialWorkersSuite:
+    """DLocalPotential.run with process pool of bundled test data."""
+
+    params = ([None, 2], [None, 2])
+    param_names = ["n_workers", "fft_workers"]
+    timeout = 300
+
+    def setup(self, n_workers, fft_workers):
+        """Read test data."""
+        self.phe = get_phelel("CdAs2_111")
+        self.dataset = get_phelel_dataset("CdAs2_111")
+
+    def time_run(self, n_workers, fft_workers):
+        """Time DLocalPotential.run."""
+        dvdu = _get_DLocalPotential(
+            self.phe, n_workers=n_workers, fft_workers=fft_workers
+        )
+        _run_dVdu(dvdu, self.phe, self.dataset)
+
+
+class DDijQijSuite:
+    """DDijQij.run with bundled test data."""
+
+    params = list(systems)
+    param_names = ["system"]
+
+    def setup(self, system):
+        """Read test data."""
+        self.phe = get_phelel(system)
+        self.dataset = get_phelel_dataset(system)
+
+    def time_run(self, system):
+        """Time DDijQij.run."""
+        _run_dDijdu(_get_DDijQij(self.phe), self.phe, self.dataset)
+
+
+class SyntheticSuite:
+    """Derivatives of synthetic diamond supercells of dim x dim x dim."""
+
+    params = ([1, 2], [1, 4])
+    param_names = ["dim", "ncdij"]
+    timeout = 1200
+
+    def setup(self, dim, ncdij):
+        """Generate synthetic data."""
+        self.phe, self.dataset = get_synthetic_phelel(dim=dim, ncdij=ncdij)
+
+    def time_dVdu(self, dim, ncdij):
+        """Time DLocalPotential.run."""
+        _run_dVdu(_get_DLocalPotential(self.phe), self.phe, self.dataset)
+
+    def peakmem_dVdu(self, dim, ncdij):
+        """Peak memory of DLocalPotential.run."""
+        self.time_dVdu(dim, ncdij)
+
+    def time_dDijdu(self, dim, ncdij):
+        """Time DDijQij.run."""
+        _run_dDijdu(_get_DDijQij(self.phe), self.phe, self.dataset)
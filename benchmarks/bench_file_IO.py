@@ -0,0 +1,75 @@
+"""Benchmarks of reading and writing files."""
+
+from __future__ import annotations
+
+import pathlib
+import tempfile
+
+from phelel import Phelel
+from phelel.file_IO import read_phelel_params_hdf5
+from phelel.interface.phelel_yaml import PhelelYaml
+from phelel.interface.vasp.derivatives import read_files
+
+from .common import get_phelel, get_phelel_dataset, test_dir
+
+
+class PhelelParamsHdf5Suite:
+    """Reading and writing phelel_params.hdf5."""
+
+    params = (["C111", "NaCl111", "CdAs2_111"], [None, "gzip", "lzf"])
+    param_names = ["system", "compression"]
+
+    def setup(self, system, compression):
+        """Compute derivatives and write phelel_params.hdf5 to be read."""
+        self.phe = get_phelel(system)
+        self.phe.run_derivatives(get_phelel_dataset(system))
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = pathlib.Path(self.tmpdir.name) / "phelel_params.hdf5"
+        self.phe.save_hdf5(self.filename, compression=compression)
+
+    def teardown(self, system, compression):
+        """Remove temporary directory."""
+        self.tmpdir.cleanup()
+
+    def time_read(self, system, compression):
+        """Time read_phelel_params_hdf5."""
+        read_phelel_params_hdf5(self.filename)
+
+    def time_read_atom(self, system, compression):
+        """Time lazily reading dV/du of one atom."""
+        dVdu, _, _, _ = read_phelel_params_hdf5(self.filename, lazy=True)
+        dVdu.dVdu[:, 0]
+
+    def time_write(self, system, compression):
+        """Time write_phelel_params_hdf5 through Phelel.save_hdf5."""
+        self.phe.save_hdf5(
+            pathlib.Path(self.tmpdir.name) / "written.hdf5", compression=compression
+        )
+
+    def track_file_size(self, system, compression):
+        """Track size of phelel_params.hdf5 in bytes."""
+        return self.filename.stat().st_size
+
+
+class ReadFilesSuite:
+    """Reading VASP results in displacement directories."""
+
+    params = [None, 2]
+    param_names = ["n_workers"]
+
+    def setup(self, n_workers):
+        """Prepare Phelel instance of C111."""
+        vasp_dir = test_dir / "interface" / "vasp"
+        self.dir_names = [vasp_dir / f"C111_disp-{i:03d}" for i in range(2)]
+        phe_yml = PhelelYaml().read(vasp_dir / "phelel_disp_C111.yaml")
+        self.phe = Phelel(
+            phe_yml.unitcell,
+            supercell_matrix=phe_yml.supercell_matrix,
+            primitive_matrix=phe_yml.primitive_matrix,
+            fft_mesh=[18, 18, 18],
+        )
+        self.phe.dataset = phe_yml.dataset
+
+    def time_read_files(self, n_workers):
+        """Time read_files."""
+        read_files(self.phe, self.dir_names, n_workers=n_workers, log_level=0)
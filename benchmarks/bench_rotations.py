@@ -0,0 +1,66 @@
+"""Benchmarks of rotation matrices of spherical harmonics and spinor."""
+
+from __future__ import annotations
+
+import numpy as np
+
+from phelel.base.local_potential import rotate_delta_vals_in_spin_space
+from phelel.utils.rotations import SymmetryRotationTable
+from phelel.utils.spherical_harmonics import LxLyLzMatrices, SHRotationMatrices
+from phelel.utils.spinor import SpinorRotationMatrices
+
+from .common import get_phelel
+
+
+class RotationMatricesSuite:
+    """Rotation matrices of all symmetry operations of CdAs2 supercell."""
+
+    params = [2, 6]
+    param_names = ["l_max"]
+
+    def setup(self, l_max):
+        """Prepare symmetry operations."""
+        phe = get_phelel("CdAs2_111")
+        self.rotations = phe.symmetry.symmetry_operations["rotations"]
+        self.lattice = phe.supercell.cell.T
+        self.lxlylz = LxLyLzMatrices(l_max=l_max).run()
+
+    def time_sh_rotation_matrices(self, l_max):
+        """Time SHRotationMatrices.run."""
+        for r in self.rotations:
+            SHRotationMatrices(r, self.lattice, self.lxlylz).run()
+
+    def time_spinor_rotation_matrices(self, l_max):
+        """Time SpinorRotationMatrices.run."""
+        for r in self.rotations:
+            SpinorRotationMatrices(r, self.lattice).run()
+
+    def time_symmetry_rotation_table(self, l_max):
+        """Time filling SymmetryRotationTable."""
+        table = SymmetryRotationTable(self.rotations, self.lattice, l_max=l_max)
+        for i in range(len(self.rotations)):
+            table.get_sh_Delta(i)
+            table.get_spinor_Delta(i)
+
+
+class SpinRotationSuite:
+    """rotate_delta_vals_in_spin_space of ncdij=4 values on grid points."""
+
+    params = [10_000, 1_000_000]
+    param_names = ["n_points"]
+
+    def setup(self, n_points):
+        """Prepare values and symmetry operations."""
+        phe = get_phelel("CdAs2_111")
+        self.rotations = phe.symmetry.symmetry_operations["rotations"]
+        self.lattice = phe.supercell.cell.T
+        rng = np.random.default_rng(0)
+        self.vals = rng.standard_normal((4, n_points)) + 1j * rng.standard_normal(
+            (4, n_points)
+        )
+        self.out = np.empty_like(self.vals)
+
+    def time_rotate(self, n_points):
+        """Time rotate_delta_vals_in_spin_space."""
+        for r in self.rotations:
+            rotate_delta_vals_in_spin_space(self.vals, r, self.lattice, out=self.out)
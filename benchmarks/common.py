@@ -0,0 +1,52 @@
+"""Loaders of bundled test data used by benchmarks."""
+
+from __future__ import annotations
+
+import pathlib
+
+import phelel
+from phelel import Phelel
+from phelel.api_phelel import PhelelDataset
+from phelel.interface.vasp.file_IO import (
+    read_inwap_yaml,
+    read_local_potential,
+    read_PAW_Dij_qij,
+)
+
+test_dir = pathlib.Path(__file__).resolve().parent.parent / "test"
+
+# Name of system -> (phelel_disp.yaml, inwap.yaml, file tag, number of disps)
+systems = {
+    "C111": ("phelel_disp_C111.yaml", "inwap_C111.yaml", "C111", 1),
+    "NaCl111": ("phelel_disp_NaCl111.yaml", "inwap_NaCl111.yaml", "NaCl111", 2),
+    "CdAs2_111": ("phelel_disp_CdAs2.yaml", "inwap_CdAs2_111.yaml", "CdAs2_111", 5),
+}
+
+
+def get_phelel(name: str, fft_mesh: tuple[int, int, int] = (14, 14, 14)) -> Phelel:
+    """Return Phelel instance of bundled test data without derivatives."""
+    return phelel.load(test_dir / systems[name][0], fft_mesh=fft_mesh)
+
+
+def get_phelel_dataset(name: str) -> PhelelDataset:
+    """Return PhelelDataset of bundled test data."""
+    _, inwap_filename, tag, n_disps = systems[name]
+    inwap_per = read_inwap_yaml(test_dir / inwap_filename)
+    suffixes = ["perfect"] + [f"disp{i:03d}" for i in range(1, n_disps + 1)]
+    return PhelelDataset(
+        local_potentials=[
+            read_local_potential(
+                inwap_per, test_dir / f"LOCAL-POTENTIAL_{tag}_{s}.bin.xz"
+            )
+            for s in suffixes
+        ],
+        Dijs=[
+            read_PAW_Dij_qij(inwap_per, test_dir / f"PAW-STRENGTH_{tag}_{s}.bin")
+            for s in suffixes
+        ],
+        qijs=[
+            read_PAW_Dij_qij(inwap_per, test_dir / f"PAW-OVERLAP_{tag}_{s}.bin")
+            for s in suffixes
+        ],
+        lm_channels=inwap_per["lm_orbitals"],
+    )
@@ -0,0 +1,166 @@
+"""Synthetic input data of derivatives calculation for large supercells.
+
+Local potentials are sums of Gaussians centred at atoms of diamond supercells,
+and those of displaced supercells are obtained by moving the Gaussian of the
+displaced atom. Dij and qij are random Hermitian matrices of two s and two p
+channels per atom, and those of displaced supercells are perturbed randomly.
+The data are not physical but have the shapes and symmetry of real
+calculations, which is sufficient to measure computational costs.
+
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import numpy as np
+from numpy.typing import NDArray
+from phonopy.structure.atoms import PhonopyAtoms
+
+from phelel import Phelel
+from phelel.api_phelel import PhelelDataset
+
+# Diamond conventional unit cell.
+_a = 3.5736106820
+_positions = [
+    [0.00, 0.00, 0.00],
+    [0.50, 0.50, 0.00],
+    [0.50, 0.00, 0.50],
+    [0.00, 0.50, 0.50],
+    [0.25, 0.25, 0.25],
+    [0.75, 0.75, 0.25],
+    [0.75, 0.25, 0.75],
+    [0.25, 0.75, 0.75],
+]
+_lm_channels_per_atom = [
+    {"l": 0, "m": [0]},
+    {"l": 0, "m": [0]},
+    {"l": 1, "m": [-1, 0, 1]},
+    {"l": 1, "m": [-1, 0, 1]},
+]
+
+
+def get_synthetic_phelel(
+    dim: int = 1,
+    fft_mesh: Sequence[int] | None = None,
+    mesh_per_unitcell: int = 40,
+    ncdij: int = 1,
+    seed: int = 0,
+) -> tuple[Phelel, PhelelDataset]:
+    """Return Phelel instance and its synthetic input data.
+
+    Parameters
+    ----------
+    dim : int, optional
+        Diamond conventional unit cell is multiplied by dim x dim x dim to make
+        supercell. Default is 1.
+    fft_mesh : Sequence[int] or None, optional
+        FFT mesh of primitive cell used for dV/du. Default is None, which gives
+        [14, 14, 14].
+    mesh_per_unitcell : int, optional
+        Number of FFT grid points of local potential along each axis of
+        conventional unit cell. Default is 40, which is that of the bundled
+        C111 test data.
+    ncdij : int, optional
+        1, 2, or 4. Default is 1.
+    seed : int, optional
+        Seed of random numbers. Default is 0.
+
+    """
+    unitcell = PhonopyAtoms(
+        symbols=["C"] * len(_positions),
+        cell=np.eye(3) * _a,
+        scaled_positions=_positions,
+    )
+    phe = Phelel(
+        unitcell,
+        supercell_matrix=np.eye(3, dtype=int) * dim,
+        primitive_matrix="F",
+        fft_mesh=[14, 14, 14] if fft_mesh is None else fft_mesh,
+    )
+    phe.generate_displacements()
+    assert phe.supercells_with_displacements is not None
+
+    mesh = [mesh_per_unitcell * dim] * 3
+    rng = np.random.default_rng(seed)
+    per_pot = get_gaussian_potential(phe.supercell.scaled_positions, mesh)
+    loc_pots = [_to_ncdij(per_pot, ncdij)]
+    natom = len(phe.supercell)
+    lmdim = sum(len(c["m"]) for c in _lm_channels_per_atom)
+    per_Dij = _get_hermitian(rng, (ncdij, natom, lmdim, lmdim))
+    per_qij = _get_hermitian(rng, (ncdij, natom, lmdim, lmdim))
+    Dijs = [per_Dij]
+    qijs = [per_qij]
+    for disp in phe.dataset["first_atoms"]:
+        i = disp["number"]
+        pos = phe.supercell.scaled_positions[i]
+        disp_pos = pos + np.linalg.solve(phe.supercell.cell.T, disp["displacement"])
+        dV = get_gaussian_potential([disp_pos], mesh) - get_gaussian_potential(
+            [pos], mesh
+        )
+        loc_pots.append(_to_ncdij(per_pot + dV, ncdij))
+        Dijs.append(per_Dij + 1e-2 * _get_hermitian(rng, per_Dij.shape))
+        qijs.append(per_qij + 1e-2 * _get_hermitian(rng, per_qij.shape))
+
+    lm_channels = [
+        {
+            "atom_index": i + 1,
+            "num_l_channels": len(_lm_channels_per_atom),
+            "channels": _lm_channels_per_atom,
+        }
+        for i in range(natom)
+    ]
+    return phe, PhelelDataset(
+        local_potentials=loc_pots,
+        Dijs=Dijs,
+        qijs=qijs,
+        lm_channels=lm_channels,
+    )
+
+
+def get_gaussian_potential(
+    scaled_positions: Sequence | NDArray, mesh: Sequence[int], sigma: float = 0.05
+) -> NDArray:
+    """Return periodic sum of Gaussians at positions on mesh.
+
+    Gaussians are computed in reciprocal space and the structure factor is
+    made of separable phase factors along the three axes.
+
+    Returns
+    -------
+    ndarray
+        Potential in supercell.
+        shape=(nz, ny, nx), dtype='complex128'
+
+    """
+    nx, ny, nz = mesh
+    gx, gy, gz = [np.fft.fftfreq(n, d=1.0 / n) for n in (nx, ny, nz)]
+    form = np.exp(
+        -2
+        * (np.pi * sigma) ** 2
+        * (gz[:, None, None] ** 2 + gy[None, :, None] ** 2 + gx[None, None, :] ** 2)
+    )
+    structure = np.zeros((nz, ny, nx), dtype="complex128")
+    for x, y, z in scaled_positions:
+        structure += (
+            np.exp(-2j * np.pi * gz * z)[:, None, None]
+            * np.exp(-2j * np.pi * gy * y)[None, :, None]
+            * np.exp(-2j * np.pi * gx * x)[None, None, :]
+        )
+    return np.fft.ifftn(-form * structure) * (nx * ny * nz)
+
+
+def _to_ncdij(pot: NDArray, ncdij: int) -> NDArray:
+    """Return local potential of shape=(ncdij, nz, ny, nx)."""
+    pots = np.zeros((ncdij,) + pot.shape, dtype="complex128")
+    if ncdij == 4:
+        pots[0] = pot
+        pots[3] = pot
+    else:
+        pots[:] = pot
+    return pots
+
+
+def _get_hermitian(rng: np.random.Generator, shape: tuple) -> NDArray:
+    a = rng.standard_normal(shape) + 1j * rng.standard_normal(shape)
+    return (a + np.swapaxes(a, -1, -2).conj()) / 2
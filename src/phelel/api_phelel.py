@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 import os
-from collections.abc import Sequence
+from collections.abc import Iterable, Sequence
 from dataclasses import dataclass
 from typing import Literal, cast
 
@@ -22,8 +22,9 @@ from phonopy.structure.symmetry import Symmetry
 from phelel import __version__
 from phelel.base.Dij_qij import DDijQij
 from phelel.base.local_potential import DLocalPotential
-from phelel.file_IO import write_phelel_params_hdf5
+from phelel.file_IO import DerivativesCheckpoint, write_phelel_params_hdf5
 from phelel.interface.phelel_yaml import PhelelYaml
+from phelel.utils.profiler import Profiler, profiling_stage
 
 
 @dataclass
@@ -40,6 +41,39 @@ class PhelelDataset:
     forces: NDArray | None = None
 
 
+@dataclass
+class PhelelDisplacedAtomData:
+    """Data of supercells with displacements of one atom."""
+
+    displacements: list[dict]
+    local_potentials: list[NDArray]
+    Dijs: list[NDArray]
+    qijs: list[NDArray]
+    kinetic_potentials: list[NDArray] | None = None
+
+
+@dataclass
+class PhelelStreamDataset:
+    """Data structure of input data to run derivatives atom by atom.
+
+    Data of perfect supercell are held, and data of displaced supercells are
+    given by ``displaced_atoms`` grouped by displaced atom, e.g., from a
+    generator that reads files lazily. Then only data of one displaced atom
+    are in memory at a time.
+
+    """
+
+    local_potential: NDArray
+    Dij: NDArray
+    qij: NDArray
+    lm_channels: list[dict]
+    displaced_atoms: Iterable[PhelelDisplacedAtomData]
+    kinetic_potential: NDArray | None = None
+    dataset: dict | None = None
+    phonon_dataset: dict | None = None
+    forces: NDArray | None = None
+
+
 class Phelel:
     """Phelel class.
 
@@ -90,6 +124,9 @@ class Phelel:
         calculator: str | None = None,
         nufft: str | None = None,
         finufft_eps: float | None = None,
+        precision: Literal["double", "single"] = "double",
+        dDijdu_cutoff_radius: float | None = None,
+        profiler: Profiler | None = None,
         log_level: int = 0,
     ):
         """Init method.
@@ -127,10 +164,25 @@ class Phelel:
         calculator :
             A dummy parameter.
         nufft : str or None, optional
-            'finufft' only. Default is None, which corresponds to 'finufft'.
+            'finufft' only. Default is None, which corresponds to 'finufft'
+            except that dV is gathered without interpolation when grid points
+            are commensurate with FFT mesh of dV. See
+            LocalPotentialInterpolationNUFFT.
         finufft_eps : float or None, optional
             Accuracy of finufft interpolation. Default is None, which
             corresponds to 1e-6.
+        precision : str, optional
+            "double" or "single". Precision of dV/du and dmu/du calculations
+            and their storage. Default is "double".
+        dDijdu_cutoff_radius : float or None, optional
+            When given, dDij/du and dqij/du are computed and stored only at
+            atoms within this distance (in the unit of lattice) from the atoms
+            in derivatives, and considered zero at the other atoms. Default is
+            None.
+        profiler : Profiler or None, optional
+            When given, wall time, CPU time, and memory usage of stages of
+            derivatives calculations and writing phelel_params.hdf5 are
+            recorded. Default is None.
         log_level : int, optional
             Log level. 0 is most quiet. Default is 0.
 
@@ -141,6 +193,8 @@ class Phelel:
         self._calculator = calculator
         self._nufft = nufft
         self._finufft_eps = finufft_eps
+        self._precision = precision
+        self._profiler = profiler
         self._log_level = log_level
 
         self._phelel_phonon = self._get_phonopy(supercell_matrix, primitive_matrix)
@@ -167,6 +221,8 @@ class Phelel:
             self._phelel_phonon.supercell,
             symmetry=self._phelel_phonon.symmetry,
             atom_indices=self._atom_indices_in_derivatives,
+            cutoff_radius=dDijdu_cutoff_radius,
+            profiler=self._profiler,
             verbose=self._log_level > 0,
         )
 
@@ -366,6 +422,11 @@ class Phelel:
     def fft_mesh(self, fft_mesh: ArrayLike):
         self._fft_mesh = np.array(fft_mesh, dtype="int64")
 
+    @property
+    def profiler(self) -> Profiler | None:
+        """Return profiler."""
+        return self._profiler
+
     @property
     def dVdu(self) -> DLocalPotential | None:
         """Return DLocalPotential class instance."""
@@ -428,10 +489,22 @@ class Phelel:
         distance: float | None = 0.01,
         is_plusminus: Literal["auto"] | bool = "auto",
         is_diagonal: bool = True,
+        number_of_snapshots: int | None = None,
+        random_seed: int | None = None,
     ):
-        """Generate displacement dataset."""
+        """Generate displacement dataset.
+
+        With number_of_snapshots, all atoms in each supercell are displaced by
+        distance in random directions, and derivatives are fitted to those
+        snapshots by least squares in ``run_derivatives``.
+
+        """
         self._phelel_phonon.generate_displacements(
-            distance=distance, is_plusminus=is_plusminus, is_diagonal=is_diagonal
+            distance=distance,
+            is_plusminus=is_plusminus,
+            is_diagonal=is_diagonal,
+            number_of_snapshots=number_of_snapshots,
+            random_seed=random_seed,
         )
 
     def generate_phonon_displacements(
@@ -448,7 +521,14 @@ class Phelel:
             distance=distance, is_plusminus=is_plusminus, is_diagonal=is_diagonal
         )
 
-    def run_derivatives(self, phe_input: PhelelDataset):
+    def run_derivatives(
+        self,
+        phe_input: PhelelDataset | PhelelStreamDataset,
+        n_workers: int | None = None,
+        memmap_dir: str | os.PathLike | None = None,
+        fft_workers: int | None = None,
+        checkpoint: str | os.PathLike | None = None,
+    ):
         """Run displacement derivatives calculations from temporary raw data.
 
         Note
@@ -456,6 +536,38 @@ class Phelel:
         After calculation, temporary raw data may be deleted.
         Force constants are created to have full matrix shape.
 
+        Parameters
+        ----------
+        phe_input : PhelelDataset or PhelelStreamDataset
+            Local potentials, PAW strengths and overlaps of perfect and
+            displaced supercells. With PhelelStreamDataset, derivatives are
+            computed displaced atom by displaced atom, and only data of one
+            displaced atom are held at a time. When the displacement dataset
+            is that of snapshots in which all atoms are displaced (type-2
+            dataset of phonopy with "displacements"), derivatives are fitted to
+            all the snapshots by least squares. This requires PhelelDataset.
+        n_workers : int or None, optional
+            Number of worker processes used to compute dV/du of independent
+            displaced atoms in parallel. This is not used with
+            PhelelStreamDataset or snapshots. Default is None, i.e., serial
+            calculation.
+        memmap_dir : str or os.PathLike or None, optional
+            When given, dV/du is stored in np.memmap file "dVdu.dat" in this
+            directory instead of in RAM. With meta-GGA kinetic potentials,
+            dV/du and dmu/du are computed together and stored in
+            "dVdu_dmudu.dat" when they have the same number of components.
+            Otherwise, dmu/du is computed separately and stored in
+            "dmudu.dat". Default is None.
+        fft_workers : int or None, optional
+            Number of threads of inverse FFT of dV and dmu by scipy.fft.
+            Default is None, i.e., numpy.fft is used.
+        checkpoint : str or os.PathLike or None, optional
+            Checkpoint file name. When given, derivatives of each displaced
+            atom are written to this HDF5 file as soon as they are computed.
+            When the calculation is run again with the same file, e.g., after
+            the process was killed, displaced atoms whose derivatives are in
+            the file are skipped. See DerivativesCheckpoint. Default is None.
+
         """
         if self._fft_mesh is None:
             msg = (
@@ -464,69 +576,33 @@ class Phelel:
             )
             raise RuntimeError(msg)
 
-        if phe_input.dataset is not None:
-            self._phelel_phonon.dataset = phe_input.dataset
-
-        if phe_input.phonon_dataset is not None:
-            self._prepare_phonon(
-                dataset=phe_input.phonon_dataset,
-                forces=phe_input.forces,
-                calculate_full_force_constants=True,
+        with profiling_stage(self._profiler, "run_derivatives"):
+            self._run_derivatives(
+                phe_input, n_workers, memmap_dir, fft_workers, checkpoint
             )
-        else:
-            self._prepare_phonon(
-                dataset=self._phelel_phonon.dataset,
-                forces=phe_input.forces,
-                calculate_full_force_constants=True,
-            )
-        assert self._phelel_phonon.dataset is not None
-
-        self._dVdu = DLocalPotential(
-            self._fft_mesh,
-            self._p2s_matrix,
-            self._phelel_phonon.supercell,
-            symmetry=self.symmetry,
-            atom_indices=self.atom_indices_in_derivatives,
-            nufft=self._nufft,
-            finufft_eps=self._finufft_eps,
-            verbose=self._log_level > 0,
-        )
-        loc_pots = phe_input.local_potentials
-        self._dVdu.run(
-            loc_pots[0], loc_pots[1:], self._phelel_phonon.dataset["first_atoms"]
-        )
 
-        if phe_input.kinetic_potentials is not None:
-            kin_pots = phe_input.kinetic_potentials
-            self._dmudu = DLocalPotential(
-                self._fft_mesh,
-                self._p2s_matrix,
-                self._phelel_phonon.supercell,
-                symmetry=self.symmetry,
-                atom_indices=self.atom_indices_in_derivatives,
-                nufft=self._nufft,
-                finufft_eps=self._finufft_eps,
-                verbose=self._log_level > 0,
-            )
-            self._dmudu.run(
-                kin_pots[0],
-                kin_pots[1:],
-                self._phelel_phonon.dataset["first_atoms"],
-            )
+    def save_hdf5(
+        self,
+        filename: str | os.PathLike = "phelel_params.hdf5",
+        reduce_by_symmetry: bool = False,
+        compression: Literal["gzip", "lzf", "blosc"] | int | None = None,
+    ):
+        """Write phelel_params.hdf5.
 
-        Dijs = phe_input.Dijs
-        qijs = phe_input.qijs
-        self._dDijdu.run(
-            Dijs[0],
-            Dijs[1:],
-            qijs[0],
-            qijs[1:],
-            self._phelel_phonon.dataset["first_atoms"],
-            phe_input.lm_channels,
-        )
+        Parameters
+        ----------
+        filename : str or os.PathLike, optional
+            File name. Default is "phelel_params.hdf5".
+        reduce_by_symmetry : bool, optional
+            Write dV/du and dmu/du only of symmetrically irreducible atoms.
+            Those of the other atoms are reconstructed by symmetry when read.
+            Default is False.
+        compression : str, int, or None, optional
+            "gzip", "lzf", "blosc", or gzip compression level. When given,
+            derivatives are written in chunks of (atom, direction) slices with
+            the compression. "blosc" requires hdf5plugin. Default is None.
 
-    def save_hdf5(self, filename: str | os.PathLike = "phelel_params.hdf5"):
-        """Write phelel_params.hdf5."""
+        """
         params = {
             "dVdu": self.dVdu,
             "dmudu": self.dmudu,
@@ -542,6 +618,8 @@ class Phelel:
             "force_constants": self.force_constants,
             "symmetry_dataset": self.primitive_symmetry.dataset,
             "filename": filename,
+            "reduce_by_symmetry": reduce_by_symmetry,
+            "compression": compression,
         }
         if self._phonon is not None:
             params.update(
@@ -551,7 +629,8 @@ class Phelel:
                     "phonon_supercell": self.phonon_supercell,
                 }
             )
-        write_phelel_params_hdf5(**params)
+        with profiling_stage(self._profiler, "write_hdf5"):
+            write_phelel_params_hdf5(**params)
 
     def save_phonon(
         self,
@@ -591,6 +670,195 @@ class Phelel:
                 phe_yaml.phonon_supercell = self.phonon_supercell
         return phe_yaml
 
+    def _get_DLocalPotential(
+        self,
+        n_workers: int | None,
+        memmap_filename: str | os.PathLike | None,
+        fft_workers: int | None,
+        n_fields: int = 1,
+    ) -> DLocalPotential:
+        assert self._fft_mesh is not None
+        return DLocalPotential(
+            self._fft_mesh,
+            self._p2s_matrix,
+            self._phelel_phonon.supercell,
+            symmetry=self.symmetry,
+            atom_indices=self.atom_indices_in_derivatives,
+            nufft=self._nufft,
+            finufft_eps=self._finufft_eps,
+            n_workers=n_workers,
+            memmap_filename=memmap_filename,
+            precision=self._precision,
+            fft_workers=fft_workers,
+            n_fields=n_fields,
+            profiler=self._profiler,
+            verbose=self._log_level > 0,
+        )
+
+    def _run_derivatives(
+        self,
+        phe_input: PhelelDataset | PhelelStreamDataset,
+        n_workers: int | None,
+        memmap_dir: str | os.PathLike | None,
+        fft_workers: int | None,
+        checkpoint: str | os.PathLike | None,
+    ):
+        if phe_input.dataset is not None:
+            self._phelel_phonon.dataset = phe_input.dataset
+
+        with profiling_stage(self._profiler, "force_constants"):
+            if phe_input.phonon_dataset is not None:
+                self._prepare_phonon(
+                    dataset=phe_input.phonon_dataset,
+                    forces=phe_input.forces,
+                    calculate_full_force_constants=True,
+                )
+            else:
+                self._prepare_phonon(
+                    dataset=self._phelel_phonon.dataset,
+                    forces=phe_input.forces,
+                    calculate_full_force_constants=True,
+                )
+        assert self._phelel_phonon.dataset is not None
+
+        if isinstance(phe_input, PhelelStreamDataset):
+            loc_pot = phe_input.local_potential
+            kin_pot = phe_input.kinetic_potential
+        else:
+            loc_pot = phe_input.local_potentials[0]
+            kin_pot = (
+                None
+                if phe_input.kinetic_potentials is None
+                else phe_input.kinetic_potentials[0]
+            )
+        # dV/du and dmu/du are computed together as two fields when they have
+        # the same number of components. Otherwise, they are computed separately.
+        if kin_pot is None:
+            field_sets = {"dVdu": (0,)}
+        elif len(kin_pot) == len(loc_pot):
+            field_sets = {"dVdu_dmudu": (0, 1)}
+        else:
+            field_sets = {"dVdu": (0,), "dmudu": (1,)}
+        dlps = {
+            name: self._get_DLocalPotential(
+                n_workers,
+                _get_memmap_filename(memmap_dir, f"{name}.dat"),
+                fft_workers,
+                n_fields=len(fields),
+            )
+            for name, fields in field_sets.items()
+        }
+        if checkpoint is None:
+            _checkpoint = None
+        else:
+            _checkpoint = DerivativesCheckpoint(
+                checkpoint,
+                dataset=self._phelel_phonon.dataset,
+                fft_mesh=self._fft_mesh,
+                lattice=self._phelel_phonon.supercell.cell.T,
+            )
+        is_snapshots = "displacements" in self._phelel_phonon.dataset
+        if isinstance(phe_input, PhelelStreamDataset):
+            if is_snapshots:
+                raise RuntimeError(
+                    "Derivatives of snapshots can not be computed by displaced atom."
+                )
+            self._run_derivatives_by_displaced_atom(
+                phe_input, dlps, field_sets, _checkpoint
+            )
+        else:
+            loc_pots = phe_input.local_potentials
+            if phe_input.kinetic_potentials is None:
+                kin_pots: Sequence[NDArray | None] = [None] * len(loc_pots)
+            else:
+                kin_pots = phe_input.kinetic_potentials
+            if is_snapshots:
+                displacements = self._phelel_phonon.dataset["displacements"]
+            else:
+                displacements = self._phelel_phonon.dataset["first_atoms"]
+            for name, dlp in dlps.items():
+                V_locs = [
+                    _get_fields(pots, field_sets[name])
+                    for pots in zip(loc_pots, kin_pots, strict=True)
+                ]
+                run_dlp = dlp.run_snapshots if is_snapshots else dlp.run
+                with profiling_stage(self._profiler, name):
+                    run_dlp(
+                        V_locs[0],
+                        V_locs[1:],
+                        displacements,
+                        checkpoint=_checkpoint,
+                        checkpoint_name=name,
+                    )
+
+            Dijs = phe_input.Dijs
+            qijs = phe_input.qijs
+            if is_snapshots:
+                run_dDijdu = self._dDijdu.run_snapshots
+            else:
+                run_dDijdu = self._dDijdu.run
+            with profiling_stage(self._profiler, "dDijdu"):
+                run_dDijdu(
+                    Dijs[0],
+                    Dijs[1:],
+                    qijs[0],
+                    qijs[1:],
+                    displacements,
+                    phe_input.lm_channels,
+                    checkpoint=_checkpoint,
+                )
+
+        if "dVdu_dmudu" in dlps:
+            self._dVdu, self._dmudu = dlps["dVdu_dmudu"].get_fields()
+        else:
+            self._dVdu = dlps["dVdu"]
+            self._dmudu = dlps.get("dmudu")
+
+    def _run_derivatives_by_displaced_atom(
+        self,
+        phe_input: PhelelStreamDataset,
+        dlps: dict[str, DLocalPotential],
+        field_sets: dict[str, tuple[int, ...]],
+        checkpoint: DerivativesCheckpoint | None,
+    ):
+        """Run derivatives calculations consuming data of one atom at a time."""
+        for data in phe_input.displaced_atoms:
+            if phe_input.kinetic_potential is None:
+                kin_pots: Sequence[NDArray | None] = [None] * len(data.local_potentials)
+            elif data.kinetic_potentials is None:
+                raise RuntimeError(
+                    "Kinetic potentials of displaced supercells are missing."
+                )
+            else:
+                kin_pots = data.kinetic_potentials
+            for name, dlp in dlps.items():
+                fields = field_sets[name]
+                V_loc_disps = [
+                    _get_fields(pots, fields)
+                    for pots in zip(data.local_potentials, kin_pots, strict=True)
+                ]
+                with profiling_stage(self._profiler, name):
+                    dlp.run_displaced_atom(
+                        _get_fields(
+                            (phe_input.local_potential, phe_input.kinetic_potential),
+                            fields,
+                        ),
+                        V_loc_disps,
+                        data.displacements,
+                        checkpoint=checkpoint,
+                        checkpoint_name=name,
+                    )
+            with profiling_stage(self._profiler, "dDijdu"):
+                self._dDijdu.run_displaced_atom(
+                    phe_input.Dij,
+                    data.Dijs,
+                    phe_input.qij,
+                    data.qijs,
+                    data.displacements,
+                    phe_input.lm_channels,
+                    checkpoint=checkpoint,
+                )
+
     def _prepare_phonon(
         self,
         dataset: dict | None = None,
@@ -639,3 +907,21 @@ class Phelel:
             calculator=self._calculator,
             log_level=self._log_level,
         )
+
+
+def _get_fields(
+    potentials: Sequence[NDArray | None], fields: tuple[int, ...]
+) -> NDArray | list[NDArray]:
+    """Return potential of a field or list of potentials of fields."""
+    if len(fields) == 1:
+        return cast(NDArray, potentials[fields[0]])
+    return [cast(NDArray, potentials[i]) for i in fields]
+
+
+def _get_memmap_filename(
+    memmap_dir: str | os.PathLike | None, filename: str
+) -> str | None:
+    """Return path of np.memmap file in memmap_dir or None."""
+    if memmap_dir is None:
+        return None
+    return os.path.join(memmap_dir, filename)
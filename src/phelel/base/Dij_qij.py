@@ -2,7 +2,9 @@
 
 from __future__ import annotations
 
+import itertools
 from collections.abc import Sequence
+from typing import TYPE_CHECKING
 
 import numpy as np
 from numpy.typing import NDArray
@@ -13,9 +15,16 @@ from phonopy.structure.symmetry import Symmetry
 from phelel.base.local_potential import (
     collect_site_symmetry_operations,
     get_displacements_with_rotations,
+    get_snapshot_displacements_pinv,
+    get_snapshot_displacements_with_rotations,
     rotate_delta_vals_in_spin_space,
 )
-from phelel.utils.spherical_harmonics import LxLyLzMatrices, SHRotationMatrices
+from phelel.utils.data import LazyComplexArray
+from phelel.utils.profiler import Profiler, profiling_stage
+from phelel.utils.rotations import get_symmetry_rotation_table
+
+if TYPE_CHECKING:
+    from phelel.file_IO import DerivativesCheckpoint
 
 
 class DeltaDijQij:
@@ -85,6 +94,10 @@ class DeltaDijQij:
             keys :
                 'displacement': Displacement in Cartesian coordinates
                 'number': Index of displaced atom
+            or displacements of all atoms of a snapshot
+            keys :
+                'displacements': Displacements in Cartesian coordinates
+                                 shape=(natom, 3)
         lm_channels : list of dicts
             lm channels in Dij and qij of atoms
             keys of each distionary:
@@ -98,6 +111,117 @@ class DeltaDijQij:
         self.lm_channels = lm_channels
 
 
+class DDijQijNeighborArray:
+    """dDij/du or dqij/du stored only at neighbor atoms of atoms.
+
+    Values of atom i in atom_indices are stored for the atoms neighbors[i],
+    which are usually those within a cutoff radius, and are considered zero at
+    the other atoms. Rows of neighbors are padded by -1 to the same length,
+    and values at the padding are zero. This layout keeps the axes of the
+    dense array except that supercell atoms are replaced by neighbors, so
+    values are sliced by atom_indices as the dense array is.
+
+    Selected atoms are expanded to the dense array by indexing, e.g.,
+    ``dDijdu[:, i_atom]``, and the full dense array by ``np.asarray``.
+
+    """
+
+    def __init__(self, values, neighbors: NDArray, natom: int):
+        """Init method.
+
+        Parameters
+        ----------
+        values : ndarray or LazyComplexArray
+            Values at neighbor atoms.
+            shape=(ncdij, atom_indices, 3, n_neighbors, lm, lm')
+        neighbors : ndarray
+            Neighbor atoms of atom_indices padded by -1.
+            shape=(atom_indices, n_neighbors), dtype='int64'
+        natom : int
+            Number of atoms in supercell.
+
+        """
+        if values.shape[1] != neighbors.shape[0] or (
+            values.shape[3] != neighbors.shape[1]
+        ):
+            raise ValueError(
+                "Shapes of values and neighbors disagree, %s and %s."
+                % (values.shape, neighbors.shape)
+            )
+        self._values = values
+        self._neighbors = np.array(neighbors, dtype="int64")
+        self._natom = natom
+
+    @property
+    def values(self):
+        """Return values at neighbor atoms."""
+        return self._values
+
+    @property
+    def neighbors(self) -> NDArray:
+        """Return neighbor atoms of atom_indices padded by -1."""
+        return self._neighbors
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        """Return shape of dense array."""
+        shape = self._values.shape
+        return tuple(shape[:3]) + (self._natom,) + tuple(shape[4:])
+
+    @property
+    def ndim(self) -> int:
+        """Return number of dimensions."""
+        return 6
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Return dtype."""
+        return self._values.dtype
+
+    def __len__(self) -> int:
+        """Return length of the first axis."""
+        return self.shape[0]
+
+    def get_atom(self, i: int) -> NDArray:
+        """Return dense array of i-th atom in atom_indices.
+
+        Returns
+        -------
+        ndarray
+            shape=(ncdij, 3, supercell_atoms, lm, lm')
+
+        """
+        values = np.asarray(self._values[:, i])
+        neighbors = self._neighbors[i]
+        valid = neighbors >= 0
+        shape = values.shape[:2] + (self._natom,) + values.shape[3:]
+        dense = np.zeros(shape, dtype=values.dtype)
+        dense[:, :, neighbors[valid]] = values[:, :, valid]
+        return dense
+
+    def __getitem__(self, key) -> NDArray:
+        """Expand selected atoms to dense array and return selected part."""
+        if key is Ellipsis:
+            key = ()
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            raise IndexError("Ellipsis is supported only alone.")
+        key = key + (slice(None),) * (self.ndim - len(key))
+        atoms = np.arange(self.shape[1])[key[1]]
+        if atoms.ndim == 0:
+            return self.get_atom(int(atoms))[(key[0],) + key[2:]]
+        values = np.stack([self.get_atom(i) for i in atoms], axis=1)
+        return values[(key[0], slice(None)) + key[2:]]
+
+    def __array__(self, dtype=None, copy=None) -> NDArray:
+        """Expand to dense array and return it."""
+        values = self[...]
+        if dtype is None:
+            return values
+        return values.astype(dtype)
+
+
 class DDijQijFit:
     """Compute dDij/du and dqij/du for one atom.
 
@@ -108,12 +232,14 @@ class DDijQijFit:
     Attributes
     ----------
     dDijdu : ndarray
-        Derivative of Dij with respect to displacement of an atom
+        Derivative of Dij with respect to displacement of an atom. With
+        neighbors, supercell_atoms is replaced by n_neighbors as values of
+        DDijQijNeighborArray.
         dtype=complex128
         shape=(ncdij, atom_indices, 3, supercell_atoms, lm, lm')
     dqijdu : ndarray
         Derivative of qij (<phi_i|phi_j>-<phi_i~|phi_j~>) with respect to
-        displacement of an atom
+        displacement of an atom. The shape is the same as that of dDijdu.
         dtype=complex128
         shape=(ncdij, atom_indices, 3, supercell_atoms, lm, lm')
     atom_indices : list of int
@@ -128,6 +254,8 @@ class DDijQijFit:
         supercell: PhonopyAtoms,
         symmetry: Symmetry,
         atom_indices: Sequence[int] | NDArray | None = None,
+        neighbors: NDArray | None = None,
+        profiler: Profiler | None = None,
         verbose: bool = True,
     ):
         """Init method.
@@ -153,6 +281,14 @@ class DDijQijFit:
             computed. If None, supposed to be all atoms. Internally only
             symmetrically equivalent atoms to the dispalced atom are selected to
             compute.
+        neighbors : ndarray or None, optional
+            Neighbor atoms of atom_indices (all atoms if atom_indices is None)
+            padded by -1, see get_neighbor_atoms. When given, dDij and dqij are
+            computed only at the neighbor atoms. Default is None.
+            shape=(atom_indices, n_neighbors), dtype='int64'
+        profiler : Profiler or None, optional
+            When given, costs of stages of calculation at each atom are
+            recorded. Default is None.
         verbose : bool
             To display log or not
 
@@ -161,17 +297,24 @@ class DDijQijFit:
         self._delta_Dij_qijs = delta_Dij_qijs
         self._supercell = supercell
         self._symmetry = symmetry
+        self._profiler = profiler
         self._verbose = verbose
         self._atom_indices_in = atom_indices
+        self._neighbors_in = neighbors
 
         self._dDijdu: NDArray | None = None
         self._dqijdu: NDArray | None = None
         self._atom_indices: NDArray | None = None
+        self._neighbors: NDArray | None = None
 
         # See comments in LocalPotentialInterpolation for these variables
         self._i_atom: int | None = None
         self._sitesym_sets: NDArray | None = None
 
+        # Orbital rotation matrices of all atoms with respect to index of
+        # symmetry operation.
+        self._big_Deltas: dict[int, NDArray] = {}
+
         self._setup()
 
     @property
@@ -206,7 +349,10 @@ class DDijQijFit:
                 % (self._atom_indices[self._i_atom] + 1)
             )
 
-        self._run_at_atom()
+        with profiling_stage(
+            self._profiler, "atom", atom=self._atom_indices[self._i_atom]
+        ):
+            self._run_at_atom()
         self._i_atom += 1
 
     def run(self):
@@ -218,10 +364,16 @@ class DDijQijFit:
         """Return Dij and qij in str fashion."""
         assert self._dDijdu is not None
         assert self._dqijdu is not None
+        dDijdu = self._dDijdu
+        dqijdu = self._dqijdu
+        if self._neighbors is not None:
+            natom = len(self._supercell)
+            dDijdu = np.asarray(DDijQijNeighborArray(dDijdu, self._neighbors, natom))
+            dqijdu = np.asarray(DDijQijNeighborArray(dqijdu, self._neighbors, natom))
         text = ""
-        Dij_shape = self._dDijdu.shape[-2:]
+        Dij_shape = dDijdu.shape[-2:]
         for i_spinor, (Dij_spinor, qij_spinor) in enumerate(
-            zip(self._dDijdu, self._dqijdu, strict=True)
+            zip(dDijdu, dqijdu, strict=True)
         ):
             for i_eatom, (Dij_eatom, qij_eatom) in enumerate(
                 zip(Dij_spinor, qij_spinor, strict=True)
@@ -281,25 +433,28 @@ class DDijQijFit:
             atoms = np.arange(len(self._supercell))
         else:
             atoms = self._atom_indices_in
-        self._atom_indices = np.array(
-            [i for i in atoms if i in equiv_atoms], dtype="int64"
-        )
+        selected = [i for i, atom in enumerate(atoms) if atom in equiv_atoms]
+        self._atom_indices = np.array([atoms[i] for i in selected], dtype="int64")
         sitesym_selected_indices = [
             i for i, eq_atom in enumerate(equiv_atoms) if eq_atom in self._atom_indices
         ]
         self._sitesym_sets = sitesym_sets[sitesym_selected_indices]
 
         dtype = "c%d" % (np.dtype("double").itemsize * 2)
-        natom = len(self._supercell)
+        if self._neighbors_in is None:
+            n_cols = len(self._supercell)
+        else:
+            self._neighbors = np.array(self._neighbors_in[selected], dtype="int64")
+            n_cols = self._neighbors.shape[1]
         ncdij = self._delta_Dij_qijs[0].dDij.shape[0]
         lmdim = self._delta_Dij_qijs[0].dDij.shape[-2]
         self._dDijdu = np.zeros(
-            (ncdij, len(self._atom_indices), 3, natom, lmdim, lmdim),
+            (ncdij, len(self._atom_indices), 3, n_cols, lmdim, lmdim),
             dtype=dtype,
             order="C",
         )
         self._dqijdu = np.zeros(
-            (ncdij, len(self._atom_indices), 3, natom, lmdim, lmdim),
+            (ncdij, len(self._atom_indices), 3, n_cols, lmdim, lmdim),
             dtype=dtype,
             order="C",
         )
@@ -309,7 +464,13 @@ class DDijQijFit:
         assert self._dqijdu is not None
         assert self._sitesym_sets is not None
         sitesyms = self._sitesym_sets[self._i_atom]
-        natom = len(self._supercell)
+        if self._neighbors is None:
+            atoms = None
+            natom = len(self._supercell)
+        else:
+            neighbors = self._neighbors[self._i_atom]
+            atoms = neighbors[neighbors >= 0]
+            natom = len(atoms)
         lmdim = self._delta_Dij_qijs[0].dDij.shape[-2]
         dtype = f"c{np.dtype('double').itemsize * 2}"
         ncdij = self._dDijdu.shape[0]
@@ -317,17 +478,22 @@ class DDijQijFit:
         lattice = self._supercell.cell.T
         rotations = self._symmetry.symmetry_operations["rotations"][sitesyms]
         translations = self._symmetry.symmetry_operations["translations"][sitesyms]
-        atomic_permutations = compute_all_sg_permutations(
-            self._supercell.scaled_positions,
-            rotations,
-            translations,
-            np.array(lattice, dtype="double", order="C"),
-            self._symmetry.tolerance,
-            self._supercell.permutation_types,
-        )
+        with profiling_stage(self._profiler, "permutations"):
+            atomic_permutations = compute_all_sg_permutations(
+                self._supercell.scaled_positions,
+                rotations,
+                translations,
+                np.array(lattice, dtype="double", order="C"),
+                self._symmetry.tolerance,
+                self._supercell.permutation_types,
+            )
 
+        rot_table = get_symmetry_rotation_table(self._symmetry, lattice)
         disps = get_displacements_with_rotations(
-            rotations, lattice, self._delta_Dij_qijs
+            rotations,
+            lattice,
+            self._delta_Dij_qijs,
+            r_carts=rot_table.r_carts[sitesyms],
         )
         disps_inv = np.linalg.pinv(disps)
         dDij_rotated_all = np.zeros(
@@ -339,98 +505,271 @@ class DDijQijFit:
 
         count = 0
         for delta_Dij_qij in self._delta_Dij_qijs:
-            for r, perm in zip(rotations, atomic_permutations, strict=True):
-                dDij_rotated, dqij_rotated = self._rotate_Dij_qij(
-                    ncdij, delta_Dij_qij, perm, r
-                )
-                if ncdij == 4:  # Need to rotate in spin space, too.
-                    dDij_spinor_rotated = rotate_delta_vals_in_spin_space(
-                        dDij_rotated, r, lattice
-                    )
-                    dqij_spinor_rotated = rotate_delta_vals_in_spin_space(
-                        dqij_rotated, r, lattice
+            for i_op, r, perm in zip(
+                sitesyms, rotations, atomic_permutations, strict=True
+            ):
+                with profiling_stage(self._profiler, "rotation"):
+                    dDij_rotated, dqij_rotated = self._rotate_Dij_qij(
+                        delta_Dij_qij, perm, i_op, atoms=atoms
                     )
-                    dDij_rotated = dDij_spinor_rotated
-                    dqij_rotated = dqij_spinor_rotated
-                for i_cdij in range(ncdij):
-                    dDij_rotated_all[i_cdij, count] = dDij_rotated[i_cdij]
-                    dqij_rotated_all[i_cdij, count] = dqij_rotated[i_cdij]
+                if ncdij == 4:  # Need to rotate in spin space, too.
+                    Delta = rot_table.get_spinor_Delta(i_op)
+                    with profiling_stage(self._profiler, "spinor_rotation"):
+                        rotate_delta_vals_in_spin_space(
+                            dDij_rotated,
+                            r,
+                            lattice,
+                            Delta=Delta,
+                            out=dDij_rotated_all[:, count],
+                        )
+                        rotate_delta_vals_in_spin_space(
+                            dqij_rotated,
+                            r,
+                            lattice,
+                            Delta=Delta,
+                            out=dqij_rotated_all[:, count],
+                        )
+                else:
+                    dDij_rotated_all[:, count] = dDij_rotated
+                    dqij_rotated_all[:, count] = dqij_rotated
                 count += 1
 
         # Compute dDij/du and dqij/du
         # shape=(ncdij, len(self._atom_indices), 3, natom, lmdim, lmdim)
         shape = (ncdij, 3, natom, lmdim, lmdim)
-        self._dDijdu[:, self._i_atom] = (disps_inv @ dDij_rotated_all).reshape(shape)
-        self._dqijdu[:, self._i_atom] = (disps_inv @ dqij_rotated_all).reshape(shape)
+        with profiling_stage(self._profiler, "accumulation"):
+            self._dDijdu[:, self._i_atom, :, :natom] = (
+                disps_inv @ dDij_rotated_all
+            ).reshape(shape)
+            self._dqijdu[:, self._i_atom, :, :natom] = (
+                disps_inv @ dqij_rotated_all
+            ).reshape(shape)
 
     def _rotate_Dij_qij(
-        self, ncdij: int, delta_Dij_qij: DeltaDijQij, perm: NDArray, r: NDArray
-    ) -> tuple[list[NDArray], list[NDArray]]:
+        self,
+        delta_Dij_qij: DeltaDijQij,
+        perm: NDArray,
+        i_op: int,
+        atoms: NDArray | None = None,
+    ) -> tuple[NDArray, NDArray]:
         """Rotate Dij and qij.
 
         This rotation is the direct product of rotations of atomic permutation
         and atomic-like orbitals on atomic points. The displacements are rotated
         actively (R), and atomic permutation and atomic-like orbitals are
-        rotated passively (R^-1).
+        rotated passively (R^-1). Only the atoms are rotated when atoms are
+        given.
+
+        Returns
+        -------
+        tuple[ndarray, ndarray]
+            Rotated dDij and dqij.
+            shape=(ncdij, natom * lm * lm')
 
         """
-        rot_dDij = []
-        rot_dqij = []
-        for i_cdij in range(ncdij):
-            perm_inv = np.zeros_like(perm)
-            for j, k in enumerate(perm):
-                perm_inv[k] = j
-            _rot_dDij, _rot_dqij = self._get_inv_rotated_dDij_qij(
-                delta_Dij_qij, r, i_cdij
-            )
-            rot_dDij.append(_rot_dDij[perm_inv].ravel())
-            rot_dqij.append(_rot_dqij[perm_inv].ravel())
-        return rot_dDij, rot_dqij
+        perm_inv = np.argsort(perm)
+        if atoms is not None:
+            perm_inv = perm_inv[atoms]
+        rot_dDij, rot_dqij = self._get_inv_rotated_dDij_qij(
+            delta_Dij_qij, i_op, perm_inv
+        )
+        ncdij = len(rot_dDij)
+        return rot_dDij.reshape(ncdij, -1), rot_dqij.reshape(ncdij, -1)
 
     def _get_inv_rotated_dDij_qij(
-        self, delta_Dij_qij: DeltaDijQij, r, i_spinor
+        self, delta_Dij_qij: DeltaDijQij, i_op: int, atoms: NDArray
     ) -> tuple[NDArray, NDArray]:
-        """Inverse-rotate dDij and dqij."""
-        lattice = self._supercell.cell.T
-        shr = SHRotationMatrices(r, lattice, LxLyLzMatrices().run())
-        shr.run()
-
-        rot_dDij = np.zeros_like(delta_Dij_qij.dDij[0])
-        rot_dqij = np.zeros_like(delta_Dij_qij.dqij[0])
-
-        # loop over atoms
-        for i, (dDij, dqij, lm_channels) in enumerate(
-            zip(
-                delta_Dij_qij.dDij[i_spinor],
-                delta_Dij_qij.dqij[i_spinor],
-                delta_Dij_qij.lm_channels,
-                strict=True,
-            )
-        ):
-            bigDelta = self._get_big_Delta(shr.Delta, lm_channels, dDij)
-            rot_dDij[i] = bigDelta @ dDij @ bigDelta.T.conj()
-            rot_dqij[i] = bigDelta @ dqij @ bigDelta.T.conj()
+        """Inverse-rotate dDij and dqij of atoms and ncdij components.
 
+        B @ dDij @ B^H is computed for the atoms at once, where B is the orbital
+        rotation matrix of each atom.
+
+        Returns
+        -------
+        tuple[ndarray, ndarray]
+            shape=(ncdij, len(atoms), lm, lm')
+
+        """
+        bigDeltas = self._get_big_Deltas(i_op, delta_Dij_qij)[atoms]
+        bigDeltas_H = bigDeltas.transpose(0, 2, 1).conj()
+        rot_dDij = bigDeltas @ delta_Dij_qij.dDij[:, atoms] @ bigDeltas_H
+        rot_dqij = bigDeltas @ delta_Dij_qij.dqij[:, atoms] @ bigDeltas_H
         return rot_dDij, rot_dqij
 
-    def _get_big_Delta(self, Delta, lm_channels, dDij) -> NDArray:
-        """Return orbital rotation matrix.
+    def _get_big_Deltas(self, i_op: int, delta_Dij_qij: DeltaDijQij) -> NDArray:
+        """Return orbital rotation matrices of all atoms.
 
-        This matrix combines rotation matrices of different orbitals, and
-        is a unitary matrix.
+        Each matrix combines rotation matrices of different orbitals, and is a
+        unitary matrix. Matrices are cached for each symmetry operation, and
+        those of atoms with the same layout of lm channels are computed only
+        once.
+
+        Returns
+        -------
+        ndarray
+            shape=(natom, lm, lm')
 
         """
-        bigDelta = np.zeros_like(dDij)
+        if i_op in self._big_Deltas:
+            return self._big_Deltas[i_op]
+
+        rot_table = get_symmetry_rotation_table(self._symmetry, self._supercell.cell.T)
+        Delta = rot_table.get_sh_Delta(i_op)
+
+        lmdim = delta_Dij_qij.dDij.shape[-1]
+        bigDeltas = np.zeros(
+            (len(delta_Dij_qij.lm_channels), lmdim, lmdim),
+            dtype=delta_Dij_qij.dDij.dtype,
+        )
+        bigDelta_of_layout: dict[tuple | None, NDArray] = {}
+        for i, lm_channels in enumerate(delta_Dij_qij.lm_channels):
+            if lm_channels["channels"] is None:
+                continue
+            layout = tuple(ll["l"] for ll in lm_channels["channels"])
+            if layout not in bigDelta_of_layout:
+                bigDelta_of_layout[layout] = self._get_big_Delta(Delta, layout, lmdim)
+            bigDeltas[i] = bigDelta_of_layout[layout]
+
+        self._big_Deltas[i_op] = bigDeltas
+        return bigDeltas
+
+    def _get_big_Delta(
+        self, Delta: list[NDArray], layout: tuple[int, ...], lmdim: int
+    ) -> NDArray:
+        """Return orbital rotation matrix of l channels given by layout."""
+        bigDelta = np.zeros((lmdim, lmdim), dtype=Delta[0].dtype)
         row = 0
-        if lm_channels["channels"] is None:
-            return bigDelta
-        for ll in lm_channels["channels"]:
-            n = ll["l"] * 2 + 1
-            bigDelta[row : (row + n), row : (row + n)] = Delta[ll["l"]]
+        for ll in layout:
+            n = ll * 2 + 1
+            bigDelta[row : (row + n), row : (row + n)] = Delta[ll]
             row += n
         return bigDelta
 
 
+class DDijQijSnapshotFit(DDijQijFit):
+    """Compute dDij/du and dqij/du of all atoms from snapshots.
+
+    Each of delta_Dij_qijs is the change of Dij and qij of a supercell in which
+    all atoms are displaced, e.g., by random displacements. The snapshots are
+    rotated by all symmetry operations of supercell, and dDij/du and dqij/du of
+    atom_indices are given as the least-squares solution over all the rotated
+    snapshots at once. See LocalPotentialInterpolationNUFFT.run_snapshots.
+
+    """
+
+    def run(self):
+        """Calculate at all atom_indices."""
+        assert self._dDijdu is not None
+        assert self._dqijdu is not None
+        assert self._atom_indices is not None
+        ncdij, n_atoms, _, n_cols, lmdim, _ = self._dDijdu.shape
+        natom = len(self._supercell)
+        lattice = self._supercell.cell.T
+        rotations = self._symmetry.symmetry_operations["rotations"]
+        permutations = self._symmetry.atomic_permutations
+        rot_table = get_symmetry_rotation_table(self._symmetry, lattice)
+        disps = get_snapshot_displacements_with_rotations(
+            self._delta_Dij_qijs, permutations, rot_table.r_carts
+        )
+        disps_inv = get_snapshot_displacements_pinv(disps, self._atom_indices)
+
+        if self._verbose:
+            print(
+                "Computing dDij/du and dqij/du from %d snapshots:"
+                % len(self._delta_Dij_qijs)
+            )
+        dtype = self._dDijdu.dtype
+        n_block = max(1, self._max_block_size // (ncdij * natom * lmdim**2))
+        count = 0
+        for delta_Dij_qij in self._delta_Dij_qijs:
+            for i_op in range(0, len(rotations), n_block):
+                i_ops = range(i_op, min(i_op + n_block, len(rotations)))
+                dDij_rotated = np.zeros(
+                    (ncdij, len(i_ops), natom * lmdim**2), dtype=dtype, order="C"
+                )
+                dqij_rotated = np.zeros_like(dDij_rotated)
+                for i, j_op in enumerate(i_ops):
+                    with profiling_stage(self._profiler, "rotation"):
+                        rot_dDij, rot_dqij = self._rotate_Dij_qij(
+                            delta_Dij_qij, permutations[j_op], j_op
+                        )
+                    if ncdij == 4:  # Need to rotate in spin space, too.
+                        Delta = rot_table.get_spinor_Delta(j_op)
+                        with profiling_stage(self._profiler, "spinor_rotation"):
+                            for rot, out in (
+                                (rot_dDij, dDij_rotated),
+                                (rot_dqij, dqij_rotated),
+                            ):
+                                rotate_delta_vals_in_spin_space(
+                                    rot,
+                                    rotations[j_op],
+                                    lattice,
+                                    Delta=Delta,
+                                    out=out[:, i],
+                                )
+                    else:
+                        dDij_rotated[:, i] = rot_dDij
+                        dqij_rotated[:, i] = rot_dqij
+                block_inv = disps_inv[:, count : (count + len(i_ops))]
+                with profiling_stage(self._profiler, "accumulation"):
+                    self._accumulate(self._dDijdu, block_inv, dDij_rotated)
+                    self._accumulate(self._dqijdu, block_inv, dqij_rotated)
+                count += len(i_ops)
+
+        if self._neighbors is not None:
+            # Padded neighbors gathered values of the last atom.
+            rows, cols = np.nonzero(self._neighbors < 0)
+            self._dDijdu[:, rows, :, cols] = 0
+            self._dqijdu[:, rows, :, cols] = 0
+        self._i_atom = n_atoms
+
+    def _setup(self):
+        self._i_atom = 0
+        # Upper bound of number of elements of rotated dDij of snapshots that
+        # are multiplied with pseudo-inverse of displacements at once.
+        self._max_block_size = 2**24
+        if self._atom_indices_in is None:
+            self._atom_indices = np.arange(len(self._supercell), dtype="int64")
+        else:
+            self._atom_indices = np.array(self._atom_indices_in, dtype="int64")
+
+        dtype = "c%d" % (np.dtype("double").itemsize * 2)
+        if self._neighbors_in is None:
+            n_cols = len(self._supercell)
+        else:
+            self._neighbors = np.array(self._neighbors_in, dtype="int64")
+            n_cols = self._neighbors.shape[1]
+        ncdij = self._delta_Dij_qijs[0].dDij.shape[0]
+        lmdim = self._delta_Dij_qijs[0].dDij.shape[-2]
+        shape = (ncdij, len(self._atom_indices), 3, n_cols, lmdim, lmdim)
+        self._dDijdu = np.zeros(shape, dtype=dtype, order="C")
+        self._dqijdu = np.zeros(shape, dtype=dtype, order="C")
+
+    def _accumulate(self, dXdu: NDArray, disps_inv: NDArray, dX_rotated: NDArray):
+        """Add disps_inv @ rotated dDij or dqij of a block to dXdu.
+
+        With neighbors, values at the neighbor atoms of each atom are added.
+
+        """
+        ncdij, n_atoms = dXdu.shape[:2]
+        n_ops = dX_rotated.shape[1]
+        if self._neighbors is None:
+            dXdu.reshape(ncdij, n_atoms * 3, -1)[:] += disps_inv @ dX_rotated
+        else:
+            natom = len(self._supercell)
+            neighbor_vals = dX_rotated.reshape(ncdij, n_ops, natom, -1)[
+                :, :, self._neighbors
+            ]
+            dXdu.reshape(ncdij, n_atoms, 3, self._neighbors.shape[1], -1)[:] += (
+                np.einsum(
+                    "aib,cbanl->cainl",
+                    disps_inv.reshape(n_atoms, 3, n_ops),
+                    neighbor_vals,
+                    optimize=True,
+                )
+            )
+
+
 class DDijQij:
     """Compute dDij/du and dqij/du.
 
@@ -443,12 +782,14 @@ class DDijQij:
     Attributes
     ----------
     dDijdu : ndarray
-        Derivative of Dij with respect to displacements
+        Derivative of Dij with respect to displacements. This is
+        DDijQijNeighborArray when cutoff_radius is given, and LazyComplexArray
+        when lazily read from phelel_params.hdf5.
         dtype=complex128
         shape=(ncdij, atom_indices, 3, supercell_atoms, lm, lm')
     dqijdu : ndarray
         Derivative of qij (<phi_i|phi_j>-<phi_i~|phi_j~>) with respect to
-        displacements
+        displacements. The type is the same as that of dDijdu.
         dtype=complex128
         shape=(ncdij, atom_indices, 3, supercell_atoms, lm, lm')
     lm_channels : list of dicts
@@ -472,6 +813,8 @@ class DDijQij:
         supercell: PhonopyAtoms,
         symmetry: Symmetry | None = None,
         atom_indices: Sequence[int] | NDArray | None = None,
+        cutoff_radius: float | None = None,
+        profiler: Profiler | None = None,
         verbose: bool = True,
     ):
         """Init method.
@@ -488,9 +831,18 @@ class DDijQij:
             computed. If None, supposed to be all atoms. Internally only
             symmetrically equivalent atoms to the dispalced atom are selected
             to compute.
+        cutoff_radius : float or None, optional
+            When given, dDij/du and dqij/du are computed and stored only at
+            atoms within this distance from atom_indices, and considered zero
+            at the other atoms. See DDijQijNeighborArray. Default is None.
+        profiler : Profiler or None, optional
+            When given, costs of stages of calculation by each displaced atom
+            are recorded. Default is None.
 
         """
         self._supercell = supercell
+        self._cutoff_radius = cutoff_radius
+        self._profiler = profiler
         self._verbose = verbose
 
         if atom_indices is None:
@@ -504,8 +856,12 @@ class DDijQij:
 
         self._Dij: NDArray | None = None
         self._qij: NDArray | None = None
-        self._dDijdu: NDArray | None = None
-        self._dqijdu: NDArray | None = None
+        self._dDijdu: NDArray | LazyComplexArray | DDijQijNeighborArray | None = None
+        self._dqijdu: NDArray | LazyComplexArray | DDijQijNeighborArray | None = None
+        self._neighbors: NDArray | None = None
+        # Flags of atoms whose dDij/du and dqij/du were restored from or
+        # written to checkpoint.
+        self._checkpoint_completed: NDArray | None = None
 
     @property
     def dDijdu(self):
@@ -516,14 +872,18 @@ class DDijQij:
     def dDijdu(self, dDijdu):
         natom = len(self._supercell)
         shape = (len(self._atom_indices), 3, natom)
-        if dDijdu.shape[1:4] == shape:
-            dtype = "c%d" % (np.dtype("double").itemsize * 2)
-            self._dDijdu = np.array(dDijdu, dtype=dtype, order="C")
-        else:
+        if dDijdu.shape[1:4] != shape:
             raise RuntimeError(
                 "Array shape[1:4] disagreement is found, %s!=%s."
                 % (shape, dDijdu.shape[1:4])
             )
+        if isinstance(dDijdu, DDijQijNeighborArray):
+            self._neighbors = dDijdu.neighbors
+        if isinstance(dDijdu, (LazyComplexArray, DDijQijNeighborArray)):
+            self._dDijdu = dDijdu
+        else:
+            dtype = "c%d" % (np.dtype("double").itemsize * 2)
+            self._dDijdu = np.array(dDijdu, dtype=dtype, order="C")
 
     @property
     def dqijdu(self):
@@ -534,14 +894,18 @@ class DDijQij:
     def dqijdu(self, dqijdu):
         natom = len(self._supercell)
         shape = (len(self._atom_indices), 3, natom)
-        if dqijdu.shape[1:4] == shape:
-            dtype = "c%d" % (np.dtype("double").itemsize * 2)
-            self._dqijdu = np.array(dqijdu, dtype=dtype, order="C")
-        else:
+        if dqijdu.shape[1:4] != shape:
             raise RuntimeError(
                 "Array shape[1:4] disagreement is found, %s!=%s."
                 % (shape, dqijdu.shape[1:4])
             )
+        if isinstance(dqijdu, DDijQijNeighborArray):
+            self._neighbors = dqijdu.neighbors
+        if isinstance(dqijdu, (LazyComplexArray, DDijQijNeighborArray)):
+            self._dqijdu = dqijdu
+        else:
+            dtype = "c%d" % (np.dtype("double").itemsize * 2)
+            self._dqijdu = np.array(dqijdu, dtype=dtype, order="C")
 
     @property
     def Dij(self):
@@ -580,7 +944,26 @@ class DDijQij:
         """Return atom indices where dDijdu and dqijdu are stored."""
         return self._atom_indices
 
-    def run(self, Dij_per, Dij_disps, qij_per, qij_disps, displacements, lm_channels):
+    @property
+    def cutoff_radius(self) -> float | None:
+        """Return cutoff radius of atoms where dDijdu and dqijdu are stored."""
+        return self._cutoff_radius
+
+    @property
+    def neighbors(self) -> NDArray | None:
+        """Return neighbor atoms of atom_indices padded by -1."""
+        return self._neighbors
+
+    def run(
+        self,
+        Dij_per,
+        Dij_disps,
+        qij_per,
+        qij_disps,
+        displacements,
+        lm_channels,
+        checkpoint: DerivativesCheckpoint | None = None,
+    ):
         """Compute dDij/du and dqij/du.
 
         Parameters
@@ -611,33 +994,91 @@ class DDijQij:
             keys of each distionary:
                 'channels' : List of l channels
                 'l', 'm' in each channel : l and list of m
+        checkpoint : DerivativesCheckpoint or None, optional
+            When given, dDij/du and dqij/du of atoms equivalent to each
+            displaced atom are written to the checkpoint file as "dDijdu" and
+            "dqijdu" as soon as they are computed, and displaced atoms whose
+            results are found in the checkpoint file are skipped. Default is
+            None.
 
         """
+        for disp_atom in np.unique([d["number"] for d in displacements]):
+            indices = [
+                i for i, d in enumerate(displacements) if d["number"] == disp_atom
+            ]
+            self.run_displaced_atom(
+                Dij_per,
+                [Dij_disps[i] for i in indices],
+                qij_per,
+                [qij_disps[i] for i in indices],
+                [displacements[i] for i in indices],
+                lm_channels,
+                checkpoint=checkpoint,
+            )
+
+    def run_displaced_atom(
+        self,
+        Dij_per,
+        Dij_disps,
+        qij_per,
+        qij_disps,
+        displacements,
+        lm_channels,
+        checkpoint: DerivativesCheckpoint | None = None,
+    ):
+        """Compute dDij/du and dqij/du of atoms equivalent to one displaced atom.
+
+        dDij/du and dqij/du are computed incrementally by calling this method
+        for each displaced atom. Parameters are those of ``run`` restricted to
+        the displacements of one atom.
+
+        """
+        disp_atoms = {d["number"] for d in displacements}
+        if len(disp_atoms) != 1:
+            raise ValueError("Displacements have to be those of one atom.")
+
         if self.dDijdu is None:
             self._allocate_arrays(Dij_per.shape[0], Dij_per.shape[2])
 
-        assert self._dDijdu is not None
-        assert self._dqijdu is not None
+        dDijdu, dqijdu = self._get_storages()
 
-        for disp_atom in np.unique([d["number"] for d in displacements]):
-            delta_Dij_qijs = []
-            for i, d in enumerate(displacements):
-                if d["number"] == disp_atom:
-                    delta_Dij_qijs.append(
-                        DeltaDijQij(
-                            Dij_per,
-                            Dij_disps[i],
-                            qij_per,
-                            qij_disps[i],
-                            displacements[i],
-                            lm_channels,
-                        )
+        self.Dij = Dij_per[:, self._atom_indices, :, :]
+        self.qij = qij_per[:, self._atom_indices, :, :]
+
+        if checkpoint is not None:
+            if self._checkpoint_completed is None:
+                self._checkpoint_completed = checkpoint.restore(
+                    "dDijdu", dDijdu, self._atom_indices
+                ) & checkpoint.restore("dqijdu", dqijdu, self._atom_indices)
+            disp_atom = disp_atoms.pop()
+            map_atoms = self.symmetry.get_map_atoms()
+            positions = np.where(map_atoms[self._atom_indices] == map_atoms[disp_atom])[
+                0
+            ]
+            if self._checkpoint_completed[positions].all():
+                if self._verbose:
+                    print(
+                        "dDij/du and dqij/du by displaced atom %d were read from "
+                        "checkpoint." % (disp_atom + 1)
                     )
+                return
+
+        with profiling_stage(
+            self._profiler, "displaced_atom", atom=displacements[0]["number"]
+        ):
+            delta_Dij_qijs = [
+                DeltaDijQij(Dij_per, Dij_disp, qij_per, qij_disp, d, lm_channels)
+                for Dij_disp, qij_disp, d in zip(
+                    Dij_disps, qij_disps, displacements, strict=True
+                )
+            ]
             ddijqij = DDijQijFit(
                 delta_Dij_qijs,
                 self._supercell,
                 self.symmetry,
                 atom_indices=self._atom_indices,
+                neighbors=self._neighbors,
+                profiler=self._profiler,
                 verbose=self._verbose,
             )
             ddijqij.run()
@@ -646,15 +1087,157 @@ class DDijQij:
             indices = []
             for ai in ddijqij.atom_indices:
                 indices.append(np.where(self._atom_indices == ai)[0][0])
-            self._dDijdu[:, indices] = ddijqij._dDijdu
-            self._dqijdu[:, indices] = ddijqij._dqijdu
+            dDijdu[:, indices] = ddijqij._dDijdu
+            dqijdu[:, indices] = ddijqij._dqijdu
+
+            if checkpoint is not None:
+                assert self._checkpoint_completed is not None
+                with profiling_stage(self._profiler, "checkpoint"):
+                    checkpoint.write("dDijdu", dDijdu, self._atom_indices, indices)
+                    checkpoint.write("dqijdu", dqijdu, self._atom_indices, indices)
+                self._checkpoint_completed[indices] = True
+
+    def run_snapshots(
+        self,
+        Dij_per,
+        Dij_disps,
+        qij_per,
+        qij_disps,
+        displacements,
+        lm_channels,
+        checkpoint: DerivativesCheckpoint | None = None,
+    ):
+        """Compute dDij/du and dqij/du from supercells of displaced atoms.
+
+        This is used for displacement dataset of snapshots in which all atoms
+        are displaced, see DDijQijSnapshotFit. ``displacements`` are those of
+        all atoms in Cartesian coordinates of shape=(snapshots, natom, 3). The
+        other parameters are those of ``run``. With ``checkpoint``, the
+        results are written after they are computed, and the calculation is
+        skipped when those of all atoms are found in the checkpoint file.
+
+        """
+        disps = np.array(displacements, dtype="double")
+        if disps.shape != (len(Dij_disps), len(self._supercell), 3):
+            raise ValueError(
+                "Shape of displacements has to be (%d, %d, 3)."
+                % (len(Dij_disps), len(self._supercell))
+            )
+
+        if self.dDijdu is None:
+            self._allocate_arrays(Dij_per.shape[0], Dij_per.shape[2])
+
+        dDijdu, dqijdu = self._get_storages()
 
         self.Dij = Dij_per[:, self._atom_indices, :, :]
         self.qij = qij_per[:, self._atom_indices, :, :]
 
+        if checkpoint is not None:
+            completed = checkpoint.restore(
+                "dDijdu", dDijdu, self._atom_indices
+            ) & checkpoint.restore("dqijdu", dqijdu, self._atom_indices)
+            if completed.all():
+                if self._verbose:
+                    print("dDij/du and dqij/du were read from checkpoint.")
+                return
+
+        with profiling_stage(self._profiler, "snapshots"):
+            ddijqij = DDijQijSnapshotFit(
+                [
+                    DeltaDijQij(
+                        Dij_per,
+                        Dij_disp,
+                        qij_per,
+                        qij_disp,
+                        {"displacements": d},
+                        lm_channels,
+                    )
+                    for Dij_disp, qij_disp, d in zip(
+                        Dij_disps, qij_disps, disps, strict=True
+                    )
+                ],
+                self._supercell,
+                self.symmetry,
+                atom_indices=self._atom_indices,
+                neighbors=self._neighbors,
+                profiler=self._profiler,
+                verbose=self._verbose,
+            )
+            ddijqij.run()
+            dDijdu[:] = ddijqij.dDijdu
+            dqijdu[:] = ddijqij.dqijdu
+
+            if checkpoint is not None:
+                indices = np.arange(len(self._atom_indices))
+                with profiling_stage(self._profiler, "checkpoint"):
+                    checkpoint.write("dDijdu", dDijdu, self._atom_indices, indices)
+                    checkpoint.write("dqijdu", dqijdu, self._atom_indices, indices)
+
     def _allocate_arrays(self, ncdij, lmdim):
         dtype = "c%d" % (np.dtype("double").itemsize * 2)
         natom = len(self._supercell)
-        shape = (ncdij, len(self._atom_indices), 3, natom, lmdim, lmdim)
-        self._dDijdu = np.zeros(shape, dtype=dtype, order="C")
-        self._dqijdu = np.zeros(shape, dtype=dtype, order="C")
+        if self._cutoff_radius is None:
+            shape = (ncdij, len(self._atom_indices), 3, natom, lmdim, lmdim)
+            self._dDijdu = np.zeros(shape, dtype=dtype, order="C")
+            self._dqijdu = np.zeros(shape, dtype=dtype, order="C")
+        else:
+            self._neighbors = get_neighbor_atoms(
+                self._supercell,
+                self._atom_indices,
+                self._cutoff_radius,
+                tolerance=self.symmetry.tolerance,
+            )
+            n_neighbors = self._neighbors.shape[1]
+            shape = (ncdij, len(self._atom_indices), 3, n_neighbors, lmdim, lmdim)
+            self._dDijdu = DDijQijNeighborArray(
+                np.zeros(shape, dtype=dtype, order="C"), self._neighbors, natom
+            )
+            self._dqijdu = DDijQijNeighborArray(
+                np.zeros(shape, dtype=dtype, order="C"), self._neighbors, natom
+            )
+
+    def _get_storages(self) -> tuple[NDArray, NDArray]:
+        """Return arrays where dDij/du and dqij/du are stored."""
+        if isinstance(self._dDijdu, DDijQijNeighborArray):
+            assert isinstance(self._dqijdu, DDijQijNeighborArray)
+            return self._dDijdu.values, self._dqijdu.values
+        assert isinstance(self._dDijdu, np.ndarray)
+        assert isinstance(self._dqijdu, np.ndarray)
+        return self._dDijdu, self._dqijdu
+
+
+def get_neighbor_atoms(
+    supercell: PhonopyAtoms,
+    atom_indices: Sequence[int] | NDArray,
+    cutoff_radius: float,
+    tolerance: float = 1e-5,
+) -> NDArray:
+    """Return atoms within cutoff radius from atoms at atom_indices.
+
+    Distance is the shortest one among periodic images in the neighboring
+    supercells. Atoms in each row are in ascending order and rows are padded
+    by -1 to the same length.
+
+    Returns
+    -------
+    ndarray
+        Neighbor atoms including the atom itself.
+        shape=(len(atom_indices), n_neighbors), dtype='int64'
+
+    """
+    lattice = supercell.cell.T
+    positions = supercell.scaled_positions
+    images = np.array(list(itertools.product((-1, 0, 1), repeat=3)), dtype="double")
+    rows = []
+    for i in atom_indices:
+        diff = positions - positions[i]
+        diff -= np.rint(diff)
+        vecs = (diff[:, None, :] + images[None, :, :]) @ lattice.T
+        distances = np.sqrt((vecs**2).sum(axis=2)).min(axis=1)
+        rows.append(np.where(distances < cutoff_radius + tolerance)[0])
+    neighbors = np.full(
+        (len(rows), max(len(row) for row in rows)), -1, dtype="int64", order="C"
+    )
+    for i, row in enumerate(rows):
+        neighbors[i, : len(row)] = row
+    return neighbors
@@ -5,22 +5,25 @@ from __future__ import annotations
 import os
 import textwrap
 from collections.abc import Sequence
-from typing import TYPE_CHECKING
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from typing import TYPE_CHECKING, Literal
 
 if TYPE_CHECKING:
     from phelel.base.Dij_qij import DeltaDijQij
+    from phelel.file_IO import DerivativesCheckpoint
 
 import numpy as np
 from numpy.typing import NDArray
-from phonopy.interface.vasp import get_vasp_structure_lines
 from phonopy.structure.atoms import PhonopyAtoms
 from phonopy.structure.cells import SNF3x3, determinant, get_supercell
 from phonopy.structure.symmetry import Symmetry
-from phonopy.utils import similarity_transformation
 
-from phelel.interface.vasp.file_IO import get_CHGCAR
-from phelel.utils.data import real2cmplx
+from phelel.interface.vasp.file_IO import write_volumetric_data
+from phelel.utils.data import LazyComplexArray, real2cmplx
 from phelel.utils.lattice_points import get_lattice_points
+from phelel.utils.profiler import Profiler, profiling_stage
+from phelel.utils.rotations import get_symmetry_rotation_table
 from phelel.utils.spinor import SpinorRotationMatrices
 
 
@@ -44,16 +47,23 @@ class DeltaLocalPotential:
 
     """
 
-    def __init__(self, V_loc_per: NDArray, V_loc_disp: NDArray, displacement: dict):
+    def __init__(
+        self,
+        V_loc_per: NDArray | Sequence[NDArray],
+        V_loc_disp: NDArray | Sequence[NDArray],
+        displacement: dict,
+    ):
         """Init method.
 
         Parameters
         ----------
-        V_loc_per : ndarray
-            Local potential of perfect supercell
+        V_loc_per : ndarray or list of ndarray
+            Local potential of perfect supercell. When a list of fields, e.g.,
+            local potential and meta-GGA kinetic potential, is given, their
+            differences are stacked along the first axis of dV.
             dtype='complex128'
             shape=(ncdij, nz, ny, nx)
-        V_loc_disp : ndarray
+        V_loc_disp : ndarray or list of ndarray
             Local potential of sueprcell with a displacement
             dtype=''complex128''
             shape=(ncdij, nz, ny, nx)
@@ -62,9 +72,17 @@ class DeltaLocalPotential:
             keys :
                 'displacement' : Displacement in Cartesian coordinates
                 'number' : Index of displaced atom
+            or displacements of all atoms of a snapshot
+            keys :
+                'displacements' : Displacements in Cartesian coordinates
+                                  shape=(natom, 3)
 
         """
-        self.dV = V_loc_disp - V_loc_per
+        if isinstance(V_loc_disp, np.ndarray):
+            self.dV = V_loc_disp - V_loc_per
+        else:
+            self.dV = np.concatenate(V_loc_disp)
+            self.dV -= np.concatenate(V_loc_per)
         self.displacement = displacement
 
     def write(
@@ -73,20 +91,21 @@ class DeltaLocalPotential:
         filename: str | bytes | os.PathLike | None = None,
         verbose: bool = False,
     ):
-        """Write local potential to a text file."""
+        """Write local potential to a text file.
+
+        With file name ending with ".hdf5" or ".h5", HDF5 file is written
+        instead, see ``write_volumetric_data``.
+
+        """
         if filename:
             _filename = filename
         else:
             _filename = "locpot.dat"
 
         if verbose:
-            print(f'dV_loc is written in "{_filename}" in LOCPOT like format.')
-
-        header = "\n".join(get_vasp_structure_lines(supercell))
-        locpot = get_CHGCAR(self.dV[0].real, header)  # only cdij=0
+            print(f'dV_loc is written in "{_filename!s}".')
 
-        with open(_filename, "w") as w:
-            w.write(locpot)
+        write_volumetric_data(_filename, self.dV[0].real, supercell)  # only cdij=0
 
 
 class LocalPotentialInterpolationNUFFT:
@@ -143,6 +162,10 @@ class LocalPotentialInterpolationNUFFT:
         atom_indices: NDArray | None = None,
         nufft: str | None = None,
         finufft_eps: float | None = None,
+        precision: Literal["double", "single"] = "double",
+        fft_workers: int | None = None,
+        n_fields: int = 1,
+        profiler: Profiler | None = None,
         verbose: bool = True,
     ):
         """Init method.
@@ -166,10 +189,29 @@ class LocalPotentialInterpolationNUFFT:
             If None, supposed to be all atoms. Internally only symmetrically
             equivalent atoms to the dispalced atom are selected to compute.
         nufft : str or None, optional
-            'finufft' only. Default is None, which corresponds to 'finufft'.
+            'finufft' only. Default is None, which corresponds to 'finufft'
+            except that, when all rotated grid points fall on the FFT mesh of
+            dV, dV values are gathered at them without interpolation. With
+            'finufft', finufft is always used.
         finufft_eps : float or None, optional
             Accuracy of finufft interpolation. Default is None, which
             corresponds to 1e-6.
+        precision : str, optional
+            "double" or "single". With "single", finufft runs in single
+            precision and dV/du is stored as complex64. finufft_eps smaller
+            than 2e-5 is raised to 2e-5 in single precision. Default is
+            "double".
+        fft_workers : int or None, optional
+            Number of threads of inverse FFT of dV. When given, scipy.fft is
+            used instead of numpy.fft. Default is None.
+        n_fields : int, optional
+            Number of fields of the same ncdij stacked along the first axis of
+            dV, e.g., 2 for local potential and meta-GGA kinetic potential.
+            All components of the fields are interpolated at the same rotated
+            grid points by one finufft plan. Default is 1.
+        profiler : Profiler or None, optional
+            When given, costs of stages of calculation at each atom are
+            recorded. Default is None.
         verbose : bool, optional
             To display log or not
 
@@ -179,17 +221,18 @@ class LocalPotentialInterpolationNUFFT:
         ##########
         self._fft_mesh = np.array(fft_mesh, dtype="int64")
         self._verbose = verbose
+        self._profiler = profiler
         self._supercell = supercell
         self._symmetry = symmetry
         self._atom_indices_in = atom_indices
-        if nufft is None:
-            self._nufft = "finufft"
-        else:
-            self._nufft = nufft
+        self._nufft = nufft
         if finufft_eps is None:
             self._finufft_eps = 1e-6
         else:
             self._finufft_eps = finufft_eps
+        self._precision = _check_precision(precision)
+        self._fft_workers = fft_workers
+        self._n_fields = n_fields
 
         ##########
         # Public #
@@ -233,8 +276,9 @@ class LocalPotentialInterpolationNUFFT:
         # N:   number of symmetry operations
         # N_g: number of interpolated grid points
 
-        # Inverse Fourier transformed original dV
-        self._dV_iFT = None
+        # Inverse Fourier transformed original dV of delta_Vs. This is kept
+        # with finufft plan while iterating over equivalent atoms.
+        self._dV_iFT: list[NDArray] | None = None
 
         # [[d_x(0,0), d_y(0,0), d_z(0,0)],
         #  [d_x(0,1), d_y(0,1), d_z(0,1)],
@@ -249,6 +293,15 @@ class LocalPotentialInterpolationNUFFT:
 
         self._finufft_plan = None
 
+        # Whether rotated grid points are on FFT mesh of dV for the current
+        # atom. Then dV is gathered at the grid points instead of finufft.
+        self._gather_dV = False
+
+        # Upper bound of number of non-uniform points transformed at once.
+        # Rotated grid points of site-symmetry operations are stacked up to
+        # this number.
+        self._max_nufft_points = 2**24
+
     def __iter__(self):
         """Enable iterator."""
         return self
@@ -259,9 +312,14 @@ class LocalPotentialInterpolationNUFFT:
         if len(self._atom_indices_returned) == self._i_atom:
             self._dV_itpl = None
             self._disps = None
+            self._dV_iFT = None
+            self._finalize_finufft()
             raise StopIteration
 
-        self._run_at_atom()
+        with profiling_stage(
+            self._profiler, "atom", atom=self._atom_indices_returned[self._i_atom]
+        ):
+            self._run_at_atom()
         self._i_atom += 1
 
     def next(self):
@@ -316,6 +374,8 @@ class LocalPotentialInterpolationNUFFT:
         """
         self._delta_Vs = delta_Vs
         self._i_atom = 0
+        self._dV_iFT = None
+        self._finalize_finufft()
         disp_atom = self._delta_Vs[0].displacement["number"]
         sitesym_sets, equiv_atoms = collect_site_symmetry_operations(
             disp_atom, self._symmetry
@@ -335,7 +395,7 @@ class LocalPotentialInterpolationNUFFT:
         ]
         self._sitesym_sets = sitesym_sets[sitesym_selected_indices]
 
-        dtype = f"c{np.dtype('double').itemsize * 2}"
+        dtype = _get_complex_dtype(self._precision)
         ncdij = self._delta_Vs[0].dV.shape[0]
         self._dVdu = np.zeros(
             (ncdij, len(self._atom_indices_returned), 3, len(self._grid_points)),
@@ -347,6 +407,11 @@ class LocalPotentialInterpolationNUFFT:
         """Delete large object dVdu."""
         self._dVdu = None
 
+    def delete_delta_Vs(self):
+        """Delete large objects dVs and inverse FFT of them."""
+        self._delta_Vs = None
+        self._dV_iFT = None
+
     def run(self):
         """Possibly iterate over selected symmetrically equivalent atoms."""
         for _ in self:
@@ -358,8 +423,8 @@ class LocalPotentialInterpolationNUFFT:
         Called by iterator method __next__.
 
         np.dot(disps_inv, full_dV_itpl) is stored in self.dVdu. But full_dV_tpl
-        requires large memory space, it is divided into those at site-symmetry
-        operations and multiplied with disps_inv piece by piece.
+        requires large memory space, it is divided into blocks of site-symmetry
+        operations and multiplied with disps_inv block by block.
 
         disps:
             Stacked atomic displacements. Site-symmetry runs fastest.
@@ -367,13 +432,15 @@ class LocalPotentialInterpolationNUFFT:
         disps_inv:
             shape = (3, n_sitesyms * n_disps)
         dVs_*:
-            shape = (ncdij, n_grid_points)
+            shape = (ncdij, n_sitesyms_in_block, n_grid_points)
         self._dVdu:
             shape = (ncdij, natom, 3, n_grid_points)
 
-        ``dVs_iFT``, ``dVs_rotated``, and ``self._finufft_plan`` are the list of
-        size ``ncdij``, where ``ncdij`` is 1 (non-magnetic), 2 (collinear
-        magnetic), or 4 (non-collinear).
+        Grid points rotated by the site-symmetry operations in a block are
+        stacked into one point cloud, and the ``ncdij`` components are
+        transformed together by one finufft plan with ``n_trans=ncdij``, where
+        ``ncdij`` is 1 (non-magnetic), 2 (collinear magnetic), or 4
+        (non-collinear) times the number of fields.
 
         Spinor rotation
         ---------------
@@ -388,63 +455,237 @@ class LocalPotentialInterpolationNUFFT:
         assert self._delta_Vs is not None
         assert self._dVdu is not None
         sitesyms = self._sitesym_sets[self._i_atom]
-        rotations = self._symmetry.symmetry_operations["rotations"][sitesyms]
-        translations = self._symmetry.symmetry_operations["translations"][sitesyms]
         lattice = self._supercell.cell.T
-        disps = get_displacements_with_rotations(rotations, lattice, self._delta_Vs)
-        disps_inv = np.linalg.pinv(disps)
+        rot_table = get_symmetry_rotation_table(self._symmetry, lattice)
+        disps = get_displacements_with_rotations(
+            self._symmetry.symmetry_operations["rotations"][sitesyms],
+            lattice,
+            self._delta_Vs,
+            r_carts=rot_table.r_carts[sitesyms],
+        )
+        disps_inv = np.linalg.pinv(disps).astype(self._precision)
+        self._accumulate_rotated_dVs(sitesyms, disps_inv, self._dVdu[:, self._i_atom])
 
-        if self._verbose:
-            print("Running finufft (eps=%.3e)..." % self._finufft_eps)
+    def run_snapshots(
+        self, delta_Vs: list[DeltaLocalPotential], out: NDArray | None = None
+    ):
+        """Compute dV/du of all atoms from supercells of displaced atoms.
 
-        ncdij = self._dVdu.shape[0]
-        self._init_finufft(ncdij)
+        Each of ``delta_Vs`` is the change of local potential of a supercell in
+        which all atoms are displaced, e.g., by random displacements. Supercells
+        are rotated by all symmetry operations of supercell, and dV/du of
+        atom_indices are given as the least-squares solution of
 
-        count = 0
-        for delta_V in self._delta_Vs:
-            dVs_iFT = [self._get_iFFT_of_dV(dV) for dV in delta_V.dV]
-            for r, t in zip(rotations, translations, strict=True):
-                dVs_rotated = self._rotate_dV(dVs_iFT, r, t)
-                if ncdij == 4:  # Need to rotate in spin space, too.
-                    dVs_spinor_rotated = rotate_delta_vals_in_spin_space(
-                        dVs_rotated, r, lattice
-                    )
-                    dVs_rotated.clear()
-                    dVs_rotated = dVs_spinor_rotated
-                for i_cdij in range(ncdij):
-                    self._dVdu[i_cdij, self._i_atom] += np.outer(
-                        disps_inv[:, count], dVs_rotated[i_cdij]
-                    )
-                count += 1
-                dVs_rotated.clear()
-            dVs_iFT.clear()
+            dV(r) = sum_{atom, alpha} u_{atom, alpha} dV/du_{atom, alpha}(r)
+
+        over all the rotated supercells at each grid point, which is
+        symmetric by construction. This requires that displacements of the
+        rotated supercells span all 3 * natom directions.
 
+        Parameters
+        ----------
+        delta_Vs : list of DeltaLocalPotential
+            ``displacement`` of each has key "displacements" of displacements
+            of all atoms in Cartesian coordinates of shape=(natom, 3).
+        out : ndarray or None, optional
+            When given, dV/du is computed in this array, e.g., np.memmap,
+            without allocating another one. Default is None.
+            shape=(ncdij, atom_indices, 3, n_grid_points)
+
+        """
+        self._delta_Vs = delta_Vs
+        self._dV_iFT = None
         self._finalize_finufft()
+        if self._atom_indices_in is None:
+            atoms = np.arange(len(self._supercell), dtype="int64")
+        else:
+            atoms = np.array(self._atom_indices_in, dtype="int64")
+        self._atom_indices_returned = atoms
+
+        lattice = self._supercell.cell.T
+        rot_table = get_symmetry_rotation_table(self._symmetry, lattice)
+        disps = get_snapshot_displacements_with_rotations(
+            self._delta_Vs, self._symmetry.atomic_permutations, rot_table.r_carts
+        )
+        disps_inv = get_snapshot_displacements_pinv(disps, atoms).astype(
+            self._precision
+        )
+
+        dtype = _get_complex_dtype(self._precision)
+        ncdij = self._delta_Vs[0].dV.shape[0]
+        n_grid = len(self._grid_points)
+        if out is None:
+            self._dVdu = np.zeros(
+                (ncdij, len(atoms), 3, n_grid), dtype=dtype, order="C"
+            )
+        else:
+            assert out.shape == (ncdij, len(atoms), 3, n_grid) and out.dtype == dtype
+            out[:] = 0
+            self._dVdu = out
+        self._accumulate_rotated_dVs(
+            np.arange(len(rot_table.r_carts)),
+            disps_inv,
+            self._dVdu.reshape(ncdij, -1, n_grid),
+        )
+        self._dV_iFT = None
+        self._finalize_finufft()
+
+    def _accumulate_rotated_dVs(
+        self, i_ops: NDArray, disps_inv: NDArray, dVdu: NDArray
+    ):
+        """Add disps_inv @ dVs rotated by symmetry operations to dVdu.
+
+        See _run_at_atom for the blocks of symmetry operations and the spinor
+        rotation. Columns of disps_inv are ordered as delta_Vs (outer) and
+        i_ops (inner).
+
+        Parameters
+        ----------
+        i_ops : ndarray
+            Indices of symmetry operations of supercell.
+        disps_inv : ndarray
+            shape=(n_rows, len(delta_Vs) * len(i_ops))
+        dVdu : ndarray
+            Buffer where results are added.
+            shape=(ncdij, n_rows, n_grid_points)
+
+        """
+        assert self._delta_Vs is not None
+        rotations = self._symmetry.symmetry_operations["rotations"][i_ops]
+        translations = self._symmetry.symmetry_operations["translations"][i_ops]
+        lattice = self._supercell.cell.T
+        rot_table = get_symmetry_rotation_table(self._symmetry, lattice)
+
+        ncdij = len(dVdu)
+        self._gather_dV = self._nufft is None and self._is_commensurate(
+            rotations, translations, self._delta_Vs[0].dV.shape
+        )
+        if self._gather_dV:
+            if self._verbose:
+                print("Gathering dV at grid points commensurate with FFT mesh...")
+            dVs = [dV.dV for dV in self._delta_Vs]
+        else:
+            if self._verbose:
+                print("Running finufft (eps=%.3e)..." % self._get_finufft_eps())
+            # iFFT of dV and finufft plan are shared by equivalent atoms.
+            if self._finufft_plan is None:
+                with profiling_stage(self._profiler, "nufft_plan"):
+                    self._init_finufft(ncdij)
+            if self._dV_iFT is None:
+                with profiling_stage(self._profiler, "ifft"):
+                    self._dV_iFT = [
+                        self._get_iFFT_of_dV(dV.dV) for dV in self._delta_Vs
+                    ]
+            dVs = self._dV_iFT
+
+        n_rots = len(rotations)
+        n_block = max(1, self._max_nufft_points // len(self._grid_points))
+        count = 0
+        for dV in dVs:
+            for i_rot in range(0, n_rots, n_block):
+                rots = rotations[i_rot : (i_rot + n_block)]
+                trans = translations[i_rot : (i_rot + n_block)]
+                dVs_rotated = self._rotate_dV(dV, rots, trans)
+                if ncdij == 4 * self._n_fields:  # Need to rotate in spin space, too.
+                    with profiling_stage(self._profiler, "spinor_rotation"):
+                        for i, (r, i_op) in enumerate(
+                            zip(rots, i_ops[i_rot : (i_rot + n_block)], strict=True)
+                        ):
+                            Delta = rot_table.get_spinor_Delta(i_op)
+                            for j in range(0, ncdij, 4):
+                                rotate_delta_vals_in_spin_space(
+                                    dVs_rotated[j : (j + 4), i],
+                                    r,
+                                    lattice,
+                                    Delta=Delta,
+                                    out=dVs_rotated[j : (j + 4), i],
+                                )
+                with profiling_stage(self._profiler, "accumulation"):
+                    dVdu += disps_inv[:, count : (count + len(rots))] @ dVs_rotated
+                count += len(rots)
+                del dVs_rotated
 
     def _rotate_dV(
-        self, dV_iFTs: list[NDArray], r: NDArray, t: NDArray
-    ) -> list[NDArray]:
+        self, dV: NDArray, rotations: NDArray, translations: NDArray
+    ) -> NDArray:
         """Rotate dV by rotating coordinates of delta potential passively.
 
-        Instead of rotating delta potential, grid points are rotated.
+        Instead of rotating delta potential, grid points are rotated. Grid
+        points rotated by all given symmetry operations are stacked and
+        transformed at once. dV is the inverse FFT of dV for finufft, and dV
+        itself when dV is gathered at grid points on its FFT mesh.
+
+        Returns
+        -------
+        ndarray
+            shape=(ncdij, len(rotations), n_grid_points)
+
+        """
+        r_invs = np.linalg.inv(rotations)
+        t_invs = -np.einsum("rij,rj->ri", r_invs, translations)
+        grid_points = np.einsum("nj,rij->rni", self._grid_points, r_invs)
+        grid_points += t_invs[:, None, :]
+        if self._gather_dV:
+            with profiling_stage(self._profiler, "gather"):
+                dVs = self._gather_dV_at_grid_points(grid_points.reshape(-1, 3), dV)
+        else:
+            grid_points -= np.rint(grid_points)
+            dVs = self._run_finufft(grid_points.reshape(-1, 3), dV)
+        return dVs.reshape(len(dV), len(rotations), len(self._grid_points))
+
+    def _is_commensurate(
+        self, rotations: NDArray, translations: NDArray, dV_shape: tuple[int, ...]
+    ) -> bool:
+        """Return whether rotated grid points fall on FFT mesh of dV.
+
+        With mesh numbers n of dV, grid points g and operations (R^-1, -R^-1 t)
+        applied to g, n * (R^-1 g - R^-1 t) is integer when n * g,
+        diag(n) R^-1 diag(n)^-1, and n * R^-1 t are integers.
+
+        """
+        mesh = np.array(dV_shape[:0:-1])  # (nx, ny, nz)
+        r_invs = np.linalg.inv(rotations)
+        values = [
+            self._grid_points * mesh,
+            r_invs * mesh[None, :, None] / mesh[None, None, :],
+            np.einsum("rij,rj->ri", r_invs, translations) * mesh,
+        ]
+        return all(np.allclose(v, np.rint(v), rtol=0, atol=1e-8) for v in values)
+
+    def _gather_dV_at_grid_points(self, grid_points: NDArray, dV: NDArray) -> NDArray:
+        """Return dV at grid points on FFT mesh of dV.
+
+        This gives the values of finufft interpolation exactly.
+
+        Returns
+        -------
+        ndarray
+            shape=(ncdij, len(grid_points))
 
         """
-        r_inv = np.linalg.inv(r)
-        t_inv = -r_inv @ t
-        grid_points = self._grid_points @ r_inv.T + t_inv
-        grid_points -= np.rint(grid_points)
-        return self._run_finufft(grid_points, dV_iFTs)
+        mesh = np.array(dV.shape[:0:-1])  # (nx, ny, nz)
+        k = np.rint(grid_points * mesh).astype("int64") % mesh
+        indices = (k[:, 2] * mesh[1] + k[:, 1]) * mesh[0] + k[:, 0]
+        dtype = _get_complex_dtype(self._precision)
+        return dV.reshape(len(dV), -1)[:, indices].astype(dtype, copy=False)
 
     def _get_iFFT_of_dV(self, dV: NDArray) -> NDArray:
-        """Inverse FFT."""
+        """Inverse FFT of all ncdij components."""
         dims = dV.shape
-        assert 3 == len(dims)
-        dV_iFT = np.fft.fftshift(np.fft.ifftn(dV))
-        return np.array(dV_iFT, dtype=dV_iFT.dtype, order="C")
+        assert 4 == len(dims)
+        axes = (1, 2, 3)
+        if self._fft_workers is None:
+            dV_iFT = np.fft.fftshift(np.fft.ifftn(dV, axes=axes), axes=axes)
+        else:
+            import scipy.fft
+
+            dV_iFT = scipy.fft.fftshift(
+                scipy.fft.ifftn(dV, axes=axes, workers=self._fft_workers), axes=axes
+            )
+        dtype = _get_complex_dtype(self._precision)
+        return np.array(dV_iFT, dtype=dtype, order="C")
 
-    def _run_finufft(
-        self, grid_points: NDArray, dV_iFTs: list[NDArray]
-    ) -> list[NDArray]:
+    def _run_finufft(self, grid_points: NDArray, dV_iFT: NDArray) -> NDArray:
         """Transform from uniform to non-uniform points.
 
         3D Type-2 transform.
@@ -452,36 +693,54 @@ class LocalPotentialInterpolationNUFFT:
             finufft.nufft3d2(z, y, x, dV_iFT, eps=self._finufft_eps)
 
         dV_iFT is FFT of dV whwere dV values are stored in Fortran order.
-        So x, y, z are alined as (z, y, x) in nufft3d2.
+        So x, y, z are alined as (z, y, x) in nufft3d2. All ncdij components
+        of dV_iFT are transformed by one plan of n_trans=ncdij.
+
+        Returns
+        -------
+        ndarray
+            shape=(ncdij, len(grid_points))
 
         """
         assert self._finufft_plan is not None
-        retval = []
-        for i, dV_iFT in enumerate(dV_iFTs):
-            x, y, z = [
-                np.array(v, dtype=grid_points.dtype, order="C")
-                for v in (grid_points * (np.pi * 2)).T
-            ]
-            self._finufft_plan[i].setpts(z, y, x)
-            retval.append(self._finufft_plan[i].execute(dV_iFT))
-        return retval
+        x, y, z = [
+            np.array(v, dtype=self._precision, order="C")
+            for v in (grid_points * (np.pi * 2)).T
+        ]
+        with profiling_stage(self._profiler, "nufft_setpts"):
+            self._finufft_plan.setpts(z, y, x)
+        with profiling_stage(self._profiler, "nufft_execute"):
+            return self._finufft_plan.execute(dV_iFT).reshape(len(dV_iFT), -1)
 
     def _init_finufft(self, ncdij: int):
         import finufft
 
         assert self._delta_Vs is not None
 
-        dtype = f"c{np.dtype('double').itemsize * 2}"
-        self._finufft_plan = [
-            finufft.Plan(
-                2, self._delta_Vs[0].dV[i].shape, eps=self._finufft_eps, dtype=dtype
-            )
-            for i in range(ncdij)
-        ]
+        dtype = _get_complex_dtype(self._precision)
+        if self._precision == "single":
+            # finufft chooses upsampfac=2 for single precision, which makes the
+            # FFT on the fine grid dominant. With upsampfac=1.25, the kernel
+            # width is anyway limited to that for eps=2e-5 in single precision.
+            opts = {"upsampfac": 1.25}
+        else:
+            opts = {}
+        self._finufft_plan = finufft.Plan(
+            2,
+            self._delta_Vs[0].dV.shape[1:],
+            n_trans=ncdij,
+            eps=self._get_finufft_eps(),
+            dtype=dtype,
+            **opts,
+        )
+
+    def _get_finufft_eps(self) -> float:
+        if self._precision == "single":
+            return max(self._finufft_eps, 2e-5)
+        return self._finufft_eps
 
     def _finalize_finufft(self):
-        assert self._finufft_plan is not None
-        self._finufft_plan.clear()
+        self._finufft_plan = None
 
 
 class DLocalPotential:
@@ -517,7 +776,10 @@ class DLocalPotential:
         Symmetry of supercell.
     dVdu : ndarray
         Displacement derivative of local potential in supercell interpolated on
-        mesh grid of primitve cell.
+        mesh grid of primitve cell. This is np.memmap when memmap_filename is
+        given, LazyComplexArray when lazily read from phelel_params.hdf5, and
+        SymmetryReducedDVdu when read from phelel_params.hdf5 written with
+        reduce_by_symmetry=True.
         dtype='complex128', shape=(ncdij, atom_indices, 3, grid_points)
     atom_indices : ndarray, optional
         Atom indices in supercell where dV is computed. This is made as
@@ -539,6 +801,12 @@ class DLocalPotential:
         atom_indices: NDArray | None = None,
         nufft: str | None = None,
         finufft_eps: float | None = None,
+        n_workers: int | None = None,
+        memmap_filename: str | os.PathLike | None = None,
+        precision: Literal["double", "single"] = "double",
+        fft_workers: int | None = None,
+        n_fields: int = 1,
+        profiler: Profiler | None = None,
         verbose: bool = True,
     ):
         """Init method.
@@ -561,15 +829,56 @@ class DLocalPotential:
             If None, supposed to be all atoms. Internally only symmetrically
             equivalent atoms to the dispalced atom are selected to compute.
         nufft : str or None
-            'finufft' only. Default is None, which corresponds to 'finufft'.
+            'finufft' only. Default is None, which corresponds to 'finufft'
+            except that dV is gathered without interpolation when grid points
+            are commensurate with FFT mesh of dV. See
+            LocalPotentialInterpolationNUFFT.
         finufft_eps : float or None, optional
             Accuracy of finufft interpolation. Default is None, which
             corresponds to 1e-6.
+        n_workers : int or None, optional
+            Number of worker processes. When larger than 1, dV/du of
+            independent displaced atoms are computed in a process pool, where
+            local potentials are passed to the workers through shared memory.
+            Unless memmap_filename is given, dV/du is allocated in a shared
+            memory block, to which the workers write directly. Default is
+            None, i.e., serial calculation.
+        memmap_filename : str or os.PathLike or None, optional
+            When given, dV/du is allocated as np.memmap backed by this file
+            instead of in RAM, and dV/du of each atom is written to the file as
+            soon as it is computed. The file is not deleted by this class.
+            Default is None.
+        precision : str, optional
+            "double" or "single". With "single", finufft runs in single
+            precision and dV/du is computed and stored as complex64.
+            finufft_eps smaller than 2e-5 is raised to 2e-5. Errors from single
+            precision are a few times 1e-6 relative to the largest element of
+            dV/du. Default is "double".
+        fft_workers : int or None, optional
+            Number of threads of inverse FFT of dV by scipy.fft. Default is
+            None, i.e., numpy.fft is used.
+        n_fields : int, optional
+            Number of fields whose derivatives are computed together, e.g., 2
+            for local potential and meta-GGA kinetic potential. With n_fields >
+            1, local potentials are given as lists of the fields of the same
+            ncdij, and the derivatives are stacked along the first axis of
+            dV/du. Symmetry operations, rotated grid points, and finufft plans
+            are shared by the fields. See ``get_fields``. Default is 1.
+        profiler : Profiler or None, optional
+            When given, costs of stages of calculation by each displaced atom
+            are recorded. In process pool, they are measured in the worker
+            processes and collected. Default is None.
         verbose : bool
             To display log or not
 
         """
         self._verbose = verbose
+        self._profiler = profiler
+        self._n_workers = n_workers
+        self._memmap_filename = memmap_filename
+        self._precision = _check_precision(precision)
+        self._fft_workers = fft_workers
+        self._n_fields = n_fields
 
         self._supercell = supercell
         self._fft_mesh = fft_mesh
@@ -586,7 +895,11 @@ class DLocalPotential:
         self._finufft_eps: float | None = finufft_eps
         self._lattice_points: NDArray | None = None
         self._grid_points: NDArray | None = None
-        self._dVdu: NDArray | None = None  # self.dVdu is provided by @property.
+        # self.dVdu is provided by @property.
+        self._dVdu: NDArray | LazyComplexArray | SymmetryReducedDVdu | None = None
+        self._lpi: LocalPotentialInterpolationNUFFT | None = None
+        # Flags of atoms whose dV/du were restored from or written to checkpoint.
+        self._checkpoint_completed: NDArray | None = None
 
     @property
     def p2s_matrix(self) -> NDArray:
@@ -614,7 +927,12 @@ class DLocalPotential:
         return self._fft_mesh
 
     @property
-    def dVdu(self) -> NDArray | None:
+    def n_fields(self) -> int:
+        """Return number of fields stacked in dV/du."""
+        return self._n_fields
+
+    @property
+    def dVdu(self) -> NDArray | LazyComplexArray | SymmetryReducedDVdu | None:
         """Return dVdu.
 
         See detail at attribute section of this class's docstring.
@@ -623,20 +941,8 @@ class DLocalPotential:
         return self._dVdu
 
     @dVdu.setter
-    def dVdu(self, dVdu: NDArray):
-        if dVdu.dtype == "double":
-            _dVdu = real2cmplx(dVdu)
-        else:
-            _dVdu = dVdu
-        if _dVdu.shape[1:] == self._get_dVdu_shape():
-            self._allocate_arrays(_dVdu.shape[0])
-            assert self._dVdu is not None
-            self._dVdu[:] = _dVdu
-        else:
-            raise RuntimeError(
-                "Array shape[1:] disagreement is found, %s!=%s."
-                % (self._get_dVdu_shape(), _dVdu.shape[1:])
-            )
+    def dVdu(self, dVdu: NDArray | LazyComplexArray | SymmetryReducedDVdu):
+        self.set_dVdu(dVdu)
 
     @property
     def lattice_points(self) -> NDArray | None:
@@ -680,9 +986,11 @@ class DLocalPotential:
 
     def run(
         self,
-        V_loc_per: NDArray,
-        V_loc_disps: list[NDArray],
+        V_loc_per: NDArray | Sequence[NDArray],
+        V_loc_disps: Sequence[NDArray] | Sequence[Sequence[NDArray]],
         displacements: list[dict],
+        checkpoint: DerivativesCheckpoint | None = None,
+        checkpoint_name: str = "dVdu",
     ):
         """Calculate dV/du.
 
@@ -690,12 +998,14 @@ class DLocalPotential:
 
         Parameters
         ----------
-        V_loc_per : ndarray
-            Local potential of perfect supercell
+        V_loc_per : ndarray or list of ndarray
+            Local potential of perfect supercell. List of n_fields fields when
+            n_fields > 1.
             dtype='complex128'
             shape=(ncdij, nz, ny, nx)
         V_loc_disps : list of ndarrays
-            Local potentials of sueprcells with respective displacements
+            Local potentials of sueprcells with respective displacements. Each
+            is a list of n_fields fields when n_fields > 1.
             dtype='complex128'
             shape=(ndisp, ncdij, nz, ny, nx)
         displacements : list of dicts
@@ -703,75 +1013,510 @@ class DLocalPotential:
             keys of each dict:
                 'displacement' : Displacement in Cartesian coordinates
                 'number' : Index of displaced atom
+        checkpoint : DerivativesCheckpoint or None, optional
+            When given, dV/du of atoms equivalent to each displaced atom is
+            written to the checkpoint file as soon as it is computed, and
+            displaced atoms whose dV/du are found in the checkpoint file are
+            skipped. Default is None.
+        checkpoint_name : str, optional
+            Name of dV/du in checkpoint file. Default is "dVdu".
 
         """
-        lpi = LocalPotentialInterpolationNUFFT(
-            self._fft_mesh,
-            self._p2s_matrix,
-            self._supercell,
-            self._symmetry,
-            atom_indices=self._atom_indices,
-            nufft=self._nufft,
-            finufft_eps=self._finufft_eps,
-        )
-        self._lattice_points = lpi.lattice_points.copy(order="C")
-        self._grid_points = lpi.grid_points.copy(order="C")
+        self._prepare(self._get_ncdij(V_loc_per))
+
+        disp_atoms = np.unique([d["number"] for d in displacements])
+        if self._n_workers is not None and self._n_workers > 1 and len(disp_atoms) > 1:
+            if checkpoint is not None:
+                completed = self._restore_checkpoint(checkpoint, checkpoint_name)
+                disp_atoms = [
+                    disp_atom
+                    for disp_atom in disp_atoms
+                    if not completed[
+                        self._get_equivalent_atom_positions(disp_atom)
+                    ].all()
+                ]
+            self._run_in_process_pool(
+                V_loc_per,
+                V_loc_disps,
+                displacements,
+                disp_atoms,
+                checkpoint=checkpoint,
+                checkpoint_name=checkpoint_name,
+            )
+            return
 
-        if self._dVdu is None:
-            self._allocate_arrays(V_loc_per.shape[0])
+        for disp_atom in disp_atoms:
+            indices = [
+                i for i, d in enumerate(displacements) if d["number"] == disp_atom
+            ]
+            self.run_displaced_atom(
+                V_loc_per,
+                [V_loc_disps[i] for i in indices],
+                [displacements[i] for i in indices],
+                checkpoint=checkpoint,
+                checkpoint_name=checkpoint_name,
+            )
 
-        assert self._dVdu is not None
+    def run_displaced_atom(
+        self,
+        V_loc_per: NDArray | Sequence[NDArray],
+        V_loc_disps: Sequence[NDArray] | Sequence[Sequence[NDArray]],
+        displacements: Sequence[dict],
+        checkpoint: DerivativesCheckpoint | None = None,
+        checkpoint_name: str = "dVdu",
+    ):
+        """Calculate dV/du of atoms equivalent to one displaced atom.
 
-        for disp_atom in np.unique([d["number"] for d in displacements]):
-            dVs = []
-            for i, d in enumerate(displacements):
-                if d["number"] == disp_atom:
-                    dVs.append(
-                        DeltaLocalPotential(V_loc_per, V_loc_disps[i], displacements[i])
-                    )
-            lpi.delta_Vs = dVs
-            assert lpi.atom_indices_returned is not None
-            for i_atom, _ in enumerate(lpi):  # Run lpi by iterator.next()
+        dV/du is computed incrementally by calling this method for each
+        displaced atom, so that only local potentials of displacements of one
+        atom are necessary at a time. Calculation results are stored in
+        self._dVdu.
+
+        Parameters
+        ----------
+        V_loc_per : ndarray or list of ndarray
+            Local potential of perfect supercell. See ``run``.
+            dtype='complex128'
+            shape=(ncdij, nz, ny, nx)
+        V_loc_disps : list of ndarrays
+            Local potentials of sueprcells with displacements of the displaced
+            atom. See ``run``.
+            dtype='complex128'
+            shape=(ndisp, ncdij, nz, ny, nx)
+        displacements : list of dicts
+            Displacements of the displaced atom. See ``run``.
+        checkpoint : DerivativesCheckpoint or None, optional
+            See ``run``.
+        checkpoint_name : str, optional
+            See ``run``.
+
+        """
+        disp_atoms = {d["number"] for d in displacements}
+        if len(disp_atoms) != 1:
+            raise ValueError("Displacements have to be those of one atom.")
+
+        self._prepare(self._get_ncdij(V_loc_per))
+        if checkpoint is not None:
+            completed = self._restore_checkpoint(checkpoint, checkpoint_name)
+            disp_atom = disp_atoms.pop()
+            if completed[self._get_equivalent_atom_positions(disp_atom)].all():
                 if self._verbose:
                     print(
-                        "Computed dV/du by displaced atom %d"
-                        % (lpi.atom_indices_returned[i_atom] + 1)
+                        "dV/du by displaced atom %d was read from checkpoint."
+                        % (disp_atom + 1)
                     )
+                return
 
-            indices = []
-            for ai in lpi.atom_indices_returned:
-                indices.append(np.where(self.atom_indices == ai)[0][0])
-            self._dVdu[:, indices, :, :] = lpi.dVdu
+        with profiling_stage(
+            self._profiler, "displaced_atom", atom=displacements[0]["number"]
+        ):
+            indices = self._run_lpi(V_loc_per, V_loc_disps, displacements)
+            if checkpoint is not None:
+                self._write_checkpoint(checkpoint, checkpoint_name, self._dVdu, indices)
 
-    def visualize(self, pcell: PhonopyAtoms, i_atom: int):
-        """Visualize dV/du in x, y, z."""
-        assert self._grid_points is not None
+    def run_snapshots(
+        self,
+        V_loc_per: NDArray | Sequence[NDArray],
+        V_loc_disps: Sequence[NDArray] | Sequence[Sequence[NDArray]],
+        displacements: NDArray | Sequence,
+        checkpoint: DerivativesCheckpoint | None = None,
+        checkpoint_name: str = "dVdu",
+    ):
+        """Calculate dV/du from supercells in which all atoms are displaced.
+
+        This is used for displacement dataset of snapshots, e.g., of random
+        displacements, instead of displacements of one atom in each supercell.
+        dV/du of all atom_indices are fitted to dV of all the snapshots
+        at once by least squares, see
+        LocalPotentialInterpolationNUFFT.run_snapshots. Calculation results
+        are stored in self._dVdu.
+
+        Parameters
+        ----------
+        V_loc_per : ndarray or list of ndarray
+            Local potential of perfect supercell. See ``run``.
+        V_loc_disps : list of ndarrays
+            Local potentials of snapshot supercells. See ``run``.
+        displacements : array_like
+            Displacements of all atoms of snapshots in Cartesian coordinates.
+            shape=(snapshots, natom, 3)
+        checkpoint : DerivativesCheckpoint or None, optional
+            When given, dV/du is written to the checkpoint file after it is
+            computed, and the calculation is skipped when dV/du of all atoms
+            are found in the checkpoint file. Default is None.
+        checkpoint_name : str, optional
+            See ``run``.
+
+        """
+        disps = np.array(displacements, dtype="double")
+        if disps.shape != (len(V_loc_disps), len(self._supercell), 3):
+            raise ValueError(
+                "Shape of displacements has to be (%d, %d, 3)."
+                % (len(V_loc_disps), len(self._supercell))
+            )
+
+        self._prepare(self._get_ncdij(V_loc_per))
+        if checkpoint is not None:
+            completed = self._restore_checkpoint(checkpoint, checkpoint_name)
+            if completed.all():
+                if self._verbose:
+                    print("dV/du was read from checkpoint.")
+                return
+
+        lpi = self._lpi
+        assert lpi is not None
+        assert isinstance(self._dVdu, np.ndarray)
+        with profiling_stage(self._profiler, "snapshots"):
+            lpi.run_snapshots(
+                [
+                    DeltaLocalPotential(V_loc_per, V_loc_disp, {"displacements": d})
+                    for V_loc_disp, d in zip(V_loc_disps, disps, strict=True)
+                ],
+                out=self._dVdu,
+            )
+            lpi.delete_dVdu()
+            lpi.delete_delta_Vs()
+            if self._verbose:
+                print("Computed dV/du from %d snapshots" % len(disps))
+            if checkpoint is not None:
+                self._write_checkpoint(
+                    checkpoint,
+                    checkpoint_name,
+                    self._dVdu,
+                    np.arange(len(self._atom_indices)),
+                )
+
+    def _run_lpi(
+        self,
+        V_loc_per: NDArray | Sequence[NDArray],
+        V_loc_disps: Sequence[NDArray] | Sequence[Sequence[NDArray]],
+        displacements: Sequence[dict],
+    ) -> list[int]:
+        """Run interpolation and return positions of computed atoms in dV/du."""
+        lpi = self._lpi
+        assert lpi is not None
         assert self._dVdu is not None
-        for i_dir in range(3):
-            xyz = "xyz"[i_dir]
-            # spin 1 only
-            multi = visualize_distribution(
-                "locpot_viz-%03d-%s.dat" % (self._atom_indices[i_atom] + 1, xyz),
-                pcell,
+        lpi.delta_Vs = [
+            DeltaLocalPotential(V_loc_per, V_loc_disp, d)
+            for V_loc_disp, d in zip(V_loc_disps, displacements, strict=True)
+        ]
+        assert lpi.atom_indices_returned is not None
+        assert lpi.dVdu is not None
+        indices = []
+        for i_atom, _ in enumerate(lpi):  # Run lpi by iterator.next()
+            # dV/du at this atom is final once lpi moves to the next atom.
+            ai = lpi.atom_indices_returned[i_atom]
+            index = np.where(self.atom_indices == ai)[0][0]
+            self._dVdu[:, index, :, :] = lpi.dVdu[:, i_atom]
+            indices.append(index)
+            if self._verbose:
+                print("Computed dV/du by displaced atom %d" % (ai + 1))
+        lpi.delete_dVdu()
+        lpi.delete_delta_Vs()
+        return indices
+
+    def set_dVdu(
+        self,
+        dVdu: NDArray | LazyComplexArray | SymmetryReducedDVdu,
+        copy: bool = True,
+    ):
+        """Set dV/du.
+
+        ndarray is copied into an array allocated by this instance unless
+        ``copy=False``. With ``copy=False``, C-contiguous complex array of the
+        precision is stored by reference, and later calculations write into
+        it. LazyComplexArray and SymmetryReducedDVdu are always stored by
+        reference.
+
+        """
+        if isinstance(dVdu, (LazyComplexArray, SymmetryReducedDVdu)):
+            _dVdu = dVdu
+        elif dVdu.dtype == "double":
+            _dVdu = real2cmplx(dVdu)
+        else:
+            _dVdu = dVdu
+        if _dVdu.shape[1:] == self._get_dVdu_shape():
+            dtype = _get_complex_dtype(self._precision)
+            if self._memmap_filename is None and (
+                isinstance(_dVdu, (LazyComplexArray, SymmetryReducedDVdu))
+                or (not copy and _dVdu.dtype == dtype and _dVdu.flags.c_contiguous)
+            ):
+                # Stored without copy.
+                self._dVdu = _dVdu
+            else:
+                self._allocate_arrays(_dVdu.shape[0])
+                assert self._dVdu is not None
+                self._dVdu[:] = _dVdu
+        else:
+            raise RuntimeError(
+                "Array shape[1:] disagreement is found, %s!=%s."
+                % (self._get_dVdu_shape(), _dVdu.shape[1:])
+            )
+
+    def get_fields(self) -> list[DLocalPotential]:
+        """Return DLocalPotential of each field of n_fields.
+
+        dV/du of the returned instances are views of the slices of dV/du of
+        this instance along the first axis. Therefore, dV/du is not copied
+        even when it is np.memmap.
+
+        """
+        assert self._dVdu is not None
+        ncdij = len(self._dVdu) // self._n_fields
+        fields = []
+        for i in range(self._n_fields):
+            dlp = DLocalPotential(
+                self._fft_mesh,
                 self._p2s_matrix,
+                self._supercell,
+                symmetry=self._symmetry,
+                atom_indices=self._atom_indices,
+                nufft=self._nufft,
+                finufft_eps=self._finufft_eps,
+                precision=self._precision,
+                fft_workers=self._fft_workers,
+                profiler=self._profiler,
+                verbose=self._verbose,
+            )
+            dlp.set_dVdu(self._dVdu[(i * ncdij) : ((i + 1) * ncdij)], copy=False)
+            if self._grid_points is not None:
+                dlp.grid_points = self._grid_points
+            if self._lattice_points is not None:
+                dlp.lattice_points = self._lattice_points
+            fields.append(dlp)
+        return fields
+
+    def _get_ncdij(self, V_loc: NDArray | Sequence[NDArray]) -> int:
+        """Return number of components of dV/du of stacked fields."""
+        if self._n_fields == 1:
+            return len(V_loc)
+        if len(V_loc) != self._n_fields or len({len(v) for v in V_loc}) != 1:
+            raise ValueError(
+                "Local potentials have to be given as %d fields of the same ncdij."
+                % self._n_fields
+            )
+        return sum(len(v) for v in V_loc)
+
+    def _get_equivalent_atom_positions(self, disp_atom: int) -> NDArray:
+        """Return positions in atom_indices of atoms equivalent to disp_atom."""
+        map_atoms = self._symmetry.get_map_atoms()
+        return np.where(map_atoms[self._atom_indices] == map_atoms[disp_atom])[0]
+
+    def _restore_checkpoint(
+        self, checkpoint: DerivativesCheckpoint, checkpoint_name: str
+    ) -> NDArray:
+        """Restore dV/du from checkpoint at first call and return completed flags."""
+        assert self._dVdu is not None
+        if self._checkpoint_completed is None:
+            self._checkpoint_completed = checkpoint.restore(
+                checkpoint_name, self._dVdu, self._atom_indices
+            )
+        return self._checkpoint_completed
+
+    def _write_checkpoint(
+        self,
+        checkpoint: DerivativesCheckpoint,
+        checkpoint_name: str,
+        dVdu: NDArray,
+        indices: Sequence[int] | NDArray,
+    ):
+        assert self._checkpoint_completed is not None
+        with profiling_stage(self._profiler, "checkpoint"):
+            checkpoint.write(checkpoint_name, dVdu, self._atom_indices, indices)
+        self._checkpoint_completed[indices] = True
+
+    def _prepare(self, ncdij: int):
+        """Set up interpolation and dV/du array at first call."""
+        if self._lpi is None:
+            self._lpi = LocalPotentialInterpolationNUFFT(
                 self._fft_mesh,
-                self._grid_points,
-                self._dVdu[0, i_atom, i_dir],
+                self._p2s_matrix,
+                self._supercell,
+                self._symmetry,
+                atom_indices=self._atom_indices,
+                nufft=self._nufft,
+                finufft_eps=self._finufft_eps,
+                precision=self._precision,
+                fft_workers=self._fft_workers,
+                n_fields=self._n_fields,
+                profiler=self._profiler,
             )
+            self._lattice_points = self._lpi.lattice_points.copy(order="C")
+            self._grid_points = self._lpi.grid_points.copy(order="C")
 
-        if self._verbose:
-            msg = (
-                "[%d, %d, %d] supercell of primitive cell is "
-                "used. dV/du is written in "
-                '"locpot_viz-%d-{x,y,z}.dat", in LOCPOT-like '
-                "format." % (tuple(multi) + (i_atom + 1,))
+        if self._dVdu is None:
+            self._allocate_arrays(ncdij)
+
+    def _run_in_process_pool(
+        self,
+        V_loc_per: NDArray | Sequence[NDArray],
+        V_loc_disps: Sequence[NDArray] | Sequence[Sequence[NDArray]],
+        displacements: list[dict],
+        disp_atoms: Sequence[int] | NDArray,
+        checkpoint: DerivativesCheckpoint | None = None,
+        checkpoint_name: str = "dVdu",
+    ):
+        """Calculate dV/du of displaced atoms in a process pool.
+
+        Local potentials are placed in a shared memory block, and dV/du is
+        allocated in another one by ``_allocate_arrays``. Each worker attaches
+        to them, and writes dV/du of the equivalent atoms of its displaced atom
+        to the disjoint slices of the shared dV/du, so dV/du is not copied.
+        When dV/du is np.memmap, workers write to the memmap file directly.
+        Only displaced atoms in disp_atoms are computed. With checkpoint, dV/du
+        of each displaced atom is written to the checkpoint file by the main
+        process as soon as its worker finishes. With profiler, costs are
+        recorded by each worker and returned to the main process. Fields of
+        local potentials are stacked in the shared memory block.
+
+        """
+        assert self._dVdu is not None
+        dtype = np.dtype("complex128")
+        V_loc_shape = (self._get_ncdij(V_loc_per),) + np.shape(V_loc_per)[-3:]
+        V_locs_shape = (len(V_loc_disps) + 1,) + V_loc_shape
+        V_locs_buffer = _SharedMemoryBuffer(V_locs_shape, dtype)
+        if isinstance(self._dVdu, np.memmap):
+            self._dVdu.flush()
+            dVdu_buffer = (
+                "memmap",
+                str(self._memmap_filename),
+                self._dVdu.shape,
+                self._dVdu.dtype.str,
             )
-            print(
-                textwrap.fill(
-                    msg, width=70, initial_indent="    ", subsequent_indent="    "
+        else:
+            if not isinstance(self._dVdu.base, _SharedMemoryBuffer):
+                # dV/du given by the setter is moved to shared memory once.
+                dVdu = np.asarray(
+                    _SharedMemoryBuffer(self._dVdu.shape, self._dVdu.dtype)
                 )
+                dVdu[:] = self._dVdu
+                self._dVdu = dVdu
+            dVdu_buffer = (
+                "shm",
+                self._dVdu.base.name,
+                self._dVdu.shape,
+                self._dVdu.dtype.str,
             )
 
+        V_locs = np.asarray(V_locs_buffer)
+        for i, V_loc in enumerate([V_loc_per, *V_loc_disps]):
+            if self._n_fields == 1:
+                V_locs[i] = V_loc
+            else:
+                np.concatenate(V_loc, out=V_locs[i])
+
+        lpi_args = (self._fft_mesh, self._p2s_matrix, self._supercell)
+        lpi_kwargs = {
+            "symmetry": self._symmetry,
+            "atom_indices": self._atom_indices,
+            "nufft": self._nufft,
+            "finufft_eps": self._finufft_eps,
+            "precision": self._precision,
+            "fft_workers": self._fft_workers,
+            "n_fields": self._n_fields,
+            "verbose": False,
+        }
+        with ProcessPoolExecutor(
+            max_workers=self._n_workers,
+            initializer=_init_lpi_worker,
+            initargs=(
+                lpi_args,
+                lpi_kwargs,
+                (V_locs_buffer.name, V_locs_shape, dtype.str),
+                dVdu_buffer,
+                self._profiler is not None,
+            ),
+        ) as executor:
+            futures = []
+            for disp_atom in disp_atoms:
+                disps = [
+                    (i, d)
+                    for i, d in enumerate(displacements)
+                    if d["number"] == disp_atom
+                ]
+                futures.append(executor.submit(_run_lpi_worker, disps))
+            # Results are handled in the order of completion.
+            for future in as_completed(futures):
+                atom_indices_returned, records = future.result()
+                if self._profiler is not None:
+                    self._profiler.add_records(records)
+                if self._verbose:
+                    for ai in atom_indices_returned:
+                        print("Computed dV/du by displaced atom %d" % (ai + 1))
+                if checkpoint is not None:
+                    self._write_checkpoint(
+                        checkpoint,
+                        checkpoint_name,
+                        self._dVdu,
+                        [
+                            np.where(self._atom_indices == ai)[0][0]
+                            for ai in atom_indices_returned
+                        ],
+                    )
+        del V_locs, V_locs_buffer
+
+    def visualize(
+        self,
+        pcell: PhonopyAtoms,
+        i_atom: int | Sequence[int] | None = None,
+        hdf5: bool = False,
+    ):
+        """Visualize dV/du in x, y, z.
+
+        Parameters
+        ----------
+        pcell : PhonopyAtoms
+            Primitive cell.
+        i_atom : int, list of int, or None, optional
+            Positions of atoms in atom_indices. Default is None, i.e., all
+            atoms. The map of grid points is computed once for all of them.
+        hdf5 : bool, optional
+            Write HDF5 files instead of LOCPOT-like text files, see
+            ``write_volumetric_data``. Default is False.
+
+        """
+        assert self._grid_points is not None
+        assert self._dVdu is not None
+        if i_atom is None:
+            i_atoms = range(len(self._atom_indices))
+        elif isinstance(i_atom, (int, np.integer)):
+            i_atoms = [i_atom]
+        else:
+            i_atoms = i_atom
+        viz = DistributionVisualization(
+            pcell, self._p2s_matrix, self._fft_mesh, self._grid_points
+        )
+        suffix = "hdf5" if hdf5 else "dat"
+        for i in i_atoms:
+            # spin 1 only
+            dV_viz = viz.get_distribution(self._dVdu[0, i]).real
+            for i_dir, xyz in enumerate("xyz"):
+                write_volumetric_data(
+                    "locpot_viz-%03d-%s.%s" % (self._atom_indices[i] + 1, xyz, suffix),
+                    dV_viz[i_dir],
+                    viz.cell,
+                )
+
+            if self._verbose:
+                msg = (
+                    "[%d, %d, %d] supercell of primitive cell is "
+                    "used. dV/du is written in "
+                    '"locpot_viz-%03d-{x,y,z}.%s"%s.'
+                    % (
+                        tuple(viz.multiplicity)
+                        + (
+                            self._atom_indices[i] + 1,
+                            suffix,
+                            "" if hdf5 else ", in LOCPOT-like format",
+                        )
+                    )
+                )
+                print(
+                    textwrap.fill(
+                        msg, width=70, initial_indent="    ", subsequent_indent="    "
+                    )
+                )
+
     def _get_dVdu_shape(self) -> tuple[int, int, int]:
         num_gp = int(
             self._fft_mesh[0]
@@ -782,9 +1527,410 @@ class DLocalPotential:
         return (len(self._atom_indices), 3, num_gp)
 
     def _allocate_arrays(self, ncdij: int):
-        dtype = "c%d" % (np.dtype("double").itemsize * 2)
+        dtype = _get_complex_dtype(self._precision)
         shape = (ncdij, *self._get_dVdu_shape())
-        self._dVdu = np.zeros(shape, dtype=dtype, order="C")
+        if self._memmap_filename is None:
+            if self._n_workers is not None and self._n_workers > 1:
+                # Shared memory block is zero-filled at creation.
+                self._dVdu = np.asarray(_SharedMemoryBuffer(shape, dtype))
+            else:
+                self._dVdu = np.zeros(shape, dtype=dtype, order="C")
+        else:
+            self._dVdu = np.memmap(
+                self._memmap_filename, dtype=dtype, mode="w+", shape=shape
+            )
+
+
+class SymmetryReducedDVdu:
+    """dV/du of all atoms reconstructed from those of irreducible atoms.
+
+    dV/du of atom j is obtained from that of atom i by symmetry operation
+    (R, t) that sends atom i to atom j as
+
+        dV/du_j(r) = R_cart dV/du_i(R^-1 (r - t)),
+
+    where R^-1 (r - t) has to be one of the grid points, i.e., dV/du_i is
+    permuted over the grid points. For ncdij=4, dV/du_j is further rotated in
+    spin space. dV/du of atoms are reconstructed when they are selected by
+    indexing, e.g., ``dVdu[:, i_atom]``, as done by LazyComplexArray. The full
+    array is reconstructed by ``np.asarray``.
+
+    """
+
+    def __init__(
+        self,
+        dVdu: NDArray | LazyComplexArray,
+        atom_map: NDArray,
+        rotations: NDArray,
+        translations: NDArray,
+        grid_points: NDArray,
+        fft_mesh: Sequence[int] | NDArray,
+        p2s_matrix: NDArray,
+        lattice: NDArray,
+    ):
+        """Init method.
+
+        Parameters
+        ----------
+        dVdu : ndarray or LazyComplexArray
+            dV/du of irreducible atoms.
+            shape=(ncdij, n_irreducible_atoms, 3, n_grid_points)
+        atom_map : ndarray
+            Indices of irreducible atoms in dVdu from which dV/du of atoms are
+            reconstructed.
+            shape=(n_atoms,), dtype='int64'
+        rotations : ndarray
+            Rotation matrices of symmetry operations that send irreducible
+            atoms to atoms, with respect to supercell basis vectors.
+            shape=(n_atoms, 3, 3), dtype='int64'
+        translations : ndarray
+            Translations of the symmetry operations.
+            shape=(n_atoms, 3), dtype='double'
+        grid_points : ndarray
+            Grid points in supercell coordinates.
+            shape=(n_grid_points, 3), dtype='double'
+        fft_mesh : array_like
+            Mesh numbers for primitive cell.
+        p2s_matrix : ndarray
+            Supercell matrix relative to primitive cell.
+        lattice : ndarray
+            Basis vectors of supercell in column vectors.
+            shape=(3, 3)
+
+        """
+        self._dVdu = dVdu
+        self._atom_map = np.array(atom_map, dtype="int64")
+        self._rotations = np.array(rotations, dtype="int64")
+        self._translations = np.array(translations, dtype="double")
+        self._lattice = np.array(lattice, dtype="double")
+        self._lookup = _GridPointLookup(grid_points, fft_mesh, p2s_matrix)
+        self._grid_points = grid_points
+
+    @property
+    def irreducible_dVdu(self) -> NDArray | LazyComplexArray:
+        """Return dV/du of irreducible atoms."""
+        return self._dVdu
+
+    @property
+    def atom_map(self) -> NDArray:
+        """Return indices of irreducible atoms in irreducible_dVdu."""
+        return self._atom_map
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        """Return shape of reconstructed dV/du."""
+        shape = self._dVdu.shape
+        return (shape[0], len(self._atom_map)) + tuple(shape[2:])
+
+    @property
+    def ndim(self) -> int:
+        """Return number of dimensions."""
+        return 4
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Return dtype."""
+        return self._dVdu.dtype
+
+    def __len__(self) -> int:
+        """Return length of the first axis."""
+        return self.shape[0]
+
+    def get_atom(self, i_atom: int) -> NDArray:
+        """Return dV/du of atom at index i_atom.
+
+        Returns
+        -------
+        ndarray
+            shape=(ncdij, 3, n_grid_points)
+
+        """
+        dVdu = np.array(self._dVdu[:, self._atom_map[i_atom]])
+        r = self._rotations[i_atom]
+        t = self._translations[i_atom]
+        if (r == np.eye(3, dtype="int64")).all() and (abs(t) < 1e-8).all():
+            return dVdu
+        grid_points = (self._grid_points - t) @ np.linalg.inv(r).T
+        perm = self._lookup.get_indices(grid_points)
+        if perm is None:
+            raise RuntimeError("Grid points are not invariant by symmetry operation.")
+        r_cart = self._lattice @ r @ np.linalg.inv(self._lattice)
+        dVdu = np.einsum(
+            "ij,sjn->sin", r_cart.astype(dVdu.real.dtype), dVdu[:, :, perm]
+        )
+        if len(dVdu) == 4:
+            rotate_delta_vals_in_spin_space(dVdu, r, self._lattice, out=dVdu)
+        return dVdu
+
+    def __getitem__(self, key) -> NDArray:
+        """Reconstruct selected atoms and return selected part."""
+        if key is Ellipsis:
+            key = ()
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            raise IndexError("Ellipsis is supported only alone.")
+        key = key + (slice(None),) * (self.ndim - len(key))
+        atoms = np.arange(self.shape[1])[key[1]]
+        if atoms.ndim == 0:
+            return self.get_atom(int(atoms))[(key[0],) + key[2:]]
+        values = np.stack([self.get_atom(i) for i in atoms], axis=1)
+        return values[(key[0], slice(None)) + key[2:]]
+
+    def __array__(self, dtype=None, copy=None) -> NDArray:
+        """Reconstruct all and return them."""
+        values = self[...]
+        if dtype is None:
+            return values
+        return values.astype(dtype)
+
+
+class _SharedMemoryBuffer:
+    """Shared memory block viewed as ndarray by np.asarray.
+
+    The ndarray keeps this object as its base, and the shared memory block is
+    closed and unlinked by the creating process when the ndarray and its views
+    are released. Other processes attach to the block by ``name``.
+
+    """
+
+    def __init__(self, shape: tuple[int, ...], dtype: np.dtype | str):
+        dtype = np.dtype(dtype)
+        self._pid = os.getpid()
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize)
+        )
+        address = np.frombuffer(self._shm.buf, dtype="uint8").ctypes.data
+        self.__array_interface__ = {
+            "shape": tuple(shape),
+            "typestr": dtype.str,
+            "data": (address, False),
+            "version": 3,
+        }
+
+    @property
+    def name(self) -> str:
+        """Return name of shared memory block."""
+        return self._shm.name
+
+    def __del__(self):
+        self._shm.close()
+        if os.getpid() == self._pid:
+            self._shm.unlink()
+
+
+# State of worker process used by DLocalPotential._run_in_process_pool.
+_lpi_worker_state: dict = {}
+
+
+def _init_lpi_worker(
+    lpi_args: tuple,
+    lpi_kwargs: dict,
+    V_locs_shm: tuple[str, tuple, str],
+    dVdu_buffer: tuple[str, str, tuple, str],
+    profile: bool,
+):
+    """Initialize worker process by attaching to shared memory blocks.
+
+    ``V_locs_shm`` is (name, shape, dtype) of shared memory block of local
+    potentials. ``dVdu_buffer`` is ("shm", name, shape, dtype) of shared memory block or
+    ("memmap", filename, shape, dtype) of np.memmap file. With ``profile``,
+    costs are recorded by the profiler of the worker.
+
+    """
+    V_locs_name, V_locs_shape, V_locs_dtype = V_locs_shm
+    shm_V_locs = shared_memory.SharedMemory(name=V_locs_name)
+    _lpi_worker_state["shm"] = [shm_V_locs]
+    _lpi_worker_state["V_locs"] = np.ndarray(
+        V_locs_shape, dtype=V_locs_dtype, buffer=shm_V_locs.buf
+    )
+    kind, name, shape, dVdu_dtype = dVdu_buffer
+    if kind == "memmap":
+        _lpi_worker_state["dVdu"] = np.memmap(
+            name, dtype=dVdu_dtype, mode="r+", shape=shape
+        )
+    else:
+        shm_dVdu = shared_memory.SharedMemory(name=name)
+        _lpi_worker_state["shm"].append(shm_dVdu)
+        _lpi_worker_state["dVdu"] = np.ndarray(
+            shape, dtype=dVdu_dtype, buffer=shm_dVdu.buf
+        )
+    _lpi_worker_state["atom_indices"] = lpi_kwargs["atom_indices"]
+    _lpi_worker_state["profiler"] = Profiler() if profile else None
+    _lpi_worker_state["lpi"] = LocalPotentialInterpolationNUFFT(
+        *lpi_args, profiler=_lpi_worker_state["profiler"], **lpi_kwargs
+    )
+
+
+def _run_lpi_worker(disps: list[tuple[int, dict]]) -> tuple[NDArray, list[dict]]:
+    """Compute dV/du of equivalent atoms of one displaced atom in worker.
+
+    Parameters
+    ----------
+    disps : list of tuple
+        Pairs of index of displaced supercell and displacement dict of the
+        displaced atom.
+
+    Returns
+    -------
+    tuple[ndarray, list[dict]]
+        Atom indices whose dV/du were written in shared dV/du, and records of
+        profiler, which are empty without profiling.
+
+    """
+    V_locs = _lpi_worker_state["V_locs"]
+    lpi: LocalPotentialInterpolationNUFFT = _lpi_worker_state["lpi"]
+    profiler: Profiler | None = _lpi_worker_state["profiler"]
+    with profiling_stage(profiler, "displaced_atom", atom=disps[0][1]["number"]):
+        lpi.delta_Vs = [
+            DeltaLocalPotential(V_locs[0], V_locs[i + 1], d) for i, d in disps
+        ]
+        lpi.run()
+        assert lpi.atom_indices_returned is not None
+        atom_indices = _lpi_worker_state["atom_indices"]
+        indices = [
+            np.where(atom_indices == ai)[0][0] for ai in lpi.atom_indices_returned
+        ]
+        _lpi_worker_state["dVdu"][:, indices, :, :] = lpi.dVdu
+        if isinstance(_lpi_worker_state["dVdu"], np.memmap):
+            _lpi_worker_state["dVdu"].flush()
+    lpi.delete_dVdu()
+    lpi.delete_delta_Vs()
+    records = []
+    if profiler is not None:
+        records = profiler.records[:]
+        profiler.records.clear()
+    return lpi.atom_indices_returned, records
+
+
+def _check_precision(precision: str) -> str:
+    if precision not in ("double", "single"):
+        raise ValueError(
+            f'precision has to be "double" or "single", not "{precision}".'
+        )
+    return precision
+
+
+def _get_complex_dtype(precision: str) -> str:
+    """Return complex dtype string of precision, "c16" or "c8"."""
+    return f"c{np.dtype(precision).itemsize * 2}"
+
+
+class DistributionVisualization:
+    """Map of values at grid points of supercell to grid of visualized cell.
+
+    The visualized cell is primitive cell multiplied by three integers so that
+    it contains the supercell, because the grid is defined along primitive
+    cell basis vectors. See _get_multipliticy_for_visualization. The map is
+    computed once and used for any number of distributions, e.g., dV/du of
+    three directions of all atoms.
+
+    Attributes
+    ----------
+    multiplicity : ndarray
+        Multiplicity of primitive cell of visualized cell.
+        shape=(3,), dtype='int64'
+    cell : PhonopyAtoms
+        Visualized cell.
+    shape : tuple[int, int, int]
+        Shape of grid of visualized cell, (nz, ny, nx).
+
+    """
+
+    def __init__(
+        self,
+        pcell: PhonopyAtoms,
+        p2s_matrix: NDArray,
+        fft_mesh: int | float | Sequence | NDArray,
+        grid_points: NDArray,
+    ):
+        """Init method.
+
+        Parameters
+        ----------
+        pcell : PhonopyAtoms
+            Primitive cell.
+        p2s_matrix : ndarray
+            Transformation matrix from primitive cell to supercell.
+        fft_mesh : array_like
+            Mesh numbers of primitive cell.
+        grid_points : ndarray
+            Grid points in supercell coordinates, see get_grid_points.
+            shape=(n_grid_points, 3)
+
+        """
+        plat = pcell.cell.T
+        self._multiplicity = _get_multipliticy_for_visualization(p2s_matrix, plat)
+
+        M = np.dot(np.linalg.inv(p2s_matrix), np.diag(self._multiplicity))
+        M = np.rint(M).astype(int)
+        snf = SNF3x3(M)
+        P_inv = np.linalg.inv(snf.P)
+        diag_A = tuple(np.diagonal(snf.D))
+
+        # Supercell lattice points inside visuzalization cell. Grid points of
+        # supercell + the lattice points are concatenated and transformed to
+        # those in the visualized cell basis.
+        lattice_points = np.dot(list(np.ndindex(diag_A)), P_inv.T)
+        gp_viz = (lattice_points[:, None, :] + grid_points[None, :, :]).reshape(-1, 3)
+        gp_viz = np.dot(gp_viz, np.linalg.inv(M).T)
+
+        # Coordinates are converted to integers.
+        mesh = np.array(fft_mesh * self._multiplicity, dtype="int64")
+        gp_viz = np.rint(gp_viz * mesh).astype("int64") % mesh
+        self._shape = tuple(int(n) for n in mesh[::-1])
+        targets = (gp_viz[:, 2] * mesh[1] + gp_viz[:, 1]) * mesh[0] + gp_viz[:, 0]
+
+        # Index of grid point of supercell of each grid point of visualized
+        # cell.
+        self._indices = np.full(np.prod(mesh), -1, dtype="int64")
+        self._indices[targets] = np.arange(len(targets)) % len(grid_points)
+        n_done = np.count_nonzero(self._indices >= 0)
+        assert n_done == len(self._indices), "%d in %d (%d x %d x %d) are done." % (
+            n_done,
+            len(self._indices),
+            *self._shape,
+        )
+
+        self._cell = get_supercell(pcell, np.diag(self._multiplicity))
+
+    @property
+    def multiplicity(self) -> NDArray:
+        """Return multiplicity of primitive cell of visualized cell."""
+        return self._multiplicity
+
+    @property
+    def cell(self) -> PhonopyAtoms:
+        """Return visualized cell."""
+        return self._cell
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        """Return shape of grid of visualized cell."""
+        return self._shape  # type: ignore[return-value]
+
+    def get_distribution(self, data: NDArray) -> NDArray:
+        """Return values on grid of visualized cell.
+
+        Parameters
+        ----------
+        data : ndarray
+            Values at grid points of supercell. Leading axes are kept, e.g.,
+            for three directions.
+            shape=(..., n_grid_points)
+
+        Returns
+        -------
+        ndarray
+            shape=(..., nz, ny, nx)
+
+        """
+        values = np.asarray(data)
+        return values[..., self._indices].reshape(values.shape[:-1] + self._shape)
+
+    def write(self, filename: str | os.PathLike, data: NDArray):
+        """Write real part of values to file, see write_volumetric_data."""
+        write_volumetric_data(filename, self.get_distribution(data).real, self._cell)
 
 
 def visualize_distribution(
@@ -800,64 +1946,14 @@ def visualize_distribution(
     Note
     ----
     multiplicity is the three integers that simply extend primitive cell. This
-    extended cell includes the supercell. See more detail in
-    _get_multipliticy_for_visualization. This is because the grid is defined
-    along primitive cell basis vectors.
+    extended cell includes the supercell. See DistributionVisualization. To
+    visualize many distributions, DistributionVisualization should be used
+    directly to compute the map of grid points only once.
 
     """
-    plat = pcell.cell.T
-    multiplicity = _get_multipliticy_for_visualization(p2s_matrix, plat)
-
-    M = np.dot(np.linalg.inv(p2s_matrix), np.diag(multiplicity))
-    M = np.rint(M).astype(int)
-    n = int(np.rint(np.linalg.det(M)))
-    d = grid_points.shape[0]
-
-    # Copy grid point coordinates to fill the visualized cell with respect
-    # to the basis vectors of local potential cell.
-    gp_viz = np.zeros((d * n, 3), dtype="double", order="C")
-    snf = SNF3x3(M)
-    snf.run()
-    P_inv = np.linalg.inv(snf.P)
-    diag_A = tuple(np.diagonal(snf.D))
-
-    # Supercell lattice points inside visuzalization cell.
-    # Grid points of supercell + the lattice point is concatenated.
-    for i, lp in enumerate(np.dot(list(np.ndindex(diag_A)), P_inv.T)):
-        gp_viz[(i * d) : ((i + 1) * d), :] = grid_points + lp
-
-    # Grid point coordinates are transformed to those in the visualized cell
-    # basis.
-    M_inv = np.linalg.inv(M)
-    gp_viz = np.dot(gp_viz, M_inv.T)
-
-    # Coordinates are converted to integers.
-    multi_to_int = fft_mesh * multiplicity
-    gp_viz *= multi_to_int
-    gp_viz = np.rint(gp_viz).astype(int) % multi_to_int
-    shape = tuple(fft_mesh * multiplicity)[::-1]
-    dV_viz = np.zeros(shape, dtype=data.dtype, order="C")
-    done = np.zeros(shape, dtype=int, order="C")
-
-    n_ip = len(data)
-    for i, index in enumerate(gp_viz):
-        dV_viz[tuple(index[::-1])] = data[i % n_ip]
-        done[tuple(index[::-1])] = 1
-
-    assert (done == 1).all(), "%d in %d (%d x %d x %d) are done." % (
-        done.sum(),
-        np.prod(done.shape),
-        *done.shape,
-    )
-
-    scell = get_supercell(pcell, np.diag(multiplicity))
-    header = "\n".join(get_vasp_structure_lines(scell))
-    locpot = get_CHGCAR(dV_viz.real, header)  # type: ignore
-
-    with open(filename, "w") as w:
-        w.write(locpot)
-
-    return multiplicity
+    viz = DistributionVisualization(pcell, p2s_matrix, fft_mesh, grid_points)
+    viz.write(filename, data)
+    return viz.multiplicity
 
 
 def collect_site_symmetry_operations(
@@ -911,6 +2007,7 @@ def get_displacements_with_rotations(
     rotations: NDArray,
     lattice: NDArray,
     delta_vals: list[DeltaLocalPotential] | list[DeltaDijQij],
+    r_carts: NDArray | None = None,
 ) -> NDArray:
     """Rotate displacements by site-symmetry actively.
 
@@ -921,26 +2018,111 @@ def get_displacements_with_rotations(
             for r in sitesym:
                 disps.append(dot(r, calc_disp_dir))
 
+    Parameters
+    ----------
+    r_carts : ndarray, optional
+        Rotation matrices of ``rotations`` in Cartesian coordinates. Computed
+        from ``rotations`` and ``lattice`` unless given.
+        shape=(len(rotations), 3, 3)
+
     Returns
     -------
     disps : ndarray
         shape=(calc_disp_dir * sitesyms, 3)
 
     """
-    disps = np.zeros((len(rotations) * len(delta_vals), 3), dtype="double", order="C")
-    count = 0
-    for delta_V in delta_vals:
-        disp = delta_V.displacement["displacement"]
-        for r in rotations:
-            r_cart = similarity_transformation(lattice, r)
-            disps[count] = np.dot(r_cart, disp)
-            count += 1
-    return disps
+    if r_carts is None:
+        r_carts = lattice @ rotations @ np.linalg.inv(lattice)
+    calc_disps = np.array(
+        [delta_V.displacement["displacement"] for delta_V in delta_vals],
+        dtype="double",
+    )
+    disps = np.einsum("rij,dj->dri", r_carts, calc_disps)
+    return np.array(disps.reshape(-1, 3), dtype="double", order="C")
+
+
+def get_snapshot_displacements_with_rotations(
+    delta_vals: list[DeltaLocalPotential] | list[DeltaDijQij],
+    permutations: NDArray,
+    r_carts: NDArray,
+) -> NDArray:
+    """Rotate displacements of all atoms of snapshots by symmetry operations.
+
+    By a symmetry operation, displacement u of atom j is rotated actively to
+    R u of the atom to which atom j is sent. Displacements are stored in the
+    following order:
+
+        disps = []
+        for snapshot in snapshots:
+            for r, perm in zip(rotations, permutations):
+                disps.append(rotated displacements of all atoms)
+
+    Parameters
+    ----------
+    delta_vals : list of DeltaLocalPotential or DeltaDijQij
+        ``displacement`` of each has key "displacements" of displacements of
+        all atoms in Cartesian coordinates of shape=(natom, 3).
+    permutations : ndarray
+        Atomic permutations of symmetry operations, where atom j is sent to
+        atom permutations[i_op, j].
+        shape=(n_ops, natom)
+    r_carts : ndarray
+        Rotation matrices of the symmetry operations in Cartesian coordinates.
+        shape=(n_ops, 3, 3)
+
+    Returns
+    -------
+    disps : ndarray
+        shape=(snapshots * n_ops, natom * 3)
+
+    """
+    snapshot_disps = np.array(
+        [delta_val.displacement["displacements"] for delta_val in delta_vals],
+        dtype="double",
+    )
+    n_ops, natom = permutations.shape
+    disps = np.zeros((len(snapshot_disps), n_ops, natom, 3), dtype="double")
+    disps[:, np.arange(n_ops)[:, None], permutations] = np.einsum(
+        "rij,snj->srni", r_carts, snapshot_disps
+    )
+    return disps.reshape(-1, natom * 3)
+
+
+def get_snapshot_displacements_pinv(disps: NDArray, atom_indices: NDArray) -> NDArray:
+    """Return rows of pseudo-inverse of snapshot displacements of atoms.
+
+    Parameters
+    ----------
+    disps : ndarray
+        See get_snapshot_displacements_with_rotations.
+        shape=(n_rows, natom * 3)
+    atom_indices : ndarray
+        Atoms whose rows are returned.
+
+    Returns
+    -------
+    ndarray
+        shape=(len(atom_indices) * 3, n_rows)
+
+    """
+    natom = disps.shape[1] // 3
+    if np.linalg.matrix_rank(disps) < natom * 3:
+        raise RuntimeError(
+            "Displacements of snapshots rotated by symmetry operations do not "
+            "span all directions of atomic displacements. More snapshots are "
+            "necessary."
+        )
+    disps_inv = np.linalg.pinv(disps).reshape(natom, 3, -1)[atom_indices]
+    return np.array(disps_inv.reshape(-1, disps.shape[0]), order="C")
 
 
 def rotate_delta_vals_in_spin_space(
-    delta_vals_rotated: list[NDArray], r: NDArray, lattice: NDArray
-) -> list[NDArray]:
+    delta_vals_rotated: list[NDArray] | NDArray,
+    r: NDArray,
+    lattice: NDArray,
+    Delta: NDArray | None = None,
+    out: NDArray | None = None,
+) -> NDArray:
     r"""Take linear combination of delta vals with spin rotation matrix.
 
     In this method A B A^+ is computed, where A is the 2x2 rotation matrix of
@@ -955,33 +2137,51 @@ def rotate_delta_vals_in_spin_space(
 
     cdij=[1, 2, 3, 4] -> [11, 12, 21, 22].
 
-    SpinorRotationMatrices.Delta is a 2x2 numpy array.
+    SpinorRotationMatrices.Delta is a 2x2 numpy array. The four components are
+    viewed as 2x2 matrix of shape=(2, 2, N) and A B A^+ is computed by two
+    tensor contractions.
 
     Parameters
     ----------
-    delta_vals_rotated : list[NDArray]
+    delta_vals_rotated : list[NDArray] or ndarray
         Rotated delta local potential or delta-Dijqij.
+        shape=(4, ...)
     lattice : ndarray.
         Basis vectors of supercell in column vectors.
         shape=(3, 3)
     r : ndarray
         Rotation matrix wrt basis vectors (not Cartesian).
         shape=(3, 3).
+    Delta : ndarray, optional
+        Precomputed SpinorRotationMatrices.Delta of r, e.g., by
+        SymmetryRotationTable. Computed from r and lattice unless given.
+    out : ndarray, optional
+        Buffer to store the result. This can be ``delta_vals_rotated`` itself
+        to rotate in place. It has to be reshapable to (2, 2, N) without copy.
+        shape=(4, ...)
+
+    Returns
+    -------
+    ndarray
+        Delta vals rotated in spin space.
+        shape=(4, ...)
 
     """
-    srm = SpinorRotationMatrices(r, lattice).run()
-    assert srm.Delta.shape == (2, 2)
-
-    delta_vals_spinor_rotated = [np.zeros_like(delta_vals_rotated[0]) for _ in range(4)]
-    for i_sp in (0, 1):
-        for i_s in (0, 1):
-            for i_s1 in (0, 1):
-                for i_s2 in (0, 1):
-                    d_d = srm.Delta[i_sp, i_s1] * srm.Delta.T.conj()[i_s2, i_s]
-                    delta_vals_spinor_rotated[i_sp * 2 + i_s] += (
-                        d_d * delta_vals_rotated[i_s1 * 2 + i_s2]
-                    )
-    return delta_vals_spinor_rotated
+    if Delta is None:
+        Delta = SpinorRotationMatrices(r, lattice).run().Delta
+    assert Delta.shape == (2, 2)
+
+    vals = np.asarray(delta_vals_rotated)
+    assert len(vals) == 4
+    _Delta = np.asarray(Delta, dtype=vals.dtype)
+    A_B = np.einsum("ab,bcN->acN", _Delta, vals.reshape(2, 2, -1))
+    if out is None:
+        out = np.empty_like(vals)
+    out_view = out.reshape(2, 2, -1)
+    if not np.shares_memory(out_view, out):
+        raise ValueError("out has to be reshapable to (2, 2, N) without copy.")
+    np.einsum("acN,dc->adN", A_B, _Delta.conj(), out=out_view)
+    return out
 
 
 def get_grid_points(
@@ -1048,6 +2248,123 @@ def get_grid_points(
     return gp_super, lattice_points
 
 
+def get_dVdu_symmetry_reduction(
+    fft_mesh: Sequence[int] | NDArray,
+    p2s_matrix: NDArray,
+    grid_points: NDArray,
+    symmetry: Symmetry,
+    atom_indices: NDArray,
+) -> tuple[NDArray, NDArray, NDArray, NDArray]:
+    """Return irreducible atoms of dV/du and symmetry operations to the others.
+
+    Each atom in atom_indices is mapped to an earlier irreducible atom by a
+    symmetry operation that sends the irreducible atom to the atom and maps the
+    grid points onto themselves. Atoms that can not be mapped in this way are
+    irreducible. See SymmetryReducedDVdu.
+
+    Returns
+    -------
+    irreducible_atoms : ndarray
+        Indices of irreducible atoms in atom_indices.
+        shape=(n_irreducible_atoms,), dtype='int64'
+    atom_map : ndarray
+        Indices of irreducible atoms in irreducible_atoms for atoms.
+        shape=(len(atom_indices),), dtype='int64'
+    rotations : ndarray
+        Rotation matrices of symmetry operations. Identity for irreducible
+        atoms.
+        shape=(len(atom_indices), 3, 3), dtype='int64'
+    translations : ndarray
+        Translations of symmetry operations.
+        shape=(len(atom_indices), 3), dtype='double'
+
+    """
+    lookup = _GridPointLookup(grid_points, fft_mesh, p2s_matrix)
+    ops = symmetry.symmetry_operations
+    perms = symmetry.atomic_permutations
+    map_atoms = symmetry.get_map_atoms()
+    n_atoms = len(atom_indices)
+    irreducible_atoms: list[int] = []
+    atom_map = np.zeros(n_atoms, dtype="int64")
+    rotations = np.tile(np.eye(3, dtype="int64"), (n_atoms, 1, 1))
+    translations = np.zeros((n_atoms, 3), dtype="double")
+    for i, atom in enumerate(atom_indices):
+        for i_irr, j in enumerate(irreducible_atoms):
+            if map_atoms[atom_indices[j]] != map_atoms[atom]:
+                continue
+            i_op = _find_grid_point_invariant_operation(
+                grid_points, lookup, ops, np.where(perms[:, atom_indices[j]] == atom)[0]
+            )
+            if i_op is not None:
+                atom_map[i] = i_irr
+                rotations[i] = ops["rotations"][i_op]
+                translations[i] = ops["translations"][i_op]
+                break
+        else:
+            atom_map[i] = len(irreducible_atoms)
+            irreducible_atoms.append(i)
+    return (
+        np.array(irreducible_atoms, dtype="int64"),
+        atom_map,
+        rotations,
+        translations,
+    )
+
+
+def _find_grid_point_invariant_operation(
+    grid_points: NDArray, lookup: _GridPointLookup, ops: dict, op_indices: NDArray
+) -> int | None:
+    """Return first operation that maps grid points onto themselves."""
+    for i_op in op_indices:
+        r_inv = np.linalg.inv(ops["rotations"][i_op])
+        points = (grid_points - ops["translations"][i_op]) @ r_inv.T
+        if lookup.get_indices(points) is not None:
+            return int(i_op)
+    return None
+
+
+class _GridPointLookup:
+    """Find indices of points among grid points in supercell.
+
+    Grid points in supercell coordinates are integers when multiplied by
+    S = |det(p2s_matrix)| * lcm(fft_mesh). Points are identified by these
+    integers modulo S.
+
+    """
+
+    def __init__(
+        self,
+        grid_points: NDArray,
+        fft_mesh: Sequence[int] | NDArray,
+        p2s_matrix: NDArray,
+    ):
+        self._scale = int(abs(determinant(p2s_matrix)) * np.lcm.reduce(fft_mesh))
+        keys = self._get_keys(grid_points)
+        assert keys is not None
+        self._order = np.argsort(keys)
+        self._sorted_keys = keys[self._order]
+
+    def get_indices(self, points: NDArray) -> NDArray | None:
+        """Return indices of points in grid points, or None if not all found."""
+        keys = self._get_keys(points)
+        if keys is None:
+            return None
+        pos = np.searchsorted(self._sorted_keys, keys)
+        pos[pos == len(pos)] = 0
+        if (self._sorted_keys[pos] != keys).any():
+            return None
+        return self._order[pos]
+
+    def _get_keys(self, points: NDArray) -> NDArray | None:
+        S = self._scale
+        scaled = points * S
+        q = np.rint(scaled)
+        if (abs(scaled - q) > 1e-6).any():
+            return None
+        q = q.astype("int64") % S
+        return (q[:, 0] * S + q[:, 1]) * S + q[:, 2]
+
+
 def _get_multipliticy_for_visualization(
     p2s_matrix: NDArray, prim_lattice: NDArray
 ) -> NDArray:
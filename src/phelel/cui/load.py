@@ -17,6 +17,7 @@ from phelel import Phelel
 from phelel.file_IO import read_phelel_params_hdf5
 from phelel.interface.phelel_yaml import PhelelYaml
 from phelel.interface.vasp.derivatives import read_files
+from phelel.utils.profiler import Profiler
 
 
 def load(
@@ -40,6 +41,9 @@ def load(
     subtract_rfs: bool = True,
     symprec: float = 1e-5,
     is_symmetry: bool = True,
+    precision: Literal["double", "single"] = "double",
+    dDijdu_cutoff_radius: float | None = None,
+    profiler: Profiler | None = None,
     log_level: int = 0,
 ) -> Phelel:
     """Loader function.
@@ -100,6 +104,15 @@ def load(
         is 1e-5.
     is_symmetry : bool, optional
         Use crystal symmetry or not. Default is True.
+    precision : str, optional
+        "double" or "single". Precision of dV/du calculation and storage.
+        Default is "double".
+    dDijdu_cutoff_radius : float, optional
+        Distance from atoms in derivatives within which dDij/du and dqij/du
+        are computed and stored. Default is None, which means all atoms.
+    profiler : Profiler, optional
+        Profiler to record computational costs of derivatives calculations.
+        Default is None.
     log_level : int, optional
         Log level. 0 is most quiet. Default is 0.
 
@@ -142,6 +155,9 @@ def load(
         fft_mesh=fft_mesh,
         symprec=symprec,
         is_symmetry=is_symmetry,
+        precision=precision,
+        dDijdu_cutoff_radius=dDijdu_cutoff_radius,
+        profiler=profiler,
         log_level=log_level,
     )
     if dataset:
@@ -172,6 +188,7 @@ def load(
             dir_names,
             phonon_dir_names=phonon_dir_names,
             subtract_rfs=subtract_rfs,
+            profiler=profiler,
             log_level=log_level,
         )
         if phelel.fft_mesh is not None:
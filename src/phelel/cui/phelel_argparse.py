@@ -37,6 +37,26 @@ def get_parser(load_phelel_yaml=False):
             "and displacement supercells are given as arguments."
         ),
     )
+    parser.add_argument(
+        "--checkpoint",
+        dest="checkpoint",
+        action="store_true",
+        default=None,
+        help=(
+            "Write derivatives of each displaced atom to phelel_checkpoint.hdf5 "
+            "and skip those found in it"
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        default=None,
+        help=(
+            "Record computational costs of stages of derivatives calculation "
+            "and write them to phelel_profile.json"
+        ),
+    )
     if load_phelel_yaml:
         parser.add_argument(
             "--config",
@@ -86,6 +106,22 @@ def get_parser(load_phelel_yaml=False):
         default=None,
         help="Accuracy of finufft interpolation (default=1e-6)",
     )
+    parser.add_argument(
+        "--precision",
+        dest="precision",
+        choices=["double", "single"],
+        default=None,
+        help="Precision of dV/du calculation and storage (default=double)",
+    )
+    parser.add_argument(
+        "--hdf5-compression",
+        dest="hdf5_compression",
+        default=None,
+        help=(
+            "Compression of derivatives in phelel_params.hdf5, gzip, lzf, blosc, "
+            "or gzip level (default: none)"
+        ),
+    )
     parser.add_argument(
         "--loglevel",
         dest="log_level",
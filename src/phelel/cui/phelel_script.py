@@ -25,6 +25,7 @@ from phelel.cui.phelel_argparse import get_parser
 from phelel.cui.settings import PhelelConfParser
 from phelel.interface.phelel_yaml import PhelelYaml
 from phelel.interface.vasp.derivatives import create_derivatives
+from phelel.utils.profiler import Profiler
 
 
 # AA is created at http://www.network-science.de/ascii/.
@@ -174,6 +175,8 @@ def main(**argparse_control):
         symprec=symprec,
         is_symmetry=settings.is_symmetry,
         finufft_eps=settings.finufft_eps,
+        precision=settings.precision,
+        profiler=Profiler() if settings.profile else None,
     )
     if phonon_supercell_matrix is not None:
         assert phelel.phonon_supercell_matrix is not None
@@ -218,7 +221,10 @@ def main(**argparse_control):
     # Create dV/du, dDij/du, dqij/du #
     ##################################
     if True:
-        if phelel.dataset is None or "first_atoms" not in phelel.dataset:
+        if phelel.dataset is None or (
+            "first_atoms" not in phelel.dataset
+            and "displacements" not in phelel.dataset
+        ):
             if cell_info.phelel_yaml is not None:
                 phe_yml = cell_info.phelel_yaml
             else:
@@ -254,16 +260,31 @@ def main(**argparse_control):
                 )
 
         if settings.create_derivatives:
+            checkpoint = "phelel_checkpoint.hdf5" if settings.checkpoint else None
             create_derivatives(
                 phelel,
                 settings.create_derivatives,
                 subtract_rfs=settings.subtract_rfs,
+                checkpoint=checkpoint,
                 log_level=log_level,
             )
             if phelel.fft_mesh is not None:
-                phelel.save_hdf5(filename="phelel_params.hdf5")
+                phelel.save_hdf5(
+                    filename="phelel_params.hdf5",
+                    compression=settings.hdf5_compression,
+                )
                 if log_level > 0:
                     print('"phelel_params.hdf5" has been created.')
+                if checkpoint is not None and pathlib.Path(checkpoint).exists():
+                    pathlib.Path(checkpoint).unlink()
+                    if log_level > 0:
+                        print(f'"{checkpoint}" has been removed.')
+            if phelel.profiler is not None:
+                phelel.profiler.write_json("phelel_profile.json")
+                if log_level > 0:
+                    print("")
+                    print(phelel.profiler)
+                    print('"phelel_profile.json" has been created.')
             print_end()
             sys.exit(0)
 
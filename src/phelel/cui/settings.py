@@ -15,11 +15,16 @@ class PhelelSettings(Settings):
     def __init__(self):
         """Init method."""
         super().__init__(load_phonopy_yaml=False)
+        self.checkpoint = False
         self.create_derivatives = None
         self.fft_mesh_numbers = None
         self.finufft_eps = None
         self.grid_points = None
+        # phelel_params.hdf5 is not compressed unless specified.
+        self.hdf5_compression = None
         self.phonon_supercell_matrix = None
+        self.precision = "double"
+        self.profile = False
         self.subtract_rfs = False
 
 
@@ -43,6 +48,9 @@ class PhelelConfParser(ConfParser):
 
     def _read_options(self, args: argparse.Namespace):
         super()._read_options(args)  # store data in self._confs
+        if "checkpoint" in args:
+            if args.checkpoint:
+                self._confs["checkpoint"] = ".true."
         if "create_derivatives" in args:
             if args.create_derivatives:
                 dir_names = args.create_derivatives
@@ -53,6 +61,12 @@ class PhelelConfParser(ConfParser):
         if "finufft_eps" in args:
             if args.finufft_eps is not None:
                 self._confs["finufft_eps"] = args.finufft_eps
+        if "precision" in args:
+            if args.precision is not None:
+                self._confs["precision"] = args.precision
+        if "profile" in args:
+            if args.profile:
+                self._confs["profile"] = ".true."
         if "phonon_supercell_dimension" in args:
             dim_phonon = args.phonon_supercell_dimension
             if dim_phonon is not None:
@@ -66,6 +80,10 @@ class PhelelConfParser(ConfParser):
         confs = self._confs
 
         for conf_key in confs.keys():
+            if conf_key == "checkpoint":
+                if confs["checkpoint"].lower() == ".true.":
+                    self._set_parameter("checkpoint", True)
+
             if conf_key == "create_derivatives":
                 self._set_parameter(
                     "create_derivatives", confs["create_derivatives"].split()
@@ -102,6 +120,17 @@ class PhelelConfParser(ConfParser):
             if conf_key == "finufft_eps":
                 self._set_parameter("finufft_eps", confs["finufft_eps"])
 
+            if conf_key == "precision":
+                precision = confs["precision"].lower()
+                if precision in ("double", "single"):
+                    self._set_parameter("precision", precision)
+                else:
+                    self.setting_error('PRECISION has to be "double" or "single".')
+
+            if conf_key == "profile":
+                if confs["profile"].lower() == ".true.":
+                    self._set_parameter("profile", True)
+
             if conf_key == "subtract_rfs":
                 if confs["subtract_rfs"] == ".true.":
                     self._set_parameter("subtract_rfs", True)
@@ -110,6 +139,10 @@ class PhelelConfParser(ConfParser):
         super()._set_settings(settings)
         params = self._parameters
 
+        if "checkpoint" in params:
+            if params["checkpoint"]:
+                settings.checkpoint = params["checkpoint"]
+
         if "create_derivatives" in params:
             if params["create_derivatives"]:
                 settings.create_derivatives = params["create_derivatives"]
@@ -125,6 +158,14 @@ class PhelelConfParser(ConfParser):
             if params["finufft_eps"]:
                 settings.finufft_eps = params["finufft_eps"]
 
+        if "precision" in params:
+            if params["precision"]:
+                settings.precision = params["precision"]
+
+        if "profile" in params:
+            if params["profile"]:
+                settings.profile = params["profile"]
+
         if "subtract_rfs" in params:
             if params["subtract_rfs"]:
                 settings.subtract_rfs = params["subtract_rfs"]
@@ -5,6 +5,8 @@ from __future__ import annotations
 import os
 import pathlib
 import warnings
+from collections.abc import Sequence
+from typing import Literal
 
 import h5py
 import numpy as np
@@ -14,9 +16,13 @@ from phonopy.structure.cells import Primitive, dense_to_sparse_svecs
 from phonopy.structure.symmetry import Symmetry
 from spglib import SpglibDataset, SpglibMagneticDataset
 
-from phelel.base.Dij_qij import DDijQij
-from phelel.base.local_potential import DLocalPotential
-from phelel.utils.data import cmplx2real
+from phelel.base.Dij_qij import DDijQij, DDijQijNeighborArray
+from phelel.base.local_potential import (
+    DLocalPotential,
+    SymmetryReducedDVdu,
+    get_dVdu_symmetry_reduction,
+)
+from phelel.utils.data import LazyComplexArray, cmplx2real, real2cmplx
 from phelel.utils.lattice_points import get_lattice_points
 
 
@@ -39,8 +45,22 @@ def write_phelel_params_hdf5(
     nac_params: dict | None = None,
     symmetry_dataset: SpglibDataset | SpglibMagneticDataset | None = None,
     filename="phelel_params.hdf5",
+    reduce_by_symmetry: bool = False,
+    compression: Literal["gzip", "lzf", "blosc"] | int | None = None,
 ):
-    """Write phelel_params.hdf5."""
+    """Write phelel_params.hdf5.
+
+    With reduce_by_symmetry=True, dV/du and dmu/du are written only for
+    symmetrically irreducible atoms with the symmetry operations to
+    reconstruct those of the other atoms. See SymmetryReducedDVdu.
+
+    With compression, dV/du, dmu/du, dDij/du, and dqij/du are written in chunks
+    of (atom, direction) slices compressed with shuffle filter. An integer
+    means gzip of the compression level. "blosc" requires hdf5plugin, which
+    has to be importable also when reading the file. The datasets are read in
+    the same way as uncompressed ones.
+
+    """
     with h5py.File(filename, "w") as w:
         _add_datasets(
             w,
@@ -60,6 +80,8 @@ def write_phelel_params_hdf5(
             phonon_supercell=phonon_supercell,
             nac_params=nac_params,
             symmetry_dataset=symmetry_dataset,
+            reduce_by_symmetry=reduce_by_symmetry,
+            compression=compression,
         )
 
 
@@ -88,6 +110,7 @@ def write_dVdu_hdf5(
 def read_phelel_params_hdf5(
     filename: str | os.PathLike = "phelel_params.hdf5",
     log_level: int = 0,
+    lazy: bool = False,
 ) -> tuple[DLocalPotential, DDijQij, np.ndarray, np.ndarray]:
     """Read dV/du and dDij/du from phelel_params.hdf5.
 
@@ -97,6 +120,14 @@ def read_phelel_params_hdf5(
         File name of phelel_params.hdf5.
     log_level : int
         Log level.
+    lazy : bool, optional
+        When True, the file is kept open, and dV/du, dDij/du, dqij/du are
+        returned as LazyComplexArray and force constants as h5py dataset. Only
+        the selected part, e.g., ``dVdu_obj.dVdu[:, i_atom]``, is read from the
+        file. Default is False.
+
+    dV/du is returned as SymmetryReducedDVdu when the file was written with
+    reduce_by_symmetry=True.
 
     Returns
     -------
@@ -107,39 +138,39 @@ def read_phelel_params_hdf5(
         fc : np.ndarray, optional
 
     """
-    if pathlib.Path(filename).exists():
+    if not pathlib.Path(filename).exists():
+        raise FileNotFoundError(f'"{filename}" was not found.')
+
+    _register_hdf5plugin_filters()
+    if lazy:
+        # File is closed when all the datasets are released.
+        f = h5py.File(filename, "r")
+        fft_mesh, dVdu, grid_points, lattice_points = read_dVdu_hdf5(f, lazy=True)
+        dDijdu, dqijdu, Dij, qij = read_dDijdu_hdf5(f, lazy=True)
+        fc = read_force_constants_hdf5(f, lazy=True)
+        supercell, atom_indices, p2s_matrix = _read_cell_info_hdf5(f)
+        symmetry_map = _read_dVdu_symmetry_map(f)
+    else:
         with h5py.File(filename, "r") as f:
             fft_mesh, dVdu, grid_points, lattice_points = read_dVdu_hdf5(f)
             dDijdu, dqijdu, Dij, qij = read_dDijdu_hdf5(f)
             fc = read_force_constants_hdf5(f)
-            supercell = PhonopyAtoms(
-                cell=f["supercell_lattice"][:].T,
-                scaled_positions=f["supercell_positions"][:],
-                symbols=[
-                    get_atomic_data().atom_data[n][1] for n in f["supercell_numbers"][:]
-                ],
-                masses=f["supercell_masses"][:],
-            )
-            symmetry = Symmetry(supercell)
-            if "atom_indices_in_derivatives" in f:
-                atom_indices = f["atom_indices_in_derivatives"][:]
-            else:
-                atom_indices = f["p2s_map"][:]
-            if "primitive_matrix" in f:
-                pmat = f["primitive_matrix"][:]
-            else:
-                pmat = (
-                    np.linalg.inv(f["supercell_lattice"][:]) @ f["primitive_lattice"][:]
-                )
-            p2s_mat_float = np.linalg.inv(pmat)
-            p2s_matrix = np.rint(p2s_mat_float).astype("int64")
-            assert (abs(p2s_matrix - p2s_mat_float) < 1e-5).all()
+            supercell, atom_indices, p2s_matrix = _read_cell_info_hdf5(f)
+            symmetry_map = _read_dVdu_symmetry_map(f)
+    symmetry = Symmetry(supercell)
+    if symmetry_map is not None:
+        dVdu = SymmetryReducedDVdu(
+            dVdu,
+            *symmetry_map,
+            grid_points,
+            fft_mesh,
+            p2s_matrix,
+            supercell.cell.T,
+        )
 
-        if log_level:
-            print(f'dV/du was read from "{filename}".')
-            print(f'dDij/du was read from "{filename}".')
-    else:
-        raise FileNotFoundError(f'"{filename}" was not found.')
+    if log_level:
+        print(f'dV/du was read from "{filename}".')
+        print(f'dDij/du was read from "{filename}".')
 
     dDVdu_obj = DLocalPotential(
         fft_mesh,
@@ -147,8 +178,10 @@ def read_phelel_params_hdf5(
         supercell,
         symmetry=symmetry,
         atom_indices=atom_indices,
+        precision="single" if dVdu.dtype == np.complex64 else "double",
     )
-    dDVdu_obj.dVdu = dVdu
+    # dV/du read from the file is owned by dDVdu_obj.
+    dDVdu_obj.set_dVdu(dVdu, copy=False)
     dDVdu_obj.grid_points = grid_points
     dDVdu_obj.lattice_points = lattice_points
 
@@ -171,29 +204,350 @@ def write_dDijdu_hdf5(dDijdu, filename="dDijdu.hdf5"):
         _add_datasets(w, dDijdu=dDijdu)
 
 
-def read_force_constants_hdf5(f):
-    """Read force_constants from hdf5 file object."""
+class DerivativesCheckpoint:
+    """Checkpoint file of derivatives computed displaced atom by displaced atom.
+
+    Slices of derivatives, e.g., dV/du, at atoms are written to the HDF5 file
+    as soon as they are computed, and the atoms are recorded as completed.
+    The file is opened only during each write so that the data written before
+    the process is killed remain readable. At restart, completed slices are
+    restored and the corresponding displaced atoms are skipped.
+
+    Derivatives are stored with their names, e.g., "dVdu", as complex arrays
+    of shape=(ncdij, atom_indices, ...), and the flags of completed atoms as
+    "{name}_completed".
+
+    Displacement dataset, FFT mesh, and supercell lattice of the calculation
+    are stored in "fingerprint" group at the first write. A checkpoint file
+    written for a different calculation is rejected by RuntimeError, since the
+    file name is usually fixed and a file left by an aborted run would
+    otherwise be mixed into a new calculation.
+
+    """
+
+    def __init__(
+        self,
+        filename: str | os.PathLike = "phelel_checkpoint.hdf5",
+        dataset: dict | None = None,
+        fft_mesh: Sequence[int] | NDArray | None = None,
+        lattice: NDArray | None = None,
+    ):
+        """Init method.
+
+        Parameters
+        ----------
+        filename : str or os.PathLike, optional
+            Checkpoint file name. Default is "phelel_checkpoint.hdf5". The file
+            is created at the first write when it does not exist.
+        dataset : dict, optional
+            Displacement dataset of phonopy of type-1 ("first_atoms") or
+            type-2 ("displacements").
+        fft_mesh : array_like, optional
+            FFT mesh of dV/du interpolation.
+        lattice : ndarray, optional
+            Basis vectors of supercell in column vectors.
+            shape=(3, 3)
+
+        """
+        self._filename = filename
+        self._fingerprint: dict[str, NDArray] = {}
+        if dataset is not None:
+            if "first_atoms" in dataset:
+                self._fingerprint["displaced_atoms"] = np.array(
+                    [d["number"] for d in dataset["first_atoms"]], dtype="int64"
+                )
+                self._fingerprint["displacements"] = np.array(
+                    [d["displacement"] for d in dataset["first_atoms"]],
+                    dtype="double",
+                )
+            else:
+                self._fingerprint["displacements"] = np.array(
+                    dataset["displacements"], dtype="double"
+                )
+        if fft_mesh is not None:
+            self._fingerprint["fft_mesh"] = np.array(fft_mesh, dtype="int64")
+        if lattice is not None:
+            self._fingerprint["lattice"] = np.array(lattice, dtype="double")
+
+    @property
+    def filename(self) -> str | os.PathLike:
+        """Return checkpoint file name."""
+        return self._filename
+
+    def restore(self, name: str, array: NDArray, atom_indices: NDArray) -> NDArray:
+        """Copy completed slices in checkpoint file to array.
+
+        Parameters
+        ----------
+        name : str
+            Name of derivative, e.g., "dVdu".
+        array : ndarray
+            Array to which completed slices are copied.
+            shape=(ncdij, atom_indices, ...)
+        atom_indices : ndarray
+            Atom indices in supercell corresponding to the second axis of array.
+
+        Returns
+        -------
+        ndarray
+            Flags of completed atoms.
+            shape=(len(atom_indices),), dtype=bool
+
+        """
+        completed = np.zeros(len(atom_indices), dtype=bool)
+        if not pathlib.Path(self._filename).exists():
+            return completed
+        with h5py.File(self._filename, "r") as f:
+            self._check_fingerprint(f)
+            if name not in f:
+                return completed
+            if (
+                f[name].shape != array.shape
+                or f[name].dtype != array.dtype
+                or not np.array_equal(f["atom_indices"][:], atom_indices)
+            ):
+                raise RuntimeError(
+                    f'Checkpoint "{name}" in "{self._filename}" is inconsistent '
+                    "with the current calculation."
+                )
+            completed[:] = f[f"{name}_completed"][:]
+            for i in np.nonzero(completed)[0]:
+                array[:, i] = f[name][:, i]
+        return completed
+
+    def write(
+        self,
+        name: str,
+        array: NDArray,
+        atom_indices: NDArray,
+        indices: Sequence[int] | NDArray,
+    ):
+        """Write slices of array and record them as completed.
+
+        Parameters
+        ----------
+        name : str
+            Name of derivative, e.g., "dVdu".
+        array : ndarray
+            Array whose slices array[:, indices] are written.
+            shape=(ncdij, atom_indices, ...)
+        atom_indices : ndarray
+            Atom indices in supercell corresponding to the second axis of array.
+        indices : array_like
+            Indices of the second axis of array to be written.
+
+        """
+        with h5py.File(self._filename, "a") as f:
+            if "atom_indices" not in f:
+                f.create_dataset("atom_indices", data=np.array(atom_indices))
+                for key, value in self._fingerprint.items():
+                    f.create_dataset(f"fingerprint/{key}", data=value)
+            self._check_fingerprint(f)
+            if name not in f:
+                f.create_dataset(name, shape=array.shape, dtype=array.dtype)
+                f.create_dataset(
+                    f"{name}_completed", data=np.zeros(array.shape[1], dtype=bool)
+                )
+            for i in indices:
+                f[name][:, i] = array[:, i]
+            # Flags are set after the data are written.
+            completed = f[f"{name}_completed"][:]
+            completed[list(indices)] = True
+            f[f"{name}_completed"][:] = completed
+
+    def _check_fingerprint(self, f: h5py.File):
+        """Raise RuntimeError unless fingerprint in file agrees with this."""
+        for key, value in self._fingerprint.items():
+            path = f"fingerprint/{key}"
+            if (
+                path not in f
+                or f[path].shape != value.shape
+                or not np.allclose(f[path][:], value, rtol=0, atol=1e-8)
+            ):
+                raise RuntimeError(
+                    f'Checkpoint in "{self._filename}" was not written for the '
+                    f"current calculation ({key} differs). Remove the file to "
+                    "start over."
+                )
+
+
+def read_force_constants_hdf5(f, lazy: bool = False):
+    """Read force_constants from hdf5 file object.
+
+    h5py dataset is returned when lazy=True. None is returned when force
+    constants are not stored.
+
+    """
+    if "force_constants" not in f:
+        return None
+    if lazy:
+        return f["force_constants"]
     return f["force_constants"][:]
 
 
-def read_dVdu_hdf5(f):
-    """Read dVdu from hdf5 file object."""
+def read_dVdu_hdf5(f, lazy: bool = False):
+    """Read dVdu from hdf5 file object.
+
+    dVdu is returned as complex array. It is LazyComplexArray when lazy=True.
+
+    """
     fft_mesh = f["FFT_mesh"][:]
-    dVdu = f["dVdu"][:]
+    if lazy:
+        dVdu = LazyComplexArray(f["dVdu"])
+    else:
+        # Read into complex array directly to avoid extra copy.
+        dtype = "c%d" % (f["dVdu"].dtype.itemsize * 2)
+        dVdu = np.empty(f["dVdu"].shape[:-1], dtype=dtype)
+        f["dVdu"].read_direct(cmplx2real(dVdu))
     grid_points = f["grid_point"][:]
     lattice_points = f["lattice_point"][:]
     return fft_mesh, dVdu, grid_points, lattice_points
 
 
-def read_dDijdu_hdf5(f):
-    """Read dDijdu from hdf5 file object."""
-    dDijdu = f["dDijdu"][:]
-    dqijdu = f["dqijdu"][:]
+def read_dDijdu_hdf5(f, lazy: bool = False):
+    """Read dDijdu from hdf5 file object.
+
+    dDijdu and dqijdu are LazyComplexArray when lazy=True. They are
+    DDijQijNeighborArray when stored only at neighbor atoms.
+
+    """
+    if "dDijdu_neighbors" in f:
+        if lazy:
+            values = [LazyComplexArray(f[name]) for name in ("dDijdu", "dqijdu")]
+        else:
+            values = [real2cmplx(f[name][:]) for name in ("dDijdu", "dqijdu")]
+        neighbors = f["dDijdu_neighbors"][:]
+        natom = len(f["supercell_positions"])
+        dDijdu, dqijdu = [DDijQijNeighborArray(v, neighbors, natom) for v in values]
+    elif lazy:
+        dDijdu = LazyComplexArray(f["dDijdu"])
+        dqijdu = LazyComplexArray(f["dqijdu"])
+    else:
+        dDijdu = f["dDijdu"][:]
+        dqijdu = f["dqijdu"][:]
     Dij = f["Dij"][:]
     qij = f["qij"][:]
     return dDijdu, dqijdu, Dij, qij
 
 
+def _read_cell_info_hdf5(f) -> tuple[PhonopyAtoms, NDArray, NDArray]:
+    """Read supercell, atom indices and p2s matrix from hdf5 file object."""
+    supercell = PhonopyAtoms(
+        cell=f["supercell_lattice"][:].T,
+        scaled_positions=f["supercell_positions"][:],
+        symbols=[get_atomic_data().atom_data[n][1] for n in f["supercell_numbers"][:]],
+        masses=f["supercell_masses"][:],
+    )
+    if "atom_indices_in_derivatives" in f:
+        atom_indices = f["atom_indices_in_derivatives"][:]
+    else:
+        atom_indices = f["p2s_map"][:]
+    if "primitive_matrix" in f and "supercell_matrix" in f:
+        # primitive_matrix is defined with respect to unit cell.
+        pmat = np.linalg.inv(f["supercell_matrix"][:]) @ f["primitive_matrix"][:]
+    elif "primitive_lattice" in f:
+        pmat = np.linalg.inv(f["supercell_lattice"][:]) @ f["primitive_lattice"][:]
+    else:
+        pmat = f["primitive_matrix"][:]
+    p2s_mat_float = np.linalg.inv(pmat)
+    p2s_matrix = np.rint(p2s_mat_float).astype("int64")
+    assert (abs(p2s_matrix - p2s_mat_float) < 1e-5).all()
+    return supercell, atom_indices, p2s_matrix
+
+
+def _read_dVdu_symmetry_map(f) -> tuple[NDArray, NDArray, NDArray] | None:
+    """Read map to reconstruct dV/du from those of irreducible atoms."""
+    if "dVdu_atom_map" not in f:
+        return None
+    return (
+        f["dVdu_atom_map"][:],
+        f["dVdu_rotations"][:],
+        f["dVdu_translations"][:],
+    )
+
+
+def _register_hdf5plugin_filters():
+    """Register compression filters of hdf5plugin to h5py if installed."""
+    try:
+        import hdf5plugin  # noqa: F401
+    except ImportError:
+        pass
+
+
+def _get_compression_kwargs(
+    shape: tuple[int, ...],
+    itemsize: int,
+    compression: Literal["gzip", "lzf", "blosc"] | int | None,
+) -> dict:
+    """Return keyword arguments of create_dataset for compressed derivatives.
+
+    Derivatives of shape=(ncdij, atoms, 3, ...) are chunked by (atom,
+    direction) slices of all ncdij components. Chunks are further divided along
+    the fourth axis not to exceed 4 MiB.
+
+    """
+    if compression is None:
+        return {}
+    chunks = [shape[0], 1, 1] + list(shape[3:])
+    n_split = int(np.ceil(np.prod(chunks) * itemsize / (4 * 1024**2)))
+    chunks[3] = int(np.ceil(chunks[3] / n_split))
+    kwargs: dict = {"chunks": tuple(chunks)}
+    if compression == "blosc":
+        try:
+            import hdf5plugin
+        except ImportError as e:
+            raise RuntimeError('hdf5plugin is required for compression="blosc".') from e
+        kwargs.update(hdf5plugin.Blosc(shuffle=hdf5plugin.Blosc.SHUFFLE))
+    else:
+        kwargs.update({"compression": compression, "shuffle": True})
+    return kwargs
+
+
+def _write_derivative_dataset(
+    w,
+    name: str,
+    data: NDArray,
+    compression: Literal["gzip", "lzf", "blosc"] | int | None = None,
+):
+    """Write complex derivatives of shape=(ncdij, atoms, 3, ...) as real array."""
+    real_data = cmplx2real(data)
+    w.create_dataset(
+        name,
+        data=real_data,
+        **_get_compression_kwargs(
+            real_data.shape, real_data.dtype.itemsize, compression
+        ),
+    )
+
+
+def _write_dVdu_dataset(
+    w,
+    name: str,
+    dVdu: NDArray | LazyComplexArray | SymmetryReducedDVdu,
+    positions: NDArray | None = None,
+    compression: Literal["gzip", "lzf", "blosc"] | int | None = None,
+):
+    """Write dV/du atom by atom.
+
+    dV/du can be np.memmap. Writing per atom avoids making its double-size
+    real-valued copy at once. Only atoms at positions in the second axis are
+    written when positions is given.
+
+    """
+    if positions is None:
+        positions = np.arange(dVdu.shape[1])
+    dtype = "f%d" % (dVdu.dtype.itemsize // 2)
+    shape = (dVdu.shape[0], len(positions)) + tuple(dVdu.shape[2:]) + (2,)
+    ds = w.create_dataset(
+        name,
+        shape=shape,
+        dtype=dtype,
+        **_get_compression_kwargs(shape, np.dtype(dtype).itemsize, compression),
+    )
+    for i, pos in enumerate(positions):
+        ds[:, i] = cmplx2real(np.ascontiguousarray(dVdu[:, pos]))
+
+
 def _add_datasets(
     w,
     dVdu: DLocalPotential | None = None,
@@ -213,21 +567,50 @@ def _add_datasets(
     phonon_supercell: PhonopyAtoms | None = None,
     nac_params: dict | None = None,
     symmetry_dataset: SpglibDataset | SpglibMagneticDataset | None = None,
+    reduce_by_symmetry: bool = False,
+    compression: Literal["gzip", "lzf", "blosc"] | int | None = None,
 ):
     if dVdu is not None:
         assert dVdu.dVdu is not None
-        w.create_dataset("dVdu", data=cmplx2real(dVdu.dVdu))
+        positions = None
+        if reduce_by_symmetry:
+            positions, atom_map, rotations, translations = get_dVdu_symmetry_reduction(
+                dVdu.fft_mesh,
+                dVdu.p2s_matrix,
+                dVdu.grid_points,
+                dVdu.symmetry,
+                dVdu.atom_indices,
+            )
+            w.create_dataset("dVdu_atom_map", data=atom_map)
+            w.create_dataset("dVdu_rotations", data=rotations)
+            w.create_dataset("dVdu_translations", data=translations)
+        _write_dVdu_dataset(
+            w, "dVdu", dVdu.dVdu, positions=positions, compression=compression
+        )
         w.create_dataset("grid_point", data=dVdu.grid_points)
         w.create_dataset("lattice_point", data=dVdu.lattice_points)
         w.create_dataset("FFT_mesh", data=dVdu.fft_mesh)
         if dmudu is not None:
             assert dmudu.dVdu is not None
-            w.create_dataset("dmudu", data=cmplx2real(dmudu.dVdu))
+            _write_dVdu_dataset(
+                w, "dmudu", dmudu.dVdu, positions=positions, compression=compression
+            )
     if dDijdu is not None:
         assert dDijdu.dDijdu is not None
-        w.create_dataset("dDijdu", data=cmplx2real(dDijdu.dDijdu))
         assert dDijdu.dqijdu is not None
-        w.create_dataset("dqijdu", data=cmplx2real(dDijdu.dqijdu))
+        if isinstance(dDijdu.dDijdu, DDijQijNeighborArray):
+            assert isinstance(dDijdu.dqijdu, DDijQijNeighborArray)
+            # Only values at neighbor atoms are written.
+            for name, data in (("dDijdu", dDijdu.dDijdu), ("dqijdu", dDijdu.dqijdu)):
+                _write_derivative_dataset(
+                    w, name, np.asarray(data.values), compression=compression
+                )
+            w.create_dataset("dDijdu_neighbors", data=dDijdu.dDijdu.neighbors)
+        else:
+            for name, data in (("dDijdu", dDijdu.dDijdu), ("dqijdu", dDijdu.dqijdu)):
+                _write_derivative_dataset(
+                    w, name, np.asarray(data), compression=compression
+                )
         assert dDijdu.Dij is not None
         w.create_dataset("Dij", data=cmplx2real(dDijdu.Dij))
         assert dDijdu.qij is not None
@@ -342,6 +725,11 @@ def _add_datasets(
             w.create_dataset(
                 "displacements_vectors", data=np.array(disps, dtype="double", order="C")
             )
+        elif "displacements" in disp_dataset:
+            w.create_dataset(
+                "displacements",
+                data=np.array(disp_dataset["displacements"], dtype="double", order="C"),
+            )
     if force_constants is not None:
         w.create_dataset(
             "force_constants", data=np.array(force_constants, dtype="double", order="C")
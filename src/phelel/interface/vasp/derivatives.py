@@ -4,9 +4,11 @@ from __future__ import annotations
 
 import os
 import pathlib
-from collections.abc import Sequence
-from typing import Literal
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass, field
+from functools import partial
 
+import h5py
 import numpy as np
 from numpy.typing import NDArray
 from phonopy.file_IO import get_born_parameters
@@ -16,7 +18,11 @@ from phonopy.structure.cells import Primitive
 from phonopy.structure.symmetry import Symmetry
 
 from phelel import Phelel
-from phelel.api_phelel import PhelelDataset
+from phelel.api_phelel import (
+    PhelelDataset,
+    PhelelDisplacedAtomData,
+    PhelelStreamDataset,
+)
 from phelel.interface.vasp.file_IO import (
     read_forces_vaspouth5,
     read_inwap_vaspouth5,
@@ -26,6 +32,8 @@ from phelel.interface.vasp.file_IO import (
     read_PAW_Dij_qij,
     read_PAW_Dij_qij_vaspouth5,
 )
+from phelel.utils.concurrency import iter_read_ahead
+from phelel.utils.profiler import Profiler, profiling_stage
 
 
 def read_files(
@@ -33,95 +41,152 @@ def read_files(
     dir_names: Sequence[str | os.PathLike],
     phonon_dir_names: Sequence[str | os.PathLike] | None = None,
     subtract_rfs: bool = False,
+    n_workers: int | None = None,
+    profiler: Profiler | None = None,
     log_level: int = 0,
 ) -> PhelelDataset:
-    """Load files needed to create derivatives."""
-    inwap_path = pathlib.Path(dir_names[0]) / "inwap.yaml"
-    if inwap_path.exists():
-        inwap_per = read_inwap_yaml(inwap_path)
-    else:
-        # try reading from vaspout.h5
-        inwap_path = pathlib.Path(dir_names[0]) / "vaspout.h5"
-        inwap_per = read_inwap_vaspouth5(inwap_path)
+    """Load files needed to create derivatives.
 
-    if inwap_per["nions"] != len(phelel.supercell):
-        raise ValueError(
-            "Number of ions in the supercell is different from the number of atoms "
-            "in the inwap.yaml or vaspout.h5 file."
+    Each directory is visited once and local potentials, Dij, qij, and forces
+    (when possible) are read in one pass. With ``n_workers``, directories are
+    read concurrently by a thread pool of this size. Decompression of
+    ``*.xz`` files and file I/O run in parallel, and at most ``n_workers``
+    directories are being read at the same time. vaspout.h5 files are not read
+    in parallel because h5py serializes reads by its global lock. With
+    ``profiler``, costs of reading are recorded as stage "read_files".
+
+    """
+    with profiling_stage(profiler, "read_files"):
+        return _read_files(
+            phelel,
+            dir_names,
+            phonon_dir_names=phonon_dir_names,
+            subtract_rfs=subtract_rfs,
+            n_workers=n_workers,
+            log_level=log_level,
         )
 
-    if log_level:
-        print(f'Parameters were collected from "{inwap_path}".')
 
+def _read_files(
+    phelel: Phelel,
+    dir_names: Sequence[str | os.PathLike],
+    phonon_dir_names: Sequence[str | os.PathLike] | None = None,
+    subtract_rfs: bool = False,
+    n_workers: int | None = None,
+    log_level: int = 0,
+) -> PhelelDataset:
+    inwap_per = _read_inwap(phelel, dir_names[0], log_level=log_level)
     dataset, _ = _get_datasets(phelel)
-    loc_pots = _read_local_potentials(dir_names, inwap_per, log_level=log_level)
-    if loc_pots is None:
-        raise ValueError(
-            "Failed to read required local potentials from the given directories. "
-        )
-    kin_pots = _read_local_potentials(
-        dir_names, inwap_per, key="xcmu", log_level=log_level
-    )
-    Dijs, qijs = _read_PAW_strength_and_overlap(
-        dir_names, inwap_per, log_level=log_level
-    )
+
     if phonon_dir_names is None:
         _dir_names = dir_names
     else:
         _dir_names = phonon_dir_names
 
-    if phelel.phonon_supercell_matrix:
-        supercell = phelel.phonon_supercell
-    else:
-        supercell = phelel.supercell
-    assert supercell is not None
+    read_forces = _get_vaspout_h5_filenames(_dir_names) is not None and [
+        pathlib.Path(d) for d in _dir_names
+    ] == [pathlib.Path(d) for d in dir_names]
 
-    vaspout5_exists = True
-    vaspout_filenames = []
-    for dir_name in _dir_names:
-        filename = pathlib.Path(dir_name) / "vaspout.h5"
-        if filename.is_file():
-            vaspout_filenames.append(filename)
-        else:
-            vaspout5_exists = False
-            break
-    if vaspout5_exists:
-        forces = _read_forces_from_vaspout_h5(
-            vaspout_filenames, subtract_rfs=subtract_rfs, log_level=log_level
-        )
-    else:
-        vasprun_filenames = _get_vasprun_filenames(_dir_names)
-        forces = read_forces_from_vasprunxmls(
-            vasprun_filenames,
-            supercell,
-            subtract_rfs=subtract_rfs,
-            log_level=log_level,
-        )
-
-    if forces[0].shape[0] != len(supercell):
+    dir_data = _read_directories(
+        dir_names,
+        inwap_per,
+        read_forces=read_forces,
+        n_workers=n_workers,
+        log_level=log_level,
+    )
+    loc_pots = [d.local_potential for d in dir_data]
+    if any(loc_pot is None for loc_pot in loc_pots):
         raise ValueError(
-            "Number of ions in the phonon supercell is different from the number of "
-            "atoms in the vasprun.xml file."
+            "Failed to read required local potentials from the given directories. "
         )
+    kin_pots = [d.kinetic_potential for d in dir_data]
 
-    phelel.forces = forces
-
-    if phelel.nac_params is None:
-        # This situation is possible when this function is called from cui/load.
-        nac_params = _read_born(
-            phelel.primitive, phelel.primitive_symmetry, log_level=log_level
+    if read_forces:
+        forces = _subtract_residual_forces(
+            [d.forces for d in dir_data], subtract_rfs, log_level
         )
-        if nac_params:
-            phelel.nac_params = nac_params
+    else:
+        forces = None
+    forces = _set_forces_and_nac_params(
+        phelel,
+        _dir_names,
+        forces=forces,
+        subtract_rfs=subtract_rfs,
+        log_level=log_level,
+    )
 
     return PhelelDataset(
         local_potentials=loc_pots,
-        Dijs=Dijs,
-        qijs=qijs,
+        Dijs=[d.Dij for d in dir_data],
+        qijs=[d.qij for d in dir_data],
+        lm_channels=inwap_per["lm_orbitals"],
+        kinetic_potentials=(
+            None if any(kin_pot is None for kin_pot in kin_pots) else kin_pots
+        ),
+        dataset=dataset,
+        forces=forces,
+    )
+
+
+def read_files_by_displaced_atom(
+    phelel: Phelel,
+    dir_names: Sequence[str | os.PathLike],
+    phonon_dir_names: Sequence[str | os.PathLike] | None = None,
+    subtract_rfs: bool = False,
+    n_workers: int | None = None,
+    profiler: Profiler | None = None,
+    log_level: int = 0,
+) -> PhelelStreamDataset:
+    """Load files needed to create derivatives lazily by displaced atom.
+
+    Files of perfect supercell and forces are read immediately. Files of
+    displaced supercells are read by the generator
+    ``PhelelStreamDataset.displaced_atoms`` only when data of the displaced
+    atom are requested, so that data of one displaced atom are in memory at a
+    time. ``n_workers`` is used to read directories of one displaced atom
+    concurrently, see ``read_files``. With ``profiler``, costs of reading
+    files of perfect supercell and those of each displaced atom are recorded
+    as stages "read_files" and "read_displaced_atom", respectively.
+
+    """
+    with profiling_stage(profiler, "read_files"):
+        inwap_per = _read_inwap(phelel, dir_names[0], log_level=log_level)
+        dataset, _ = _get_datasets(phelel)
+        if "first_atoms" not in dataset:
+            raise RuntimeError("Files of snapshots can not be read by displaced atom.")
+        displacements = dataset["first_atoms"]
+        if len(dir_names) != len(displacements) + 1:
+            raise RuntimeError("Number of dir_names is wrong.")
+
+        per_data = _read_directories(dir_names[:1], inwap_per, log_level=log_level)[0]
+        if per_data.local_potential is None:
+            raise ValueError(
+                "Failed to read required local potentials from the given directories. "
+            )
+
+        forces = _set_forces_and_nac_params(
+            phelel,
+            dir_names if phonon_dir_names is None else phonon_dir_names,
+            subtract_rfs=subtract_rfs,
+            log_level=log_level,
+        )
+
+    return PhelelStreamDataset(
+        local_potential=per_data.local_potential,
+        Dij=per_data.Dij,
+        qij=per_data.qij,
         lm_channels=inwap_per["lm_orbitals"],
-        kinetic_potentials=kin_pots,
+        displaced_atoms=_iter_displaced_atom_data(
+            dir_names[1:],
+            displacements,
+            inwap_per,
+            n_workers=n_workers,
+            profiler=profiler,
+            log_level=log_level,
+        ),
+        kinetic_potential=per_data.kinetic_potential,
         dataset=dataset,
-        forces=np.array(forces, dtype="double", order="C"),
+        forces=forces,
     )
 
 
@@ -129,6 +194,9 @@ def create_derivatives(
     phelel: Phelel,
     dir_names: Sequence,
     subtract_rfs: bool = False,
+    n_workers: int | None = None,
+    stream: bool = False,
+    checkpoint: str | os.PathLike | None = None,
     log_level: int = 0,
 ):
     """Calculate derivatives.
@@ -145,10 +213,17 @@ def create_derivatives(
     % phelel -d --dim 2 2 2 --pa auto
     % phelel --fft-mesh 18 18 18 --cd perfect disp-001
 
+    ``n_workers`` is the number of threads to read the directories, see
+    ``read_files``. With ``stream=True``, files of displaced supercells are
+    read and processed displaced atom by displaced atom to reduce memory
+    usage, see ``read_files_by_displaced_atom``. ``checkpoint`` is the name of
+    checkpoint file, see ``Phelel.run_derivatives``. Costs of reading files
+    are recorded by ``Phelel.profiler`` when it is set.
+
     """
     dataset, phonon_dataset = _get_datasets(phelel)
-    num_disp = len(dataset["first_atoms"]) + 1
-    num_disp_ph = len(phonon_dataset["first_atoms"]) + 1
+    num_disp = _get_number_of_displacements(dataset) + 1
+    num_disp_ph = _get_number_of_displacements(phonon_dataset) + 1
     if len(dir_names) == num_disp:
         phonon_dir_names = dir_names
     elif len(dir_names) == num_disp + num_disp_ph:
@@ -156,15 +231,22 @@ def create_derivatives(
     else:
         raise RuntimeError("Number of dir_names is wrong.")
 
-    phe_input = read_files(
+    if stream:
+        _read_files = read_files_by_displaced_atom
+        dir_names = dir_names[:num_disp]
+    else:
+        _read_files = read_files
+    phe_input = _read_files(
         phelel,
         dir_names,
         phonon_dir_names=phonon_dir_names,
         subtract_rfs=subtract_rfs,
+        n_workers=n_workers,
+        profiler=phelel.profiler,
         log_level=log_level,
     )
     if phelel.fft_mesh is not None:
-        phelel.run_derivatives(phe_input)
+        phelel.run_derivatives(phe_input, checkpoint=checkpoint)
 
     # phelel.Rij = read_Rij(dir_names[0], inwap_per)
 
@@ -246,12 +328,15 @@ def _read_born(
 def _get_datasets(phelel: Phelel) -> tuple:
     """Return inwap dataset and phonopy dataset."""
     assert phelel.dataset is not None
-    if "first_atoms" in phelel.dataset:
+    if "first_atoms" in phelel.dataset or "displacements" in phelel.dataset:
         dataset = phelel.dataset
         if (
             phelel.phonon_supercell_matrix
             and phelel.phonon_dataset is not None
-            and "first_atoms" in phelel.phonon_dataset
+            and (
+                "first_atoms" in phelel.phonon_dataset
+                or "displacements" in phelel.phonon_dataset
+            )
         ):
             phonon_dataset = phelel.phonon_dataset
         else:
@@ -262,86 +347,265 @@ def _get_datasets(phelel: Phelel) -> tuple:
     return dataset, phonon_dataset
 
 
-def _read_local_potentials(
+def _get_number_of_displacements(dataset: dict) -> int:
+    """Return number of displaced supercells of type-1 or type-2 dataset."""
+    if "first_atoms" in dataset:
+        return len(dataset["first_atoms"])
+    return len(dataset["displacements"])
+
+
+def _read_inwap(
+    phelel: Phelel, dir_name: str | os.PathLike, log_level: int = 0
+) -> dict:
+    """Read inwap.yaml or vaspout.h5 of perfect supercell."""
+    inwap_path = pathlib.Path(dir_name) / "inwap.yaml"
+    if inwap_path.exists():
+        inwap_per = read_inwap_yaml(inwap_path)
+    else:
+        # try reading from vaspout.h5
+        inwap_path = pathlib.Path(dir_name) / "vaspout.h5"
+        inwap_per = read_inwap_vaspouth5(inwap_path)
+
+    if inwap_per["nions"] != len(phelel.supercell):
+        raise ValueError(
+            "Number of ions in the supercell is different from the number of atoms "
+            "in the inwap.yaml or vaspout.h5 file."
+        )
+
+    if log_level:
+        print(f'Parameters were collected from "{inwap_path}".')
+
+    return inwap_per
+
+
+def _set_forces_and_nac_params(
+    phelel: Phelel,
+    phonon_dir_names: Sequence[str | os.PathLike],
+    forces: list[NDArray] | None = None,
+    subtract_rfs: bool = False,
+    log_level: int = 0,
+) -> NDArray:
+    """Set forces and NAC parameters to Phelel instance.
+
+    Forces are read from phonon_dir_names unless they are given.
+
+    """
+    if phelel.phonon_supercell_matrix:
+        supercell = phelel.phonon_supercell
+    else:
+        supercell = phelel.supercell
+    assert supercell is not None
+
+    if forces is None:
+        vaspout_filenames = _get_vaspout_h5_filenames(phonon_dir_names)
+        if vaspout_filenames is not None:
+            forces = _read_forces_from_vaspout_h5(
+                vaspout_filenames, subtract_rfs=subtract_rfs, log_level=log_level
+            )
+        else:
+            vasprun_filenames = _get_vasprun_filenames(phonon_dir_names)
+            forces = read_forces_from_vasprunxmls(
+                vasprun_filenames,
+                supercell,
+                subtract_rfs=subtract_rfs,
+                log_level=log_level,
+            )
+
+    if forces[0].shape[0] != len(supercell):
+        raise ValueError(
+            "Number of ions in the phonon supercell is different from the number of "
+            "atoms in the vasprun.xml file."
+        )
+
+    phelel.forces = forces
+
+    if phelel.nac_params is None:
+        # This situation is possible when this function is called from cui/load.
+        nac_params = _read_born(
+            phelel.primitive, phelel.primitive_symmetry, log_level=log_level
+        )
+        if nac_params:
+            phelel.nac_params = nac_params
+
+    return np.array(forces, dtype="double", order="C")
+
+
+def _iter_displaced_atom_data(
     dir_names: Sequence[str | os.PathLike],
+    displacements: list[dict],
     inwap_per: dict,
-    key: Literal["total", "xcmu"] = "total",
+    n_workers: int | None = None,
+    profiler: Profiler | None = None,
     log_level: int = 0,
-) -> list[NDArray] | None:
-    loc_pots = []
-    vaspout5_exists = True
-    for dir_name in dir_names:
-        try:
-            locpot_path = next(pathlib.Path(dir_name).glob("vaspout.h5*"))
-        except StopIteration:
-            vaspout5_exists = False
-            break
-
-        try:
-            loc_pots.append(
-                read_local_potential_vaspouth5(filename=locpot_path, key=key)
+) -> Iterator[PhelelDisplacedAtomData]:
+    """Read directories of displaced supercells grouped by displaced atom."""
+    for disp_atom in np.unique([d["number"] for d in displacements]):
+        indices = [i for i, d in enumerate(displacements) if d["number"] == disp_atom]
+        with profiling_stage(profiler, "read_displaced_atom", atom=disp_atom):
+            dir_data = _read_directories(
+                [dir_names[i] for i in indices],
+                inwap_per,
+                n_workers=n_workers,
+                log_level=log_level,
             )
-        except KeyError:
-            return None
+        if any(d.local_potential is None for d in dir_data):
+            raise ValueError(
+                "Failed to read required local potentials from the given directories. "
+            )
+        kin_pots = [d.kinetic_potential for d in dir_data]
+        yield PhelelDisplacedAtomData(
+            displacements=[displacements[i] for i in indices],
+            local_potentials=[d.local_potential for d in dir_data],
+            Dijs=[d.Dij for d in dir_data],
+            qijs=[d.qij for d in dir_data],
+            kinetic_potentials=(
+                None if any(kin_pot is None for kin_pot in kin_pots) else kin_pots
+            ),
+        )
 
-        if log_level:
-            print(f'Local potential was read from "{locpot_path}".')
 
-    if vaspout5_exists:
-        return loc_pots
+@dataclass
+class _DirectoryData:
+    """Data read from a directory of a supercell calculation."""
 
-    # Old way for LOCAL-POTENTIAL.bin.
-    # Meta-GGA kinetic potential is not available.
-    if key == "xcmu":
-        return None
+    local_potential: NDArray | None
+    kinetic_potential: NDArray | None
+    Dij: NDArray
+    qij: NDArray
+    forces: NDArray | None = None
+    messages: list[str] = field(default_factory=list)
 
+
+def _get_vaspout_h5_filenames(
+    dir_names: Sequence[str | os.PathLike],
+) -> list[pathlib.Path] | None:
+    """Return vaspout.h5 filenames if all directories have one."""
+    vaspout_filenames = []
     for dir_name in dir_names:
-        try:
-            locpot_path = next(pathlib.Path(dir_name).glob("LOCAL-POTENTIAL.bin*"))
-            loc_pots.append(read_local_potential(inwap_per, filename=locpot_path))
-        except StopIteration as e:
-            raise RuntimeError(
-                f'"LOCAL-POTENTIAL.bin" not found in "{dir_name}".'
-            ) from e
-    return loc_pots
-
-
-def _read_PAW_strength_and_overlap(
-    dir_names, inwap_per, log_level=0
-) -> tuple[list[NDArray], list[NDArray]]:
-    Dijs = []
-    qijs = []
-    vaspout5_exists = True
+        filename = pathlib.Path(dir_name) / "vaspout.h5"
+        if not filename.is_file():
+            return None
+        vaspout_filenames.append(filename)
+    return vaspout_filenames
+
+
+def _read_directories(
+    dir_names: Sequence[str | os.PathLike],
+    inwap_per: dict,
+    read_forces: bool = False,
+    n_workers: int | None = None,
+    log_level: int = 0,
+) -> list[_DirectoryData]:
+    """Read directories in one pass per directory, concurrently if requested.
+
+    vaspout.h5 is used when it exists in all directories. Otherwise
+    LOCAL-POTENTIAL.bin and PAW-*.bin are read. Log messages are printed in
+    the order of dir_names. See ``_iter_directories`` for ``n_workers``.
+
+    """
+    return [
+        _print_messages(data, log_level)
+        for data in _iter_directories(
+            dir_names, inwap_per, read_forces=read_forces, n_workers=n_workers
+        )
+    ]
+
+
+def _iter_directories(
+    dir_names: Sequence[str | os.PathLike],
+    inwap_per: dict,
+    read_forces: bool = False,
+    n_workers: int | None = None,
+) -> Iterator[_DirectoryData]:
+    """Yield data of directories in order, reading ahead by thread pool.
+
+    See ``iter_read_ahead`` for ``n_workers``. Threads make decompression and
+    reading of .bin files run in parallel. h5py serializes all reads by its
+    global lock, so vaspout.h5 files are not read in parallel.
+
+    """
+    vaspouth5_paths = []
     for dir_name in dir_names:
         try:
-            Dij_qij_path = next(pathlib.Path(dir_name).glob("vaspout.h5*"))
+            vaspouth5_paths.append(next(pathlib.Path(dir_name).glob("vaspout.h5*")))
         except StopIteration:
-            vaspout5_exists = False
+            vaspouth5_paths = None
             break
 
-        dij, qij = read_PAW_Dij_qij_vaspouth5(Dij_qij_path)
-        Dijs.append(dij)
-        qijs.append(qij)
-        if log_level:
-            print(f'Dijs and qjis were read from "{Dij_qij_path}".')
+    if vaspouth5_paths is None:
+        func = partial(_read_bin_directory, inwap_per=inwap_per)
+        args = dir_names
+    else:
+        func = partial(_read_vaspouth5_directory, read_forces=read_forces)
+        args = vaspouth5_paths
 
-    if vaspout5_exists:
-        return Dijs, qijs
+    yield from iter_read_ahead(func, args, n_workers=n_workers)
 
-    # Old way for PAW-*.bin.
-    for dir_name in dir_names:
-        possible_Dij_path = list(pathlib.Path(dir_name).glob("PAW-STRENGTH.bin*"))
-        possible_qij_path = list(pathlib.Path(dir_name).glob("PAW-OVERLAP.bin*"))
-        if possible_Dij_path and possible_qij_path:
-            Dij_path = possible_Dij_path[0]
-            qij_path = possible_qij_path[0]
-            Dijs.append(read_PAW_Dij_qij(inwap_per, Dij_path))
-            qijs.append(read_PAW_Dij_qij(inwap_per, qij_path))
-            if log_level:
-                print(f'"{Dij_path}" and "{qij_path}" were read.')
+
+def _print_messages(data: _DirectoryData, log_level: int) -> _DirectoryData:
+    if log_level:
+        for message in data.messages:
+            print(message)
+    return data
+
+
+def _read_vaspouth5_directory(
+    vaspouth5_path: pathlib.Path, read_forces: bool = False
+) -> _DirectoryData:
+    """Read all necessary data from vaspout.h5 opened once."""
+    messages = []
+    with h5py.File(vaspouth5_path) as h5:
+        pots = []
+        for key in ("total", "xcmu"):
+            try:
+                pots.append(read_local_potential_vaspouth5(h5, key=key))
+                messages.append(f'Local potential was read from "{vaspouth5_path}".')
+            except KeyError:
+                pots.append(None)
+        dij, qij = read_PAW_Dij_qij_vaspouth5(h5)
+        messages.append(f'Dijs and qjis were read from "{vaspouth5_path}".')
+        if read_forces:
+            forces = read_forces_vaspouth5(h5)
+            messages.append(f'Forces were read from "{vaspouth5_path}".')
         else:
-            raise RuntimeError(
-                f'"PAW-STRENGTH.bin" or "PAW-OVERLAP.bin" not found in "{dir_name}".'
-            )
+            forces = None
+    return _DirectoryData(
+        local_potential=pots[0],
+        kinetic_potential=pots[1],
+        Dij=dij,
+        qij=qij,
+        forces=forces,
+        messages=messages,
+    )
+
+
+def _read_bin_directory(dir_name: str | os.PathLike, inwap_per: dict) -> _DirectoryData:
+    """Read LOCAL-POTENTIAL.bin and PAW-*.bin.
 
-    return Dijs, qijs
+    Meta-GGA kinetic potential is not available.
+
+    """
+    try:
+        locpot_path = next(pathlib.Path(dir_name).glob("LOCAL-POTENTIAL.bin*"))
+    except StopIteration as e:
+        raise RuntimeError(f'"LOCAL-POTENTIAL.bin" not found in "{dir_name}".') from e
+    loc_pot = read_local_potential(inwap_per, filename=locpot_path)
+
+    possible_Dij_path = list(pathlib.Path(dir_name).glob("PAW-STRENGTH.bin*"))
+    possible_qij_path = list(pathlib.Path(dir_name).glob("PAW-OVERLAP.bin*"))
+    if possible_Dij_path and possible_qij_path:
+        Dij_path = possible_Dij_path[0]
+        qij_path = possible_qij_path[0]
+        dij = read_PAW_Dij_qij(inwap_per, Dij_path)
+        qij = read_PAW_Dij_qij(inwap_per, qij_path)
+    else:
+        raise RuntimeError(
+            f'"PAW-STRENGTH.bin" or "PAW-OVERLAP.bin" not found in "{dir_name}".'
+        )
+    return _DirectoryData(
+        local_potential=loc_pot,
+        kinetic_potential=None,
+        Dij=dij,
+        qij=qij,
+        messages=[f'"{Dij_path}" and "{qij_path}" were read.'],
+    )
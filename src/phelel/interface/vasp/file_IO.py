@@ -2,9 +2,11 @@
 
 from __future__ import annotations
 
+import contextlib
+import io
 import os
-from collections.abc import Sequence
-from typing import Literal
+from collections.abc import Iterator, Sequence
+from typing import Literal, TextIO
 
 import h5py
 import numpy as np
@@ -12,29 +14,109 @@ import yaml
 from numpy.typing import NDArray
 from phono3py.file_IO import get_filename_suffix
 from phonopy.file_IO import get_io_module_to_decompress
+from phonopy.interface.vasp import get_vasp_structure_lines
+from phonopy.structure.atoms import PhonopyAtoms
+
+from phelel.utils.concurrency import iter_read_ahead
+
+# Number of bytes decompressed by one readinto call in read_bin_stream.
+_READINTO_CHUNK_SIZE = 4 * 1024**2
 
 
 ###########
 # Readers #
 ###########
+
+
 def read_bin_stream(
-    filename: str | os.PathLike, dtype: np.dtype | None = None
+    filename: str | os.PathLike,
+    dtype: np.dtype | str | None = None,
+    count: int | None = None,
+    mmap: bool = False,
 ) -> NDArray:
-    """Read binary stream."""
-    if dtype is None:
-        dtype = np.dtype("double")
+    """Read binary stream.
+
+    Parameters
+    ----------
+    filename : str or os.PathLike
+        File name. Files compressed by xz, lzma, gzip, and bz2 are decompressed
+        by their filename extensions.
+    dtype : np.dtype or str, optional
+        Data type of values. Default is double.
+    count : int, optional
+        Number of values in the file. When this is given, values are
+        decompressed into an array allocated in advance, without holding all
+        decompressed bytes at once, and ValueError is raised unless the file
+        contains exactly this number of values.
+    mmap : bool, optional
+        Map an uncompressed file into memory by np.memmap instead of reading
+        it. Pages of the file are read only when the values are accessed. The
+        returned array is read-only. This is ignored for compressed files.
+        Default is False.
+
+    """
+    dtype = np.dtype("double") if dtype is None else np.dtype(dtype)
     myio = get_io_module_to_decompress(filename)
+    if mmap and myio is io:
+        if count is not None and os.path.getsize(filename) != count * dtype.itemsize:
+            raise ValueError(f"{filename}: number of values is not {count}.")
+        return np.memmap(filename, dtype=dtype, mode="r")
     with myio.open(filename, "rb") as fp:
-        data = np.frombuffer(fp.read(), dtype=dtype)
+        if count is None:
+            return np.frombuffer(fp.read(), dtype=dtype)
+        data = np.empty(count, dtype=dtype)
+        buf = memoryview(data.view(np.uint8))
+        nbytes = 0
+        while nbytes < len(buf):
+            # Decompression modules decompress the whole request into a
+            # temporary bytes object, so the request is bounded.
+            n = fp.readinto(buf[nbytes : nbytes + _READINTO_CHUNK_SIZE])
+            if not n:
+                break
+            nbytes += n
+        if nbytes < len(buf) or fp.read(1):
+            raise ValueError(f"{filename}: number of values is not {count}.")
     return data
 
 
+def _read_bin_array(
+    filename: str | os.PathLike,
+    shape: tuple[int, ...],
+    dtype: np.dtype | str = "double",
+    mmap: bool = False,
+) -> NDArray:
+    """Read binary stream of values in the shape given by inwap."""
+    try:
+        data = read_bin_stream(
+            filename, dtype=dtype, count=int(np.prod(shape)), mmap=mmap
+        )
+    except ValueError as e:
+        raise ValueError(
+            f"{filename}: data size is inconsistent with values in inwap.yaml."
+        ) from e
+    return data.reshape(shape)
+
+
+@contextlib.contextmanager
+def _open_vaspouth5(filename: str | os.PathLike | h5py.File) -> Iterator[h5py.File]:
+    """Open vaspout.h5 unless it is already opened.
+
+    An opened h5py.File is yielded as it is and is not closed here.
+
+    """
+    if isinstance(filename, h5py.File):
+        yield filename
+    else:
+        with h5py.File(filename) as h5:
+            yield h5
+
+
 def read_inwap_vaspouth5(
-    filename: str | os.PathLike = "vaspout.h5",
+    filename: str | os.PathLike | h5py.File = "vaspout.h5",
 ) -> dict:
     """Read inwap-like information in vaspout.h5."""
     inwap = {}
-    with h5py.File(filename) as h5:
+    with _open_vaspouth5(filename) as h5:
         # dimensions of the potential
         pot_shape: tuple = h5["results/potential/total"].shape  # type: ignore
         ncdij = pot_shape[0]
@@ -109,16 +191,16 @@ def read_inwap_yaml(filename: str | os.PathLike = "inwap.yaml") -> dict:
 
 
 def read_forces_vaspouth5(
-    filename: str | os.PathLike = "vaspout.h5",
+    filename: str | os.PathLike | h5py.File = "vaspout.h5",
 ) -> NDArray:
     """Read forces from vaspout.h5's."""
-    with h5py.File(filename) as h5:
+    with _open_vaspouth5(filename) as h5:
         forces: NDArray = h5["intermediate/ion_dynamics/forces"][0]  # type: ignore
         return forces
 
 
 def read_PAW_Dij_qij_vaspouth5(
-    filename: str | os.PathLike = "vaspout.h5",
+    filename: str | os.PathLike | h5py.File = "vaspout.h5",
 ) -> tuple[NDArray, NDArray]:
     """Read Dij and qij in vaspout.h5.
 
@@ -128,7 +210,7 @@ def read_PAW_Dij_qij_vaspouth5(
     Used such as <psi|p><lm|A|lm'><p|psi'>
 
     """
-    with h5py.File(filename) as h5:
+    with _open_vaspouth5(filename) as h5:
         dij_real = h5["/results/paw/dij"][:]  # type: ignore
         qij_real = h5["/results/paw/qij"][:]  # type: ignore
     dij = dij_real[:, :, :, :, 0] + 1j * dij_real[:, :, :, :, 1]  # type: ignore
@@ -137,7 +219,7 @@ def read_PAW_Dij_qij_vaspouth5(
 
 
 def read_PAW_Dij_qij(
-    inwap: dict, filename: str | os.PathLike, is_Rij: bool = False
+    inwap: dict, filename: str | os.PathLike, is_Rij: bool = False, mmap: bool = False
 ) -> NDArray:
     """Read Dij, qij, and Rij.
 
@@ -147,6 +229,9 @@ def read_PAW_Dij_qij(
 
     Used such as <psi|p><lm|A|lm'><p|psi'>
 
+    With ``mmap=True``, uncompressed file is mapped into memory, see
+    ``read_bin_stream``.
+
     """
     ncdij = inwap["ncdij"]
     nions = inwap["nions"]
@@ -155,18 +240,12 @@ def read_PAW_Dij_qij(
         shape = (2, ncdij, nions, lmdim, lmdim)
     else:
         shape = (ncdij, nions, lmdim, lmdim)
-    data = read_bin_stream(filename)
-    dt = "c%d" % (data.itemsize * 2)
-    data_complex = data.view(dtype=dt)
-    if len(data_complex) != np.prod(shape):
-        raise ValueError(
-            f"{filename}: data size is inconsistent with values in inwap.yaml."
-        )
-    return data_complex.reshape(shape)
+    return _read_bin_array(filename, shape, dtype="complex128", mmap=mmap)
 
 
 def read_local_potential_vaspouth5(
-    filename: str | os.PathLike = "vaspout.h5", key: Literal["total", "xcmu"] = "total"
+    filename: str | os.PathLike | h5py.File = "vaspout.h5",
+    key: Literal["total", "xcmu"] = "total",
 ) -> NDArray:
     """Read local potentials in vaspout.h5.
 
@@ -178,8 +257,11 @@ def read_local_potential_vaspouth5(
 
     Kinetic energy density (xcmu) is also read by this function in the same way.
 
+    ``filename`` can be an opened h5py.File to read several quantities without
+    reopening vaspout.h5.
+
     """
-    with h5py.File(filename) as h5:
+    with _open_vaspouth5(filename) as h5:
         # dimensions of the potential
         pot_real: NDArray = h5[f"/results/potential/{key}"][:]  # type: ignore
         ncdij = pot_real.shape[0]
@@ -207,7 +289,9 @@ def read_local_potential_vaspouth5(
 
 
 def read_local_potential(
-    inwap: dict, filename: str | os.PathLike = "LOCAL-POTENTIAL.bin"
+    inwap: dict,
+    filename: str | os.PathLike = "LOCAL-POTENTIAL.bin",
+    mmap: bool = False,
 ) -> NDArray:
     """Read LOCAL-POTENTIAL.bin.
 
@@ -215,24 +299,27 @@ def read_local_potential(
     turns to be complex. So we force local potential to be complex in either
     case.
 
+    With ``mmap=True``, uncompressed file is mapped into memory, see
+    ``read_bin_stream``. This is not the default because all values are used
+    and the files of many supercells are kept open by their maps.
+
     """
     ncdij = inwap["ncdij"]
     nx, ny, nz = inwap["fft_fine"]
     shape = (ncdij, nz, ny, nx)
-    data = read_bin_stream(filename)
-    dt = "c%d" % (data.itemsize * 2)
-    data_complex = data.view(dtype=dt)
-    if len(data_complex) != np.prod(shape):
-        raise ValueError(
-            f"{filename}: data size is inconsistent with values in inwap.yaml."
-        )
-    return data_complex.reshape(shape)
+    return _read_bin_array(filename, shape, dtype="complex128", mmap=mmap)
 
 
 def read_dprojectors(
-    inwap: dict, filename: str | os.PathLike = "DPROJECTORS.bin"
+    inwap: dict, filename: str | os.PathLike = "DPROJECTORS.bin", mmap: bool = False
 ) -> NDArray:
-    """Read DPROJECTORS.bin."""
+    """Read DPROJECTORS.bin.
+
+    With ``mmap=True``, uncompressed file is mapped into memory and only the
+    pages of the k-points and bands accessed are read. The returned array is
+    then read-only, see ``read_bin_stream``.
+
+    """
     nbtot = inwap["nbtot"]
     nrspinors = inwap["nrspinors"]
     ispin = inwap["ispin"]
@@ -242,32 +329,26 @@ def read_dprojectors(
     # The last index corresponds to usual projector and its derivatives along
     # x, y, z.
     shape = (nkpts, nbtot, ispin, nrspinors, nions, lmdim, 4)
-    data = read_bin_stream(filename)
-    dt = "c%d" % (data.itemsize * 2)
-    data_complex = data.view(dtype=dt)
-    if len(data_complex) != np.prod(shape):
-        raise ValueError(
-            f"{filename}: data size is inconsistent with values in inwap.yaml."
-        )
-    return data_complex.reshape(shape)
+    return _read_bin_array(filename, shape, dtype="complex128", mmap=mmap)
 
 
-def read_waves(inwap: dict, filename: str | os.PathLike = "WAVES.bin") -> NDArray:
-    """Read WAVES.bin."""
+def read_waves(
+    inwap: dict, filename: str | os.PathLike = "WAVES.bin", mmap: bool = False
+) -> NDArray:
+    """Read WAVES.bin.
+
+    With ``mmap=True``, uncompressed file is mapped into memory and only the
+    pages of the k-points and bands accessed are read. The returned array is
+    then read-only, see ``read_bin_stream``.
+
+    """
     ispin = inwap["ispin"]
     nkpts = inwap["nkpts"]
     nbtot = inwap["nbtot"]
     nrspinors = inwap["nrspinors"]
     nx, ny, nz = inwap["fft_coarse"]
     shape = (nkpts, nbtot, ispin, nrspinors, nz, ny, nx)
-    data = read_bin_stream(filename)
-    dt = "c%d" % (data.itemsize * 2)
-    data_complex = data.view(dtype=dt)
-    if len(data_complex) != np.prod(shape):
-        raise ValueError(
-            f"{filename}: data size is inconsistent with values in inwap.yaml."
-        )
-    return data_complex.reshape(shape)
+    return _read_bin_array(filename, shape, dtype="complex128", mmap=mmap)
 
 
 def read_eigenvalues(
@@ -278,13 +359,9 @@ def read_eigenvalues(
     nkpts = inwap["nkpts"]
     nbtot = inwap["nbtot"]
     shape = (nbtot, nkpts, ispin)
-    data = read_bin_stream(filename)
-    if len(data) != np.prod(shape):
-        raise ValueError(
-            f"{filename}: data size is inconsistent with values in inwap.yaml."
-        )
+    data = _read_bin_array(filename, shape)
     # change shape (nbtot, nkpts, ispin) --> (nkpts, nbtot, ispin)
-    ret_data = np.array(data.reshape(shape).swapaxes(0, 1), dtype=data.dtype, order="C")
+    ret_data = np.array(data.swapaxes(0, 1), dtype=data.dtype, order="C")
     return ret_data
 
 
@@ -293,35 +370,114 @@ def read_qtot(inwap: dict, filename: str | os.PathLike = "QTOT.bin") -> NDArray:
     ldim = inwap["ldim"]
     nions = inwap["nions"]
     shape = (nions, ldim, ldim)
-    data = read_bin_stream(filename)
-    if len(data) != np.prod(shape):
-        raise ValueError(
-            f"{filename}: data size is inconsistent with values in inwap.yaml."
-        )
-    return data.reshape(shape)
+    return _read_bin_array(filename, shape)
 
 
 def get_CHGCAR(charge: NDArray, header: str) -> str:
-    """Return CHGCAR style text from ndarray."""
-    text = header + "\n%5d%5d%5d\n" % charge.shape[::-1]
-    count = 0
-    for z in range(charge.shape[0]):
-        for y in range(charge.shape[1]):
-            for x in range(charge.shape[2]):
-                text += "%18.11e" % charge[z, y, x]
-                count += 1
-                if (count % 5) == 0:
-                    count = 0
-                    text += "\n"
-    return text
+    """Return CHGCAR style text from ndarray.
+
+    See ``write_CHGCAR``.
+
+    """
+    with io.StringIO() as f:
+        write_CHGCAR(f, charge, header)
+        return f.getvalue()
 
 
 ###########
 # Writers #
 ###########
-def write_mesh_electron_hdf5(dirnames: Sequence, mesh: Sequence | NDArray):
+def write_CHGCAR(f: TextIO, charge: NDArray, header: str, chunk_size: int = 2**16):
+    """Write CHGCAR style text of ndarray to text stream.
+
+    Values are written five in a line in the order of x (fastest), y, z.
+    ``chunk_size`` values are formatted by one string formatting and written
+    at once, so that neither text nor a copy of the whole grid is made in
+    memory.
+
+    Parameters
+    ----------
+    f : TextIO
+        Text stream, e.g., file opened by ``open(filename, "w")``.
+    charge : ndarray
+        Values on grid.
+        shape=(nz, ny, nx)
+    header : str
+        Lines of crystal structure in POSCAR format.
+    chunk_size : int, optional
+        Number of values formatted at once. This is rounded up to a multiple of
+        five. Default is 2**16.
+
+    """
+    f.write(header + "\n%5d%5d%5d\n" % charge.shape[::-1])
+    values = np.asarray(charge).flat
+    n_chunk = -(-chunk_size // 5) * 5
+    for i in range(0, charge.size, n_chunk):
+        chunk = values[i : (i + n_chunk)].tolist()
+        n_lines, n_rest = divmod(len(chunk), 5)
+        f.write((("%18.11e" * 5 + "\n") * n_lines + "%18.11e" * n_rest) % tuple(chunk))
+
+
+def write_volumetric_data(
+    filename: str | bytes | os.PathLike, data: NDArray, cell: PhonopyAtoms
+):
+    """Write values on grid in CHGCAR style text or HDF5 file.
+
+    When the file name ends with ".hdf5" or ".h5", the crystal structure and
+    the values are written in HDF5 file with keys "lattice" (basis vectors in
+    row vectors), "positions" (fractional coordinates), "numbers", and "data"
+    of shape=(nz, ny, nx). Otherwise, CHGCAR style text is written by
+    ``write_CHGCAR``.
+
+    """
+    if os.path.splitext(os.fsdecode(filename))[1] in (".hdf5", ".h5"):
+        with h5py.File(filename, "w") as w:
+            w.create_dataset("lattice", data=np.array(cell.cell, dtype="double"))
+            w.create_dataset(
+                "positions", data=np.array(cell.scaled_positions, dtype="double")
+            )
+            w.create_dataset("numbers", data=np.array(cell.numbers, dtype="int64"))
+            w.create_dataset("data", data=np.asarray(data))
+    else:
+        header = "\n".join(get_vasp_structure_lines(cell))
+        with open(filename, "w") as w:
+            write_CHGCAR(w, data, header)
+
+
+def write_mesh_electron_hdf5(
+    dirnames: Sequence,
+    mesh: Sequence | NDArray,
+    n_workers: int | None = None,
+    compression: Literal["gzip", "lzf"] | int | None = None,
+) -> str:
     """Read .bin files and write to hdf5 file.
 
+    Eigenvalues, projectors, and wave functions of k-points split in
+    directories are written in "electron-mXXX.hdf5" directly from the data of
+    each directory, i.e., arrays of all k-points are not made in memory. The
+    datasets are chunked by k-point (and band if a chunk exceeds 4 MiB) and
+    read by ``read_mesh_electron_hdf5``.
+
+    Parameters
+    ----------
+    dirnames : Sequence
+        Directories containing inwap.yaml, EIGENVALUE.bin, DPROJECTORS.bin, and
+        WAVES.bin in the order of k-points.
+    mesh : array_like
+        Sampling mesh of k-points.
+    n_workers : int, optional
+        With this, directories are read concurrently by a thread pool of this
+        size, and at most this number of directories are held in memory.
+        Default is None, i.e., directories are read one by one.
+    compression : str or int, optional
+        Compression filter of h5py, "gzip" or "lzf", or gzip level. Default is
+        None.
+
+    Returns
+    -------
+    str
+        File name of the hdf5 file.
+
     Note
     ----
     No spin and spinor are considered.
@@ -339,40 +495,118 @@ def write_mesh_electron_hdf5(dirnames: Sequence, mesh: Sequence | NDArray):
     assert (fft_meshes[1:] - fft_meshes[0] == 0).all()
 
     nkpts = np.array([iwp["nkpts"] for iwp in inwaps], dtype=int)
+    nk_total = int(np.sum(nkpts))
     nbtot = inwaps[0]["nbtot"]
     lmdim = inwaps[0]["lmdim"]
     nions = inwaps[0]["nions"]
-    fft_mesh = tuple(fft_meshes[0])
-    dtype = "c%d" % (np.dtype("double").itemsize * 2)
-    # waves = np.empty((np.sum(nkpts), nbtot, 1, 1) + fft_mesh,
-    #                  dtype=dtype)
-    waves_shape = (np.sum(nkpts), nbtot, 1, 1) + fft_mesh
-    dprojs = np.empty((np.sum(nkpts), nbtot, 1, 1, nions, lmdim, 4), dtype=dtype)
-    eigenvalues = np.empty((np.sum(nkpts), nbtot, 1), dtype="double")
-    idx = 0
-    for dname, iwp, nk in zip(dirnames, inwaps, nkpts, strict=True):
-        # waves[idx:(idx + nk)] = read_waves(
-        #     iwp, "%s/%s" % (dname, "WAVES.bin"))
-        dprojs[idx : (idx + nk)] = read_dprojectors(
-            iwp, "%s/%s" % (dname, "DPROJECTORS.bin")
-        )
-        eigvals = read_eigenvalues(iwp, "%s/%s" % (dname, "EIGENVALUE.bin"))
-        eigenvalues[idx : (idx + nk)] = eigvals
-        idx += nk
-
-    suffix = get_filename_suffix(mesh)
-    with h5py.File("electron%s.hdf5" % suffix, "w") as w:
-        # compression doesn't help much.
+    nx, ny, nz = fft_meshes[0]
+    shapes = {
+        "eigenvalues": ((nk_total, nbtot, 1), "double"),
+        "dprojectors": ((nk_total, nbtot, 1, 1, nions, lmdim, 4), "complex128"),
+        "waves": ((nk_total, nbtot, 1, 1, nz, ny, nx), "complex128"),
+    }
+
+    filename = "electron%s.hdf5" % get_filename_suffix(mesh)
+    with h5py.File(filename, "w") as w:
         w.create_dataset("mesh", data=mesh)
-        # w.create_dataset('waves', data=waves, compression=None)
-        w.create_dataset("dprojectors", data=dprojs, compression=None)
-        w.create_dataset("eigenvalues", data=eigenvalues, compression=None)
-
-    # This is to avoid using memory space by directly writing to the file
-    # object piece by piece.
-    with h5py.File("electron%s.hdf5" % suffix, "a") as w:
-        waves = w.create_dataset("waves", waves_shape, dtype=dtype)
+        datasets = {
+            key: w.create_dataset(
+                key,
+                shape,
+                dtype=dtype,
+                **_get_k_chunk_kwargs(shape, np.dtype(dtype).itemsize, compression),
+            )
+            for key, (shape, dtype) in shapes.items()
+        }
         idx = 0
-        for dname, iwp, nk in zip(dirnames, inwaps, nkpts, strict=True):
-            waves[idx : (idx + nk)] = read_waves(iwp, "%s/%s" % (dname, "WAVES.bin"))
+        for data, nk in zip(
+            _iter_electron_directories(dirnames, inwaps, n_workers), nkpts, strict=True
+        ):
+            for key, values in data.items():
+                datasets[key][idx : (idx + nk)] = values
             idx += nk
+    return filename
+
+
+def read_mesh_electron_hdf5(
+    filename: str | os.PathLike,
+    k_range: tuple[int, int] | None = None,
+    lazy: bool = False,
+) -> dict:
+    """Read hdf5 file written by ``write_mesh_electron_hdf5``.
+
+    Parameters
+    ----------
+    filename : str or os.PathLike
+        File name of the hdf5 file.
+    k_range : tuple[int, int], optional
+        Only k-points in range(*k_range) are read. Default is None, i.e., all
+        k-points.
+    lazy : bool, optional
+        When True, the file is kept open, and "eigenvalues", "dprojectors", and
+        "waves" are returned as h5py datasets. Only the selected part, e.g.,
+        ``data["waves"][i_k]``, is read from the file. k_range can not be
+        specified with this. Default is False.
+
+    Returns
+    -------
+    dict
+        "mesh", "eigenvalues", "dprojectors", and "waves". Shapes are
+        (nkpts, nbtot, 1), (nkpts, nbtot, 1, 1, nions, lmdim, 4), and
+        (nkpts, nbtot, 1, 1, nz, ny, nx), respectively.
+
+    """
+    keys = ("eigenvalues", "dprojectors", "waves")
+    if lazy:
+        if k_range is not None:
+            raise ValueError("k_range can not be specified with lazy=True.")
+        # File is closed when all the datasets are released.
+        f = h5py.File(filename, "r")
+        data = {key: f[key] for key in keys}
+        data["mesh"] = f["mesh"][:]
+        return data
+
+    k_slice = slice(None) if k_range is None else slice(*k_range)
+    with h5py.File(filename, "r") as f:
+        data = {key: f[key][k_slice] for key in keys}
+        data["mesh"] = f["mesh"][:]
+    return data
+
+
+def _iter_electron_directories(
+    dirnames: Sequence, inwaps: list[dict], n_workers: int | None
+) -> Iterator[dict]:
+    """Yield data of directories in order, reading ahead by thread pool."""
+    yield from iter_read_ahead(
+        _read_electron_directory, dirnames, inwaps, n_workers=n_workers
+    )
+
+
+def _read_electron_directory(dname: str | os.PathLike, inwap: dict) -> dict:
+    """Read eigenvalues, projectors, and wave functions into memory."""
+    return {
+        "eigenvalues": read_eigenvalues(inwap, "%s/%s" % (dname, "EIGENVALUE.bin")),
+        "dprojectors": read_dprojectors(
+            inwap, "%s/%s" % (dname, "DPROJECTORS.bin"), mmap=False
+        ),
+        "waves": read_waves(inwap, "%s/%s" % (dname, "WAVES.bin"), mmap=False),
+    }
+
+
+def _get_k_chunk_kwargs(
+    shape: tuple[int, ...],
+    itemsize: int,
+    compression: Literal["gzip", "lzf"] | int | None,
+) -> dict:
+    """Return keyword arguments of create_dataset chunked by k-point.
+
+    Chunks of one k-point are divided along the band axis not to exceed 4 MiB.
+
+    """
+    chunks = [1] + list(shape[1:])
+    n_split = int(np.ceil(np.prod(chunks) * itemsize / (4 * 1024**2)))
+    chunks[1] = int(np.ceil(chunks[1] / n_split))
+    kwargs: dict = {"chunks": tuple(chunks)}
+    if compression is not None:
+        kwargs.update({"compression": compression, "shuffle": True})
+    return kwargs
@@ -79,7 +79,7 @@ class CoreCharge:
 
     """
 
-    def __init__(self, projectors, qij):
+    def __init__(self, projectors, qij, k_chunk_size=None):
         """Init method.
 
         Parameters
@@ -92,10 +92,16 @@ class CoreCharge:
             <phi_i|phi_j> - <phi_i~|phi_j~>
             dtype=complex128
             shape=(ncdij, nions, lmdim, lmdim')
+        k_chunk_size : int, optional
+            Number of k-points whose projectors are contracted at once. With
+            this, only the projectors of the chunk are read from ``projectors``
+            that can be a memory map of DPROJECTORS.bin. Default is None, i.e.,
+            all k-points at once.
 
         """
         self._proj = projectors
         self._qij = qij
+        self._k_chunk_size = k_chunk_size
 
         self._cc = None
         self._run()
@@ -115,31 +121,28 @@ class CoreCharge:
         return text
 
     def _run(self):
-        proj = self._proj[:, :, :, :, :, :, 0]
-        qij = self._qij
-        self._cc = np.zeros(proj.shape[0:2], dtype=proj.dtype)
-        for i_i in range(proj.shape[4]):
-            for i_s in range(proj.shape[2]):
-                # Here assume not using non-collinear
-                #
-                # ncdij = i_s + i_n + j_n*2 (two loops for non-collinear)
-                # In fortran
-                #   i_s: 1 or 2
-                #   i_n: 0 or 1
-                #   i_n + j_n * 2: 0, 1, 2, or 3
-                #   i_s i_n +j_n * 2: 1, 2, 3, or 4
-                for lm, lmp in np.ndindex(qij.shape[2:]):
-                    self._cc[:, :] += (
-                        proj[:, :, i_s, 0, i_i, lm]
-                        * qij[i_s, i_i, lm, lmp]
-                        * proj[:, :, i_s, 0, i_i, lmp].conj()
-                    )
+        nkpts, nbtot, ispin = self._proj.shape[0:3]
+        # Here assume not using non-collinear
+        #
+        # ncdij = i_s + i_n + j_n*2 (two loops for non-collinear)
+        # In fortran
+        #   i_s: 1 or 2
+        #   i_n: 0 or 1
+        #   i_n + j_n * 2: 0, 1, 2, or 3
+        #   i_s i_n +j_n * 2: 1, 2, 3, or 4
+        qij = self._qij[:ispin]
+        self._cc = np.zeros((nkpts, nbtot), dtype=np.result_type(self._proj, qij))
+        for k_slice in _get_k_slices(nkpts, self._k_chunk_size):
+            proj = np.asarray(self._proj[k_slice, :, :, 0, :, :, 0])
+            self._cc[k_slice] = np.einsum(
+                "kbsil,silm,kbsim->kb", proj, qij, proj.conj(), optimize=True
+            )
 
 
 class Procar(Projector):
     """Class to reproduce VASP PROCAR values."""
 
-    def __init__(self, projectors, lm_orbitals, qtot):
+    def __init__(self, projectors, lm_orbitals, qtot, k_chunk_size=None):
         """Init method.
 
         Parameters
@@ -148,10 +151,14 @@ class Procar(Projector):
             <phi_i|phi_j> - <phi~_i|phi~_j>
             dtype=complex128
             shape=(nions, ldim, ldim')
+        k_chunk_size : int, optional
+            Number of k-points whose projectors are contracted at once.
+            Default is None, i.e., all k-points at once. See CoreCharge.
 
         """
         super(Procar, self).__init__(projectors, lm_orbitals)
         self._qtot = qtot
+        self._k_chunk_size = k_chunk_size
         self._run()
 
     def __str__(self):
@@ -172,23 +179,14 @@ class Procar(Projector):
         return self._procar.real
 
     def _run(self):
-        proj = self._proj[:, :, :, :, :, :, 0]
-        procar = np.zeros(
-            (proj.shape[2], proj.shape[0], proj.shape[1], proj.shape[4], 9),
-            dtype="complex128",
-        )
-
-        for i_atom in range(self._proj.shape[4]):
-            lm_to_l, lm_pairs = self._get_lm_pairs(i_atom)
-            channels, channel_pairs = self._get_channel_pairs(lm_pairs)
-            for i_k, i_b, i_s, i_n in np.ndindex(self._proj.shape[0:4]):
-                procar[i_s, i_k, i_b, i_atom] += self._get_l_overlap(
-                    proj[i_k, i_b, i_s, i_n, i_atom],
-                    lm_to_l,
-                    channels,
-                    channel_pairs,
-                    i_atom,
-                )
+        nkpts, nbtot, ispin, _, nions = self._proj.shape[0:5]
+        weights = self._get_l_overlap_weights()
+        procar = np.zeros((ispin, nkpts, nbtot, nions, 9), dtype="complex128")
+        for k_slice in _get_k_slices(nkpts, self._k_chunk_size):
+            proj = np.asarray(self._proj[k_slice, :, :, :, :, :, 0])
+            procar[:, k_slice] = np.einsum(
+                "kbsnai,aijx,kbsnaj->skbax", proj, weights, proj.conj(), optimize=True
+            )
         self._procar = procar
 
     def _get_procar_lines(self):
@@ -211,17 +209,29 @@ class Procar(Projector):
         text += " ".join(["%6.3f" % x for x in procar[i_atom].real])
         return text
 
-    def _get_l_overlap(self, proj_lm, lm_to_l, channels, channel_pairs, i_atom):
-        """Compute <wf-char_m>^* qtot_mm' <wf-char_m'>."""
-        p_sum = np.zeros(9, dtype=proj_lm.dtype)
-        for lm, c_pair in zip(channels, channel_pairs, strict=True):
-            # print(str(c_pair) + " " + str(lm))
-            ll = lm_to_l[c_pair[0]]
-            lp = lm_to_l[c_pair[1]]
-            qtot = self._qtot[i_atom][ll][lp]
-            lm_index = lm[0] ** 2 + lm[1] + lm[0]
-            p_sum[lm_index] += proj_lm[c_pair[0]] * qtot * np.conj(proj_lm[c_pair[1]])
-        return p_sum
+    def _get_l_overlap_weights(self):
+        """Return weights of <wf-char_m>^* qtot_mm' <wf-char_m'> in lm channels.
+
+        Returns
+        -------
+        ndarray
+            qtot of pairs of lm orbitals of the same (l, m) at the lm channel
+            index of l**2 + m + l, and zero for other pairs.
+            dtype=complex128
+            shape=(nions, lmdim, lmdim, 9)
+
+        """
+        nions, lmdim = self._proj.shape[4:6]
+        weights = np.zeros((nions, lmdim, lmdim, 9), dtype="complex128")
+        for i_atom in range(nions):
+            lm_to_l, lm_pairs = self._get_lm_pairs(i_atom)
+            channels, channel_pairs = self._get_channel_pairs(lm_pairs)
+            for lm, (i, j) in zip(channels, channel_pairs, strict=True):
+                lm_index = lm[0] ** 2 + lm[1] + lm[0]
+                weights[i_atom, i, j, lm_index] = self._qtot[i_atom][lm_to_l[i]][
+                    lm_to_l[j]
+                ]
+        return weights
 
 
 class QTOT:
@@ -252,3 +262,14 @@ class QTOT:
                 text += " ".join(["%10.5f" % x for x in qtot_l])
                 text += "\n"
         return text
+
+
+def _get_k_slices(nkpts, k_chunk_size):
+    """Return slices of k-points in chunks."""
+    if k_chunk_size is None:
+        return [slice(0, nkpts)]
+    if k_chunk_size < 1:
+        raise ValueError("k_chunk_size has to be positive.")
+    return [
+        slice(i, min(i + k_chunk_size, nkpts)) for i in range(0, nkpts, k_chunk_size)
+    ]
@@ -8,7 +8,6 @@ import numpy as np
 from phonopy.interface.vasp import VasprunxmlExpat, get_vasp_structure_lines, read_vasp
 
 from phelel.interface.vasp.file_IO import (
-    get_CHGCAR,
     read_dprojectors,
     read_eigenvalues,
     read_inwap_yaml,
@@ -16,8 +15,12 @@ from phelel.interface.vasp.file_IO import (
     read_PAW_Dij_qij,
     read_qtot,
     read_waves,
+    write_CHGCAR,
 )
-from phelel.interface.vasp.procar import QTOT, CoreCharge, Procar
+from phelel.interface.vasp.procar import QTOT, CoreCharge, Procar, _get_k_slices
+
+# Bytes of DPROJECTORS.bin processed at a time when k_chunk_size is not given.
+_PROJECTOR_CHUNK_BYTES = 256 * 1024**2
 
 
 class DijQij:
@@ -112,9 +115,8 @@ class LocalPotential:
 
     def write_locpot(self, header, spin_polarized=False, filename="locpot.dat"):
         """Write local potential to locpot.dat."""
-        text = get_CHGCAR(self._V_loc[0].real, header)
         with open(filename, "w") as w:
-            w.write(text)
+            write_CHGCAR(w, self._V_loc[0].real, header)
 
     def __str__(self):
         """Return array shape of local potential as text."""
@@ -152,9 +154,8 @@ class WaveFunction:
     def write_charge(self, header, spin_polarized=False, filename="charge.dat"):
         """Write sum of squared orbitals to charge.dat."""
         charge = self._sum_charge(spin_polarized)
-        text = get_CHGCAR(charge, header)
         with open(filename, "w") as w:
-            w.write(text)
+            write_CHGCAR(w, charge, header)
         return charge.sum() / np.prod(charge.shape)
 
     def _square_sum(self, ikpt=0, iband=0, ispin=0, ispinor=0):
@@ -200,8 +201,18 @@ class WaveFunction:
 class VaspShowData:
     """Show el-ph related data generated by VASP."""
 
-    def __init__(self):
-        """Init method."""
+    def __init__(self, k_chunk_size=None):
+        """Init method.
+
+        Parameters
+        ----------
+        k_chunk_size : int, optional
+            Number of k-points of DPROJECTORS.bin processed at a time to write
+            dprojects.hdf5 and to compute PROCAR and core charge. By default,
+            it is chosen so that a chunk is at most 256 MiB.
+
+        """
+        self._k_chunk_size = k_chunk_size
         self.parse()
 
     def parse(self):
@@ -217,15 +228,23 @@ class VaspShowData:
         else:
             self._eigvals = None
         if os.path.exists("WAVES.bin"):
-            self._waves = read_waves(self._inwap, filename="WAVES.bin")
+            self._waves = read_waves(self._inwap, filename="WAVES.bin", mmap=True)
         else:
             self._waves = None
         if os.path.exists("DPROJECTORS.bin"):
-            self._proj = read_dprojectors(self._inwap, filename="DPROJECTORS.bin")
-            filename = "dprojects.hdf5"
-            w = h5py.File(filename, "w")
-            w.create_dataset("cproj", data=self._proj)
-            w.close()
+            # Only chunks of k-points are loaded from the memory map at a time.
+            self._proj = read_dprojectors(
+                self._inwap, filename="DPROJECTORS.bin", mmap=True
+            )
+            if self._k_chunk_size is None:
+                nbytes_k = self._proj[0].nbytes
+                self._k_chunk_size = max(1, _PROJECTOR_CHUNK_BYTES // nbytes_k)
+            with h5py.File("dprojects.hdf5", "w") as w:
+                cproj = w.create_dataset(
+                    "cproj", shape=self._proj.shape, dtype=self._proj.dtype
+                )
+                for k_slice in _get_k_slices(len(self._proj), self._k_chunk_size):
+                    cproj[k_slice] = self._proj[k_slice]
         else:
             self._proj = None
 
@@ -311,13 +330,18 @@ class VaspShowData:
     @property
     def procar(self):
         """Return Procar class instance."""
-        proj = Procar(self._proj, self._inwap["lm_orbitals"], self._qtot)
+        proj = Procar(
+            self._proj,
+            self._inwap["lm_orbitals"],
+            self._qtot,
+            k_chunk_size=self._k_chunk_size,
+        )
         return proj
 
     @property
     def core_charge(self):
         """Return CoreCharge class instance."""
-        rho = CoreCharge(self._proj, self._qij)
+        rho = CoreCharge(self._proj, self._qij, k_chunk_size=self._k_chunk_size)
         return rho
 
     def _parse_vasprun_xml(self, filename="vasprun.xml"):
@@ -0,0 +1,47 @@
+"""Utilities of concurrent execution."""
+
+from __future__ import annotations
+
+import collections
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, TypeVar
+
+_T = TypeVar("_T")
+
+
+def iter_read_ahead(
+    func: Callable[..., _T], *iterables: Iterable, n_workers: int | None = None
+) -> Iterator[_T]:
+    """Yield func applied to items of iterables in order, reading ahead by threads.
+
+    This works as ``map(func, *iterables)``, but the iterables have to be of
+    the same length. With ``n_workers``, calls are run by a thread pool of this
+    size, and at most ``n_workers`` calls are submitted ahead of the result
+    being yielded, so that memory of results computed but not yet consumed is
+    bounded.
+
+    Parameters
+    ----------
+    func : Callable
+        Function called with one item of each of iterables.
+    iterables : Iterable
+        Arguments of func.
+    n_workers : int or None, optional
+        Number of threads. Default is None, i.e., func is called serially when
+        the next result is requested.
+
+    """
+    args = zip(*iterables, strict=True)
+    if n_workers is None or n_workers < 2:
+        for arg in args:
+            yield func(*arg)
+        return
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures: collections.deque[Future[Any]] = collections.deque()
+        for arg in args:
+            if len(futures) == n_workers:
+                yield futures.popleft().result()
+            futures.append(executor.submit(func, *arg))
+        while futures:
+            yield futures.popleft().result()
@@ -12,8 +12,11 @@ def cmplx2real(array: np.ndarray) -> np.ndarray:
 
         a + 1j * b -> (a, b)
 
+    complex64 is viewed by float32 in the same way.
+
     """
-    return array.view("double").reshape(array.shape + (2,))
+    dtype = "f%d" % (array.dtype.itemsize // 2)
+    return array.view(dtype).reshape(array.shape + (2,))
 
 
 def real2cmplx(array: np.ndarray) -> np.ndarray:
@@ -23,6 +26,73 @@ def real2cmplx(array: np.ndarray) -> np.ndarray:
 
         a + 1j * b <- (a, b)
 
+    float32 is viewed by complex64 in the same way.
+
     """
-    dtype = "c%d" % (np.dtype("double").itemsize * 2)
+    dtype = "c%d" % (array.dtype.itemsize * 2)
     return array.view(dtype).reshape(array.shape[:-1])
+
+
+class LazyComplexArray:
+    """Complex array view of real-valued array-like, e.g., h5py dataset.
+
+    The last axis of size 2 of the real-valued array-like is viewed as real and
+    imaginary parts as done by ``real2cmplx``. Only the selected part is read
+    by indexing, e.g., ``lazy_array[:, i_atom]``. Indexing follows that of the
+    underlying array-like, e.g., h5py supports at most one list of increasing
+    indices per selection. The full array is read by ``np.asarray``.
+
+    """
+
+    def __init__(self, data):
+        """Init method.
+
+        Parameters
+        ----------
+        data : array-like
+            Real-valued array-like of shape=(..., 2), e.g., h5py dataset.
+
+        """
+        if data.shape[-1] != 2:
+            raise ValueError("Last dimension of data has to be 2.")
+        self._data = data
+
+    @property
+    def data(self):
+        """Return underlying real-valued array-like."""
+        return self._data
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        """Return shape of complex array."""
+        return tuple(self._data.shape[:-1])
+
+    @property
+    def ndim(self) -> int:
+        """Return number of dimensions of complex array."""
+        return len(self.shape)
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Return dtype of complex array."""
+        return np.dtype("c%d" % (self._data.dtype.itemsize * 2))
+
+    def __len__(self) -> int:
+        """Return length of the first axis."""
+        return self.shape[0]
+
+    def __getitem__(self, key) -> np.ndarray:
+        """Read selected part and return it as complex array."""
+        if not isinstance(key, tuple):
+            key = (key,)
+        if not any(k is Ellipsis for k in key):
+            key = key + (slice(None),) * (self.ndim - len(key))
+        values = np.asarray(self._data[key + (slice(None),)])
+        return real2cmplx(np.ascontiguousarray(values))
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        """Read all and return it as complex array."""
+        values = self[...]
+        if dtype is None:
+            return values
+        return values.astype(dtype)
@@ -0,0 +1,231 @@
+"""Recorder of computational costs of stages of calculations."""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from typing import Any
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None  # type: ignore[assignment]
+
+
+class Profiler:
+    """Recorder of wall time, CPU time, and memory usage of stages.
+
+    Stages are nested by ``stage`` context managers, and each stage is
+    recorded with its path when it is exited, e.g.,
+    "run_derivatives/dVdu/displaced_atom/atom/ifft". Stages of calculations at
+    atoms are recorded with the atom index in supercell.
+
+    CPU time is that of the process, i.e., that of all threads. Peak RSS is the
+    largest resident set size of the process since its start, and is None when
+    it is not available on the platform. With ``trace_allocations=True``, bytes
+    allocated by Python and numpy at peak during each stage are measured by
+    tracemalloc, which slows down calculations.
+
+    Stages have to be entered and exited by one thread.
+
+    Attributes
+    ----------
+    records : list[dict]
+        Records of exited stages in the order of their exits. Keys are "name",
+        "atom", "wall", "cpu", "peak_rss", and "allocated". Times are in
+        seconds and memory sizes are in bytes.
+
+    """
+
+    def __init__(self, trace_allocations: bool = False):
+        """Init method.
+
+        Parameters
+        ----------
+        trace_allocations : bool, optional
+            Measure allocated bytes by tracemalloc. Default is False.
+
+        """
+        self._trace_allocations = trace_allocations
+        self._records: list[dict] = []
+        # Names of entered stages and peaks of allocations of their children.
+        self._stack: list[list] = []
+
+    @property
+    def records(self) -> list[dict]:
+        """Return records of exited stages."""
+        return self._records
+
+    @property
+    def path(self) -> str:
+        """Return path of current stage."""
+        return "/".join(name for name, _ in self._stack)
+
+    @contextmanager
+    def stage(self, name: str, atom: int | None = None) -> Iterator[None]:
+        """Record costs of stage in with statement.
+
+        Parameters
+        ----------
+        name : str
+            Name of stage. This is appended to the path of the current stage.
+        atom : int or None, optional
+            Index of atom in supercell at which the stage is computed.
+
+        """
+        tracing = self._trace_allocations
+        if tracing:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            allocated_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._stack.append([name, 0])
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            path = self.path
+            _, children_peak = self._stack.pop()
+            allocated = None
+            if tracing:
+                peak = max(tracemalloc.get_traced_memory()[1], children_peak)
+                allocated = peak - allocated_start
+                if self._stack:
+                    self._stack[-1][1] = max(self._stack[-1][1], peak)
+                else:
+                    tracemalloc.stop()
+            self._records.append(
+                {
+                    "name": path,
+                    "atom": None if atom is None else int(atom),
+                    "wall": wall,
+                    "cpu": cpu,
+                    "peak_rss": get_peak_rss(),
+                    "allocated": allocated,
+                }
+            )
+
+    def add_records(self, records: list[dict]):
+        """Add records measured by another profiler under current stage.
+
+        This is used to collect records of worker processes.
+
+        """
+        path = self.path
+        for record in records:
+            record = dict(record)
+            if path:
+                record["name"] = f"{path}/{record['name']}"
+            self._records.append(record)
+
+    def get_summary(self) -> list[dict]:
+        """Return costs summed over records of each stage.
+
+        Returns
+        -------
+        list[dict]
+            Stages in the order of their first exits. Keys are "name",
+            "count", "wall", "cpu", "peak_rss", and "allocated", where
+            "peak_rss" and "allocated" are the largest values among records.
+
+        """
+        summary: dict[str, dict] = {}
+        for record in self._records:
+            name = record["name"]
+            if name not in summary:
+                summary[name] = {
+                    "name": name,
+                    "count": 0,
+                    "wall": 0.0,
+                    "cpu": 0.0,
+                    "peak_rss": None,
+                    "allocated": None,
+                }
+            s = summary[name]
+            s["count"] += 1
+            s["wall"] += record["wall"]
+            s["cpu"] += record["cpu"]
+            for key in ("peak_rss", "allocated"):
+                if record[key] is not None:
+                    s[key] = record[key] if s[key] is None else max(s[key], record[key])
+        return list(summary.values())
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return summary and records."""
+        return {"summary": self.get_summary(), "records": self._records}
+
+    def write_json(self, filename: str | os.PathLike = "phelel_profile.json"):
+        """Write summary and records in JSON."""
+        with open(filename, "w") as w:
+            json.dump(self.to_dict(), w, indent=1)
+
+    def __str__(self) -> str:
+        """Return summary table of stages and displaced atoms."""
+        lines = [
+            "%-56s %6s %10s %10s %10s %10s"
+            % ("Stage", "Count", "Wall (s)", "CPU (s)", "RSS (MB)", "Alloc (MB)")
+        ]
+        for s in self.get_summary():
+            lines.append(
+                "%-56s %6d %10.3f %10.3f %10s %10s"
+                % (
+                    s["name"],
+                    s["count"],
+                    s["wall"],
+                    s["cpu"],
+                    _format_mb(s["peak_rss"]),
+                    _format_mb(s["allocated"]),
+                )
+            )
+        atom_records = [
+            r for r in self._records if r["name"].endswith("displaced_atom")
+        ]
+        if atom_records:
+            lines.append("")
+            lines.append(
+                "%-56s %6s %10s %10s %10s"
+                % ("Displaced atom", "Atom", "Wall (s)", "CPU (s)", "RSS (MB)")
+            )
+            for r in atom_records:
+                lines.append(
+                    "%-56s %6s %10.3f %10.3f %10s"
+                    % (
+                        r["name"],
+                        "-" if r["atom"] is None else r["atom"] + 1,
+                        r["wall"],
+                        r["cpu"],
+                        _format_mb(r["peak_rss"]),
+                    )
+                )
+        return "\n".join(lines)
+
+
+def profiling_stage(profiler: Profiler | None, name: str, atom: int | None = None):
+    """Return context manager of stage of profiler, or no-op without profiler."""
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name, atom=atom)
+
+
+def get_peak_rss() -> int | None:
+    """Return peak resident set size of this process in bytes."""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return int(maxrss)
+    return int(maxrss) * 1024
+
+
+def _format_mb(nbytes: int | None) -> str:
+    if nbytes is None:
+        return "-"
+    return "%.1f" % (nbytes / 1024**2)
@@ -0,0 +1,142 @@
+"""Rotation matrices of symmetry operations shared among calculations."""
+
+from __future__ import annotations
+
+import weakref
+
+import numpy as np
+from numpy.typing import NDArray
+from phonopy.structure.symmetry import Symmetry
+
+from phelel.utils.spherical_harmonics import (
+    LxLyLzMatrices,
+    SHRotationMatrices,
+    get_n_and_rotation_order,
+)
+from phelel.utils.spinor import SpinorRotationMatrices
+
+_rotation_tables: weakref.WeakKeyDictionary[
+    Symmetry, dict[bytes, SymmetryRotationTable]
+] = weakref.WeakKeyDictionary()
+
+
+class SymmetryRotationTable:
+    """Table of rotation matrices of symmetry operations.
+
+    Matrices are computed when they are requested first time and kept for
+    later requests. Symmetry operations are specified by their indices in
+    ``Symmetry.symmetry_operations``.
+
+    Attributes
+    ----------
+    r_carts : ndarray
+        Rotation matrices in Cartesian coordinates.
+        shape=(n_operations, 3, 3), dtype='double'
+
+    """
+
+    def __init__(self, rotations: NDArray, lattice: NDArray, l_max: int = 6):
+        """Init method.
+
+        Parameters
+        ----------
+        rotations : ndarray
+            Rotation matrices wrt basis vectors (not Cartesian).
+            shape=(n_operations, 3, 3)
+        lattice : ndarray
+            Basis vectors in column vectors.
+            shape=(3, 3)
+        l_max : int, optional
+            Maximum l of rotation matrices of spherical harmonics. Default is 6.
+
+        """
+        self._rotations = np.array(rotations, dtype="int64", order="C")
+        self._lattice = np.array(lattice, dtype="double", order="C")
+        self._l_max = l_max
+        self._r_carts = np.array(
+            self._lattice @ self._rotations @ np.linalg.inv(self._lattice),
+            dtype="double",
+            order="C",
+        )
+        self._lxlylz: LxLyLzMatrices | None = None
+        self._axes_and_orders: dict[int, tuple[NDArray, int, int]] = {}
+        self._sh_Deltas: dict[int, list[NDArray]] = {}
+        self._spinor_Deltas: dict[int, NDArray] = {}
+
+    @property
+    def r_carts(self) -> NDArray:
+        """Return rotation matrices in Cartesian coordinates."""
+        return self._r_carts
+
+    def get_axis_and_order(self, i_op: int) -> tuple[NDArray, int, int]:
+        """Return proper-rotation axis, order of rotation, and det(R).
+
+        These are shared by rotation matrices of spherical harmonics and spinor
+        of the operation. See ``get_n_and_rotation_order``.
+
+        """
+        if i_op not in self._axes_and_orders:
+            self._axes_and_orders[i_op] = get_n_and_rotation_order(
+                self._rotations[i_op], self._lattice
+            )
+        return self._axes_and_orders[i_op]
+
+    def get_sh_Delta(self, i_op: int) -> list[NDArray]:
+        """Return rotation matrices of spherical harmonics up to l_max.
+
+        See ``SHRotationMatrices``.
+
+        """
+        if i_op not in self._sh_Deltas:
+            if self._lxlylz is None:
+                self._lxlylz = LxLyLzMatrices(l_max=self._l_max).run()
+            shr = SHRotationMatrices(
+                self._rotations[i_op],
+                self._lattice,
+                self._lxlylz,
+                axis_and_order=self.get_axis_and_order(i_op),
+            )
+            shr.run()
+            assert shr.Delta is not None
+            self._sh_Deltas[i_op] = shr.Delta
+        return self._sh_Deltas[i_op]
+
+    def get_spinor_Delta(self, i_op: int) -> NDArray:
+        """Return 2x2 rotation matrix of spinor.
+
+        See ``SpinorRotationMatrices``.
+
+        """
+        if i_op not in self._spinor_Deltas:
+            srm = SpinorRotationMatrices(
+                self._rotations[i_op],
+                self._lattice,
+                axis_and_order=self.get_axis_and_order(i_op),
+            ).run()
+            self._spinor_Deltas[i_op] = srm.Delta
+        return self._spinor_Deltas[i_op]
+
+
+def get_symmetry_rotation_table(
+    symmetry: Symmetry, lattice: NDArray
+) -> SymmetryRotationTable:
+    """Return rotation table of symmetry operations of Symmetry instance.
+
+    The table is shared while the Symmetry instance is alive.
+
+    Parameters
+    ----------
+    symmetry : Symmetry
+        Symmetry of the crystal structure whose basis vectors are lattice.
+    lattice : ndarray
+        Basis vectors in column vectors.
+        shape=(3, 3)
+
+    """
+    tables = _rotation_tables.setdefault(symmetry, {})
+    key = np.array(lattice, dtype="double", order="C").tobytes()
+    if key not in tables:
+        tables[key] = SymmetryRotationTable(
+            symmetry.symmetry_operations["rotations"], lattice
+        )
+    return tables[key]
@@ -305,7 +305,13 @@ class SHRotationMatrices:
 
     """
 
-    def __init__(self, R: np.ndarray, lattice: np.ndarray, lxlylz: LxLyLzMatrices):
+    def __init__(
+        self,
+        R: np.ndarray,
+        lattice: np.ndarray,
+        lxlylz: LxLyLzMatrices,
+        axis_and_order: Optional[tuple[np.ndarray, int, int]] = None,
+    ):
         """Init method.
 
         Parameters
@@ -317,12 +323,17 @@ class SHRotationMatrices:
             Basis vectors in column vectors.
             shape=(3, 3)
         lxlylz : LxLyLzMatrices
+        axis_and_order : tuple, optional
+            Return value of ``get_n_and_rotation_order(R, lattice)``. If this
+            is not given, it is computed.
 
         """
         self._lxlylz = lxlylz
         self._d = None
         self._Delta = None
-        self._n_vec, self._r_order, self._detR = get_n_and_rotation_order(R, lattice)
+        if axis_and_order is None:
+            axis_and_order = get_n_and_rotation_order(R, lattice)
+        self._n_vec, self._r_order, self._detR = axis_and_order
         if self._r_order == 1:
             self._alpha = 0.0
         else:
@@ -117,6 +117,7 @@ class SpinorRotationMatrices:
         R: np.ndarray,
         lattice: np.ndarray,
         sxsysz: Optional[SxSySzMatrices] = None,
+        axis_and_order: Optional[tuple[np.ndarray, int, int]] = None,
     ):
         """Init method.
 
@@ -130,6 +131,9 @@ class SpinorRotationMatrices:
             shape=(3, 3)
         sxsysz : SxSySzMatrices, optional
             Generators of spin rotation. If this is not given, PauliMatrices is used.
+        axis_and_order : tuple, optional
+            Return value of ``get_n_and_rotation_order(R, lattice)``. If this
+            is not given, it is computed.
 
         """
         if sxsysz is None:
@@ -143,7 +147,9 @@ class SpinorRotationMatrices:
             self._sy = self._sxsysz.Sy
             self._sz = self._sxsysz.Sz
         self._d = None
-        self._n_vec, self._r_order, self._detR = get_n_and_rotation_order(R, lattice)
+        if axis_and_order is None:
+            axis_and_order = get_n_and_rotation_order(R, lattice)
+        self._n_vec, self._r_order, self._detR = axis_and_order
         if self._r_order == 1:
             self._alpha = 0.0
         else:
@@ -100,6 +100,16 @@ def cmd_generate(toml_filename: str):
         "(encut: float, default=None)"
     ),
 )
+@click.option(
+    "--checkpoint",
+    "use_checkpoint",
+    is_flag=True,
+    default=False,
+    help=(
+        "Write derivatives of each displaced atom to "
+        '"phelel/phelel_checkpoint.hdf5" and skip those found in it at restart.'
+    ),
+)
 @click.option(
     "-v",
     "verbose",
@@ -111,11 +121,16 @@ def cmd_generate(toml_filename: str):
 def cmd_differentiate(
     toml_filename: str,
     encut: float | None,
+    use_checkpoint: bool,
     verbose: bool,
 ) -> None:
     """Calculate derivatives and write phelel_params.hdf5."""
     dir_name = "phelel"
     hdf5_filename = pathlib.Path(f"{dir_name}/phelel_params.hdf5")
+    if use_checkpoint:
+        checkpoint = pathlib.Path(f"{dir_name}/phelel_checkpoint.hdf5")
+    else:
+        checkpoint = None
     yaml_filename = pathlib.Path(f"{dir_name}/phelel_disp.yaml")
 
     with open(toml_filename, "rb") as f:
@@ -160,10 +175,13 @@ def cmd_differentiate(
         else:
             click.echo(f"FFT mesh: {phe.fft_mesh} (encut={encut}).")
 
-    if run_derivatives(phe, dir_name=dir_name, verbose=verbose):
+    if run_derivatives(phe, dir_name=dir_name, checkpoint=checkpoint, verbose=verbose):
         pathlib.Path(hdf5_filename).parent.mkdir(parents=True, exist_ok=True)
         phe.save_hdf5(filename=hdf5_filename)
         click.echo(f'"{hdf5_filename}" has been made.')
+        if checkpoint is not None and checkpoint.exists():
+            checkpoint.unlink()
+            click.echo(f'"{checkpoint}" has been removed.')
 
 
 #
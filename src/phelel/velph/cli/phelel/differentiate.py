@@ -16,9 +16,16 @@ def run_derivatives(
     phe: Phelel,
     subtract_residual_forces: bool = True,
     dir_name: str | os.PathLike = "phelel",
+    checkpoint: str | os.PathLike | None = None,
     verbose: bool = False,
 ) -> bool:
-    """Calculate derivatives and write phelel_params.hdf5."""
+    """Calculate derivatives and write phelel_params.hdf5.
+
+    With checkpoint file name, derivatives of each displaced atom are written
+    to the file as soon as they are computed, and those found in the file are
+    not computed again.
+
+    """
     dir_names = []
     if phe.supercells_with_displacements is None:
         raise RuntimeError("supercells_with_displacements is None.")
@@ -63,6 +70,7 @@ def run_derivatives(
         phe,
         dir_names,
         subtract_rfs=subtract_residual_forces,
+        checkpoint=checkpoint,
         log_level=int(verbose),
     )
 
@@ -2,8 +2,11 @@
 
 import pathlib
 
+import numpy as np
+
 from phelel.api_phelel import Phelel, PhelelDataset
 from phelel.base.Dij_qij import DDijQij, DDijQijFit, DeltaDijQij
+from phelel.utils.rotations import get_symmetry_rotation_table
 
 cwd = pathlib.Path(__file__).parent
 
@@ -76,3 +79,49 @@ def test_DDijQij(phelel_empty_CdAs2_111: Phelel, phelel_input_CdAs2_111: PhelelD
         displacements,
         phe_in.lm_channels,
     )
+
+
+def test_DDijQijFit_inv_rotated_dDij_qij(
+    phelel_empty_CdAs2_111: Phelel, phelel_input_CdAs2_111: PhelelDataset
+):
+    """Test orbital rotations of all atoms at once against atom by atom.
+
+    Cd and As have different layouts of lm channels.
+
+    """
+    phe = phelel_empty_CdAs2_111
+    phe_in = phelel_input_CdAs2_111
+    assert phe.dataset is not None
+    layouts = {tuple(ll["l"] for ll in c["channels"]) for c in phe_in.lm_channels}
+    assert len(layouts) > 1
+
+    delta_Dij_qij = DeltaDijQij(
+        phe_in.Dijs[0],
+        phe_in.Dijs[1],
+        phe_in.qijs[0],
+        phe_in.qijs[1],
+        phe.dataset["first_atoms"][0],
+        phe_in.lm_channels,
+    )
+    ddijqij = DDijQijFit([delta_Dij_qij], phe.supercell, phe.symmetry, verbose=False)
+    rot_table = get_symmetry_rotation_table(phe.symmetry, phe.supercell.cell.T)
+    lmdim = delta_Dij_qij.dDij.shape[-1]
+    atoms = np.arange(len(phe.supercell))[::-1]
+    for i_op in range(len(phe.symmetry.symmetry_operations["rotations"])):
+        rot_dDij, rot_dqij = ddijqij._get_inv_rotated_dDij_qij(
+            delta_Dij_qij, i_op, atoms
+        )
+        Delta = rot_table.get_sh_Delta(i_op)
+        for i, atom in enumerate(atoms):
+            layout = tuple(
+                ll["l"] for ll in delta_Dij_qij.lm_channels[atom]["channels"]
+            )
+            B = ddijqij._get_big_Delta(Delta, layout, lmdim)
+            for rot, dX in (
+                (rot_dDij, delta_Dij_qij.dDij),
+                (rot_dqij, delta_Dij_qij.dqij),
+            ):
+                np.testing.assert_allclose(
+                    rot[:, i], B @ dX[:, atom] @ B.T.conj(), rtol=0, atol=1e-12
+                )
+        assert ddijqij._get_big_Deltas(i_op, delta_Dij_qij) is ddijqij._big_Deltas[i_op]
@@ -0,0 +1,170 @@
+"""Test for functions in local_potential.py."""
+
+import pathlib
+
+import finufft
+import h5py
+import numpy as np
+import pytest
+
+from phelel import Phelel
+from phelel.api_phelel import PhelelDataset
+from phelel.base.local_potential import (
+    DeltaLocalPotential,
+    DistributionVisualization,
+    DLocalPotential,
+    LocalPotentialInterpolationNUFFT,
+    rotate_delta_vals_in_spin_space,
+)
+from phelel.utils.rotations import get_symmetry_rotation_table
+from phelel.utils.spinor import SpinorRotationMatrices
+
+
+def test_rotate_delta_vals_in_spin_space():
+    """Test rotate_delta_vals_in_spin_space against A B A^+ of 2x2 matrices."""
+    lattice = np.diag([4.0, 4.0, 6.0])
+    r = np.array([[0, -1, 0], [1, 0, 0], [0, 0, 1]])
+    rng = np.random.default_rng(0)
+    vals = rng.random((4, 3, 5)) + 1j * rng.random((4, 3, 5))
+
+    A = SpinorRotationMatrices(r, lattice).run().Delta
+    B = vals.reshape(2, 2, 3, 5).transpose(2, 3, 0, 1)
+    ref = (A @ B @ A.T.conj()).transpose(2, 3, 0, 1).reshape(4, 3, 5)
+
+    rotated = rotate_delta_vals_in_spin_space(list(vals), r, lattice)
+    np.testing.assert_allclose(rotated, ref, atol=1e-12)
+
+    buf = np.zeros((2, 4, 3, 5), dtype=vals.dtype)
+    rotate_delta_vals_in_spin_space(vals, r, lattice, Delta=A, out=buf[1])
+    np.testing.assert_allclose(buf[1], ref, atol=1e-12)
+
+    rotate_delta_vals_in_spin_space(vals, r, lattice, out=vals)
+    np.testing.assert_allclose(vals, ref, atol=1e-12)
+
+
+def test_DLocalPotential_commensurate_C111(
+    phelel_empty_C111: Phelel, phelel_input_C111: PhelelDataset
+):
+    """Test dV gathered at grid points commensurate with FFT mesh of dV.
+
+    fft_mesh=[10, 10, 10] of fcc primitive cell is commensurate with the
+    [40, 40, 40] mesh of dV of the conventional supercell.
+
+    """
+    phe = phelel_empty_C111
+    loc_pots = phelel_input_C111.local_potentials
+    dVdus = []
+    for nufft in (None, "finufft"):
+        dlp = DLocalPotential(
+            [10, 10, 10],
+            phe.p2s_matrix,
+            phe.supercell,
+            symmetry=phe.symmetry,
+            nufft=nufft,
+            finufft_eps=1e-10,
+            verbose=False,
+        )
+        dlp.run(loc_pots[0], loc_pots[1:], phe.dataset["first_atoms"])
+        dVdus.append(dlp.dVdu)
+    np.testing.assert_allclose(dVdus[0], dVdus[1], rtol=0, atol=1e-6)
+
+
+def test_DLocalPotential_set_dVdu(phelel_C111: Phelel):
+    """Test dV/du is copied by setter and stored by reference with copy=False."""
+    dlp_ref = phelel_C111.dVdu
+    dVdu = np.array(dlp_ref.dVdu, dtype="complex128")
+    dlp = DLocalPotential(
+        dlp_ref.fft_mesh,
+        dlp_ref.p2s_matrix,
+        dlp_ref.supercell,
+        symmetry=dlp_ref.symmetry,
+        atom_indices=dlp_ref.atom_indices,
+        verbose=False,
+    )
+    dlp.dVdu = dVdu
+    assert not np.shares_memory(dlp.dVdu, dVdu)
+    np.testing.assert_array_equal(dlp.dVdu, dVdu)
+    dlp.set_dVdu(dVdu, copy=False)
+    assert dlp.dVdu is dVdu
+
+
+def test_DLocalPotential_visualize_C111(
+    phelel_C111: Phelel, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+):
+    """Test dV/du of all atoms written on grid of visualized cell."""
+    monkeypatch.chdir(tmp_path)
+    dlp = phelel_C111.dVdu
+    dlp.visualize(phelel_C111.primitive, hdf5=True)
+    viz = DistributionVisualization(
+        phelel_C111.primitive, dlp.p2s_matrix, dlp.fft_mesh, dlp.grid_points
+    )
+    n_copies = np.prod(viz.shape) // len(dlp.grid_points)
+    for i, atom in enumerate(dlp.atom_indices):
+        dVdu = np.asarray(dlp.dVdu[0, i])
+        for i_dir, xyz in enumerate("xyz"):
+            with h5py.File("locpot_viz-%03d-%s.hdf5" % (atom + 1, xyz)) as f:
+                data = f["data"][:]
+            assert data.shape == viz.shape
+            np.testing.assert_allclose(
+                abs(data).sum(), abs(dVdu[i_dir].real).sum() * n_copies
+            )
+            np.testing.assert_array_equal(data, viz.get_distribution(dVdu[i_dir]).real)
+
+
+def test_LocalPotentialInterpolationNUFFT_batched_ncdij4(phelel_empty_C111: Phelel):
+    """Test batched finufft over site-symmetry operations with ncdij=4.
+
+    Accumulation of dV rotated in real and spin spaces by all site-symmetry
+    operations of an atom in one stacked transform is compared with that of
+    one transform per operation and per component.
+
+    """
+    phe = phelel_empty_C111
+    symmetry = phe.symmetry
+    lattice = phe.supercell.cell.T
+    rng = np.random.default_rng(0)
+    shape = (4, 12, 12, 12)
+    dV = rng.standard_normal(shape) + 1j * rng.standard_normal(shape)
+    delta_V = DeltaLocalPotential(np.zeros(shape), dV, {"number": 0})
+
+    i_ops = np.where(symmetry.atomic_permutations[:, 0] == 0)[0]
+    assert len(i_ops) > 1
+    rotations = symmetry.symmetry_operations["rotations"][i_ops]
+    translations = symmetry.symmetry_operations["translations"][i_ops]
+    disps_inv = rng.standard_normal((3, len(i_ops)))
+
+    dVdus = []
+    for batched in (True, False):
+        lpi = LocalPotentialInterpolationNUFFT(
+            [4, 4, 4],
+            phe.p2s_matrix,
+            phe.supercell,
+            symmetry,
+            nufft="finufft",
+            finufft_eps=1e-12,
+            verbose=False,
+        )
+        if not batched:
+            lpi._max_nufft_points = len(lpi.grid_points)
+        lpi.delta_Vs = [delta_V]
+        dVdu = np.zeros((4, 3, len(lpi.grid_points)), dtype="complex128")
+        lpi._accumulate_rotated_dVs(i_ops, disps_inv, dVdu)
+        dVdus.append(dVdu)
+    np.testing.assert_allclose(dVdus[0], dVdus[1], rtol=0, atol=1e-10)
+
+    # One transform per operation and per component.
+    rot_table = get_symmetry_rotation_table(symmetry, lattice)
+    dV_iFT = np.fft.fftshift(np.fft.ifftn(dV, axes=(1, 2, 3)), axes=(1, 2, 3))
+    ref = np.zeros_like(dVdus[0])
+    for i, (r, t, i_op) in enumerate(zip(rotations, translations, i_ops, strict=True)):
+        r_inv = np.linalg.inv(r)
+        points = (lpi.grid_points - t) @ r_inv.T
+        x, y, z = ((points - np.rint(points)) * (np.pi * 2)).T.copy()
+        dV_rot = np.array(
+            [finufft.nufft3d2(z, y, x, dV_iFT[c], eps=1e-12) for c in range(4)]
+        )
+        dV_rot = rotate_delta_vals_in_spin_space(
+            dV_rot, r, lattice, Delta=rot_table.get_spinor_Delta(i_op)
+        )
+        ref += disps_inv[:, i, None] * dV_rot[:, None, :]
+    np.testing.assert_allclose(dVdus[0], ref, rtol=0, atol=1e-10)
@@ -62,6 +62,27 @@ def test_read_files_C111():
     _ = read_files(phelel, dir_names, subtract_rfs=True, log_level=1)
 
 
+def test_read_files_C111_n_workers():
+    """Test reading directories concurrently gives the same data as serially."""
+    dir_names = [cwd / "C111-ncl_disp-000", cwd / "C111-ncl_disp-001"]
+    phe_input = read_files(
+        _get_phelel_C111("phelel_disp_C111.yaml"), dir_names, subtract_rfs=True
+    )
+    phe_input_threads = read_files(
+        _get_phelel_C111("phelel_disp_C111.yaml"),
+        dir_names,
+        subtract_rfs=True,
+        n_workers=2,
+    )
+    assert phe_input_threads.kinetic_potentials is None
+    for key in ("local_potentials", "Dijs", "qijs"):
+        for v, v_threads in zip(
+            getattr(phe_input, key), getattr(phe_input_threads, key), strict=True
+        ):
+            np.testing.assert_array_equal(v, v_threads)
+    np.testing.assert_array_equal(phe_input.forces, phe_input_threads.forces)
+
+
 def test_create_derivatives_C111():
     """Test creating derivatives with C-1x1x1.
 
@@ -95,6 +116,27 @@ def test_create_derivatives_C111_ncl():
     assert fc.shape[0] == fc.shape[1]
 
 
+def test_create_derivatives_C111_ncl_stream():
+    """Test creating derivatives displaced atom by displaced atom."""
+    dir_names = [cwd / "C111-ncl_disp-000", cwd / "C111-ncl_disp-001"]
+    phelel = _get_phelel_C111("phelel_disp_C111.yaml")
+    create_derivatives(phelel, dir_names, subtract_rfs=True)
+    phelel_stream = _get_phelel_C111("phelel_disp_C111.yaml")
+    create_derivatives(phelel_stream, dir_names, subtract_rfs=True, stream=True)
+    np.testing.assert_allclose(
+        phelel_stream.dVdu.dVdu, phelel.dVdu.dVdu, rtol=0, atol=1e-12
+    )
+    np.testing.assert_allclose(
+        phelel_stream.dDijdu.dDijdu, phelel.dDijdu.dDijdu, rtol=0, atol=1e-12
+    )
+    np.testing.assert_allclose(
+        phelel_stream.dDijdu.dqijdu, phelel.dDijdu.dqijdu, rtol=0, atol=1e-12
+    )
+    np.testing.assert_allclose(
+        phelel_stream.force_constants, phelel.force_constants, rtol=0, atol=1e-12
+    )
+
+
 def _get_phelel_C111(phelel_yaml_filename: str) -> Phelel:
     phe_yml = PhelelYaml().read(cwd / phelel_yaml_filename)
     phelel = Phelel(
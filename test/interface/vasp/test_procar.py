@@ -0,0 +1,65 @@
+"""Tests of PROCAR equivalent information."""
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from phelel.interface.vasp.procar import CoreCharge, Procar
+
+
+@pytest.fixture(scope="module")
+def projector_data():
+    """Return random projectors, lm_orbitals, qtot, and qij."""
+    rng = np.random.default_rng(0)
+    nkpts, nbtot, ispin, nrspinors, nions, lmdim = 5, 4, 2, 1, 2, 8
+    shape = (nkpts, nbtot, ispin, nrspinors, nions, lmdim, 4)
+    proj = rng.standard_normal(shape) + 1j * rng.standard_normal(shape)
+    channels = [
+        {"l": 0, "m": [0]},
+        {"l": 0, "m": [0]},
+        {"l": 1, "m": [-1, 0, 1]},
+        {"l": 1, "m": [-1, 0, 1]},
+    ]
+    lm_orbitals = [{"atom_index": i + 1, "channels": channels} for i in range(nions)]
+    qtot = rng.standard_normal((nions, 4, 4)) + 0j
+    qij = rng.standard_normal((4, nions, lmdim, lmdim)) + 0j
+    return proj, lm_orbitals, qtot, qij
+
+
+@pytest.mark.parametrize("k_chunk_size", [None, 2])
+def test_Procar(projector_data, k_chunk_size: int | None):
+    """Test Procar by sum over pairs of lm orbitals of the same (l, m)."""
+    proj, lm_orbitals, qtot, _ = projector_data
+    procar = Procar(proj, lm_orbitals, qtot, k_chunk_size=k_chunk_size).procar
+    assert procar.shape == (2, 5, 4, 2, 9)
+
+    # lm orbitals: s, s', p_-1, p_0, p_1, p'_-1, p'_0, p'_1
+    lm_to_l = [0, 1, 2, 2, 2, 3, 3, 3]
+    lm_index = [0, 0, 1, 2, 3, 1, 2, 3]
+    ref = np.zeros((2, 5, 4, 2, 9), dtype="complex128")
+    p = proj[:, :, :, 0, :, :, 0]
+    for i, j in np.ndindex(8, 8):
+        if lm_index[i] == lm_index[j] and (lm_to_l[i] < 2) == (lm_to_l[j] < 2):
+            ref[..., lm_index[i]] += np.transpose(
+                p[..., i] * qtot[:, lm_to_l[i], lm_to_l[j]] * p[..., j].conj(),
+                (2, 0, 1, 3),
+            )
+    np.testing.assert_allclose(procar, ref.real, atol=1e-12)
+
+
+@pytest.mark.parametrize("k_chunk_size", [None, 2])
+def test_CoreCharge(projector_data, k_chunk_size: int | None):
+    """Test CoreCharge by sum over spins, atoms, and pairs of lm orbitals."""
+    proj, _, _, qij = projector_data
+    cc = CoreCharge(proj, qij, k_chunk_size=k_chunk_size)._cc
+    p = proj[:, :, :, 0, :, :, 0]
+    ref = np.zeros((5, 4), dtype="complex128")
+    for i_s, i_atom in np.ndindex(2, 2):
+        ref += np.einsum(
+            "kbl,lm,kbm->kb",
+            p[:, :, i_s, i_atom],
+            qij[i_s, i_atom],
+            p[:, :, i_s, i_atom].conj(),
+        )
+    np.testing.assert_allclose(cc, ref, atol=1e-12)
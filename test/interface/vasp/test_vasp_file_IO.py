@@ -0,0 +1,151 @@
+"""Tests of VASP file IO functions."""
+
+from __future__ import annotations
+
+import io
+import lzma
+import pathlib
+
+import h5py
+import numpy as np
+import pytest
+import yaml
+from phonopy.interface.vasp import get_vasp_structure_lines
+
+from phelel import Phelel
+from phelel.interface.vasp.file_IO import (
+    get_CHGCAR,
+    read_bin_stream,
+    read_mesh_electron_hdf5,
+    read_waves,
+    write_CHGCAR,
+    write_mesh_electron_hdf5,
+    write_volumetric_data,
+)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 2**16])
+def test_write_CHGCAR(chunk_size: int):
+    """Test CHGCAR style text of values of non-contiguous array."""
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((3, 4, 7)) + 1j * rng.standard_normal((3, 4, 7))
+    with io.StringIO() as f:
+        write_CHGCAR(f, data.real, "header", chunk_size=chunk_size)
+        text = f.getvalue()
+    assert text == get_CHGCAR(data.real, "header")
+
+    lines = text.split("\n")
+    assert lines[:2] == ["header", "    7    4    3"]
+    assert len(lines) == 2 + 84 // 5 + 1
+    assert lines[2] == "".join("%18.11e" % v for v in data.real.ravel()[:5])
+    assert lines[-1] == "".join("%18.11e" % v for v in data.real.ravel()[80:])
+    body = "".join(lines[2:])
+    values = np.array(
+        [body[i : (i + 18)] for i in range(0, len(body), 18)], dtype="double"
+    )
+    np.testing.assert_allclose(values, data.real.ravel(), rtol=1e-10)
+
+
+def test_write_volumetric_data(phelel_empty_C111: Phelel, tmp_path: pathlib.Path):
+    """Test writing values on grid in CHGCAR style text and HDF5 file."""
+    cell = phelel_empty_C111.supercell
+    data = np.arange(2 * 3 * 4, dtype="double").reshape(2, 3, 4)
+    write_volumetric_data(tmp_path / "locpot.dat", data, cell)
+    header = "\n".join(get_vasp_structure_lines(cell))
+    assert (tmp_path / "locpot.dat").read_text() == get_CHGCAR(data, header)
+
+    write_volumetric_data(tmp_path / "locpot.hdf5", data, cell)
+    with h5py.File(tmp_path / "locpot.hdf5") as f:
+        np.testing.assert_array_equal(f["data"][:], data)
+        np.testing.assert_allclose(f["lattice"][:], cell.cell)
+        np.testing.assert_allclose(f["positions"][:], cell.scaled_positions)
+        np.testing.assert_array_equal(f["numbers"][:], cell.numbers)
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+@pytest.mark.parametrize("suffix", ["", ".xz"])
+def test_read_waves(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, suffix: str, mmap: bool
+):
+    """Test reading WAVES.bin by memory map and by streaming decompression.
+
+    Decompression is made in many readinto calls by small chunk size.
+
+    """
+    monkeypatch.setattr("phelel.interface.vasp.file_IO._READINTO_CHUNK_SIZE", 100)
+    inwap = {"ispin": 1, "nkpts": 3, "nbtot": 2, "nrspinors": 1}
+    inwap["fft_coarse"] = [4, 3, 2]
+    rng = np.random.default_rng(0)
+    shape = (3, 2, 1, 1, 2, 3, 4)
+    waves = rng.standard_normal(shape) + 1j * rng.standard_normal(shape)
+    filename = tmp_path / f"WAVES.bin{suffix}"
+    with (lzma if suffix else io).open(filename, "wb") as f:
+        f.write(waves.tobytes())
+
+    data = read_waves(inwap, filename, mmap=mmap)
+    np.testing.assert_array_equal(data, waves)
+    assert isinstance(data, np.memmap) is (mmap and not suffix)
+    assert not isinstance(read_waves(inwap, filename), np.memmap)
+
+    inwap["nbtot"] = 1
+    with pytest.raises(ValueError):
+        read_waves(inwap, filename, mmap=mmap)
+    with pytest.raises(ValueError):
+        read_bin_stream(filename, dtype="complex128", count=waves.size + 1, mmap=mmap)
+
+
+@pytest.mark.parametrize("n_workers", [None, 2])
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_write_mesh_electron_hdf5(
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    n_workers: int | None,
+    compression: str | None,
+):
+    """Test writing k-points split in directories to electron-mXXX.hdf5."""
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    nbtot, nions, lmdim, fft_mesh = 3, 2, 4, [4, 3, 2]
+    data: dict[str, list] = {"eigenvalues": [], "dprojectors": [], "waves": []}
+    dirnames = []
+    for i, nk in enumerate([2, 1, 3]):
+        dname = tmp_path / f"mesh-{i}"
+        dname.mkdir()
+        dirnames.append(dname)
+        inwap = {
+            "cell": {"NCDIJ": 1, "NIONS": nions, "ISPIN": 1, "NKPTS": nk},
+            "fft_grid": {"coarse": fft_mesh, "fine": fft_mesh},
+            "PAW": {"LMDIM": lmdim, "LDIM": 2, "lm_orbitals": []},
+            "KPOINTS": [],
+        }
+        inwap["cell"].update({"NBTOT": nbtot, "NRSPINORS": 1})
+        (dname / "inwap.yaml").write_text(yaml.dump(inwap))
+        eigvals = rng.standard_normal((nbtot, nk, 1))
+        (dname / "EIGENVALUE.bin").write_bytes(eigvals.tobytes())
+        data["eigenvalues"].append(eigvals.swapaxes(0, 1))
+        for key, name, shape in (
+            ("dprojectors", "DPROJECTORS.bin", (nions, lmdim, 4)),
+            ("waves", "WAVES.bin", (2, 3, 4)),
+        ):
+            shape = (nk, nbtot, 1, 1) + shape
+            values = rng.standard_normal(shape) + 1j * rng.standard_normal(shape)
+            (dname / name).write_bytes(values.tobytes())
+            data[key].append(values)
+
+    filename = write_mesh_electron_hdf5(
+        dirnames, [2, 2, 2], n_workers=n_workers, compression=compression
+    )
+    assert filename == "electron-m222.hdf5"
+    ref = {key: np.concatenate(values) for key, values in data.items()}
+    electron = read_mesh_electron_hdf5(filename)
+    np.testing.assert_array_equal(electron["mesh"], [2, 2, 2])
+    for key, values in ref.items():
+        np.testing.assert_array_equal(electron[key], values)
+
+    electron = read_mesh_electron_hdf5(filename, k_range=(1, 4))
+    for key, values in ref.items():
+        np.testing.assert_array_equal(electron[key], values[1:4])
+
+    electron = read_mesh_electron_hdf5(filename, lazy=True)
+    assert electron["waves"].chunks == (1, nbtot, 1, 1, 2, 3, 4)
+    np.testing.assert_array_equal(electron["waves"][2], ref["waves"][2])
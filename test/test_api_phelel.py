@@ -1,13 +1,28 @@
 """Test for Phelel class."""
 
+import copy
 import pathlib
 
 import h5py
 import numpy as np
+import pytest
 
+import phelel
 from phelel import Phelel
+from phelel.api_phelel import (
+    PhelelDataset,
+    PhelelDisplacedAtomData,
+    PhelelStreamDataset,
+)
+from phelel.base.Dij_qij import DDijQijNeighborArray
+from phelel.base.local_potential import (
+    DLocalPotential,
+    SymmetryReducedDVdu,
+    _SharedMemoryBuffer,
+)
 from phelel.file_IO import _get_smallest_vectors, read_phelel_params_hdf5
-from phelel.utils.data import cmplx2real
+from phelel.utils.data import LazyComplexArray, cmplx2real, real2cmplx
+from phelel.utils.profiler import Profiler
 
 cwd = pathlib.Path(__file__).parent
 
@@ -30,6 +45,275 @@ def test_api_phelel_CdAs2_111(phelel_CdAs2_111: Phelel):
     _compare(filename, phelel_CdAs2_111)
 
 
+def test_api_phelel_CdAs2_111_n_workers(phelel_input_CdAs2_111: PhelelDataset):
+    """Test dV/du calculation in process pool by CdAs2."""
+    phe = phelel.load(cwd / "phelel_disp_CdAs2.yaml")
+    phe.fft_mesh = [14, 14, 14]
+    phe.run_derivatives(phelel_input_CdAs2_111, n_workers=2)
+    # Workers write to dV/du allocated in shared memory without copy.
+    assert isinstance(phe.dVdu.dVdu.base, _SharedMemoryBuffer)
+    _compare(cwd / "phelel_params_CdAs2_111.hdf5", phe)
+
+
+def test_api_phelel_CdAs2_111_fft_workers(phelel_input_CdAs2_111: PhelelDataset):
+    """Test dV/du calculation with inverse FFT by scipy.fft by CdAs2."""
+    phe = phelel.load(cwd / "phelel_disp_CdAs2.yaml")
+    phe.fft_mesh = [14, 14, 14]
+    phe.run_derivatives(phelel_input_CdAs2_111, fft_workers=2)
+    _compare(cwd / "phelel_params_CdAs2_111.hdf5", phe)
+
+
+def test_api_phelel_CdAs2_111_stream(phelel_input_CdAs2_111: PhelelDataset):
+    """Test derivatives calculation displaced atom by displaced atom by CdAs2."""
+    phe = phelel.load(cwd / "phelel_disp_CdAs2.yaml")
+    phe.fft_mesh = [14, 14, 14]
+    phe.run_derivatives(
+        _get_stream_dataset(phelel_input_CdAs2_111, phe.dataset["first_atoms"])
+    )
+    _compare(cwd / "phelel_params_CdAs2_111.hdf5", phe)
+
+
+@pytest.mark.parametrize("n_workers", [None, 2])
+def test_api_phelel_CdAs2_111_checkpoint(
+    phelel_input_CdAs2_111: PhelelDataset, tmp_path: pathlib.Path, n_workers
+):
+    """Test restart of derivatives calculation from checkpoint by CdAs2."""
+    checkpoint = tmp_path / "phelel_checkpoint.hdf5"
+    phe = phelel.load(cwd / "phelel_disp_CdAs2.yaml")
+    phe.fft_mesh = [14, 14, 14]
+    displacements = phe.dataset["first_atoms"]
+
+    # Calculation interrupted after the first displaced atom.
+    phe.run_derivatives(
+        _get_stream_dataset(
+            phelel_input_CdAs2_111,
+            displacements,
+            disp_atoms=[displacements[0]["number"]],
+        ),
+        checkpoint=checkpoint,
+    )
+    with h5py.File(checkpoint, "r+") as f:
+        completed = f["dVdu_completed"][:]
+        assert completed.any() and not completed.all()
+        np.testing.assert_array_equal(completed, f["dDijdu_completed"][:])
+        # Completed dV/du has to be restored but not recomputed.
+        i_done = np.nonzero(completed)[0][0]
+        f["dVdu"][:, i_done] = 0
+
+    phe = phelel.load(cwd / "phelel_disp_CdAs2.yaml")
+    phe.fft_mesh = [14, 14, 14]
+    phe.run_derivatives(
+        phelel_input_CdAs2_111, n_workers=n_workers, checkpoint=checkpoint
+    )
+    with h5py.File(checkpoint, "r") as f:
+        assert f["dVdu_completed"][:].all()
+        assert f["dDijdu_completed"][:].all()
+    with h5py.File(cwd / "phelel_params_CdAs2_111.hdf5", "r") as f:
+        dVdu_ref = real2cmplx(f["dVdu"][:])
+        dDijdu_ref = real2cmplx(f["dDijdu"][:])
+    dVdu = phe.dVdu.dVdu
+    assert (dVdu[:, i_done] == 0).all()
+    others = np.arange(dVdu.shape[1]) != i_done
+    np.testing.assert_allclose(
+        dVdu[:, others], dVdu_ref[:, others], rtol=1e-4, atol=1e-4
+    )
+    np.testing.assert_allclose(phe.dDijdu.dDijdu, dDijdu_ref, rtol=1e-4, atol=1e-4)
+
+
+def test_api_phelel_CdAs2_111_stale_checkpoint(
+    phelel_input_CdAs2_111: PhelelDataset, tmp_path: pathlib.Path
+):
+    """Test checkpoint written with different displacement is rejected."""
+    checkpoint = tmp_path / "phelel_checkpoint.hdf5"
+    phe = phelel.load(cwd / "phelel_disp_CdAs2.yaml")
+    phe.fft_mesh = [14, 14, 14]
+    dataset = copy.deepcopy(phe.dataset)
+    dataset["first_atoms"][0]["displacement"] = (
+        np.array(dataset["first_atoms"][0]["displacement"]) * 2
+    )
+    phe.dataset = dataset
+    displacements = phe.dataset["first_atoms"]
+    phe.run_derivatives(
+        _get_stream_dataset(
+            phelel_input_CdAs2_111,
+            displacements,
+            disp_atoms=[displacements[0]["number"]],
+        ),
+        checkpoint=checkpoint,
+    )
+
+    phe = phelel.load(cwd / "phelel_disp_CdAs2.yaml")
+    phe.fft_mesh = [14, 14, 14]
+    with pytest.raises(RuntimeError, match="displacements differs"):
+        phe.run_derivatives(phelel_input_CdAs2_111, checkpoint=checkpoint)
+
+
+@pytest.mark.parametrize("same_ncdij", [True, False])
+@pytest.mark.parametrize("mode", ["serial", "n_workers", "stream"])
+def test_api_phelel_CdAs2_111_kinetic_potentials(
+    phelel_CdAs2_111: Phelel,
+    phelel_input_CdAs2_111: PhelelDataset,
+    mode: str,
+    same_ncdij: bool,
+):
+    """Test dV/du and dmu/du computed together by CdAs2.
+
+    Squares of local potentials are used as kinetic potentials. When ncdij of
+    kinetic potentials differs from that of local potentials, dV/du and dmu/du
+    are computed separately.
+
+    """
+    phei = phelel_input_CdAs2_111
+    if same_ncdij:
+        kin_pots = [v**2 for v in phei.local_potentials]
+    else:
+        kin_pots = [np.concatenate([v**2, -v]) for v in phei.local_potentials]
+        assert len(kin_pots[0]) != len(phei.local_potentials[0])
+    phe_input = PhelelDataset(
+        local_potentials=phei.local_potentials,
+        Dijs=phei.Dijs,
+        qijs=phei.qijs,
+        lm_channels=phei.lm_channels,
+        kinetic_potentials=kin_pots,
+    )
+    phe = phelel.load(cwd / "phelel_disp_CdAs2.yaml")
+    phe.fft_mesh = [14, 14, 14]
+    displacements = phe.dataset["first_atoms"]
+    if mode == "stream":
+        phe.run_derivatives(_get_stream_dataset(phe_input, displacements))
+    else:
+        phe.run_derivatives(phe_input, n_workers=2 if mode == "n_workers" else None)
+
+    dmudu_ref = DLocalPotential(
+        phe.fft_mesh,
+        phe.p2s_matrix,
+        phe.supercell,
+        symmetry=phe.symmetry,
+        atom_indices=phe.atom_indices_in_derivatives,
+        verbose=False,
+    )
+    dmudu_ref.run(kin_pots[0], kin_pots[1:], displacements)
+    np.testing.assert_allclose(phe.dVdu.dVdu, phelel_CdAs2_111.dVdu.dVdu, atol=1e-8)
+    np.testing.assert_allclose(phe.dmudu.dVdu, dmudu_ref.dVdu, atol=1e-8)
+    np.testing.assert_array_equal(phe.dmudu.grid_points, phe.dVdu.grid_points)
+
+
+def test_api_phelel_CdAs2_111_snapshots(
+    phelel_CdAs2_111: Phelel, phelel_input_CdAs2_111: PhelelDataset
+):
+    """Test least-squares fitting of derivatives to snapshots by CdAs2.
+
+    Displacements of one atom are given as snapshots, i.e., type-2 dataset,
+    for which the least-squares solution agrees with derivatives of the
+    displaced atoms computed by site-symmetry.
+
+    """
+    phe = phelel.load(cwd / "phelel_disp_CdAs2.yaml")
+    phe.fft_mesh = [14, 14, 14]
+    displacements = np.zeros((len(phe.dataset["first_atoms"]), len(phe.supercell), 3))
+    for i, d in enumerate(phe.dataset["first_atoms"]):
+        displacements[i, d["number"]] = d["displacement"]
+    phe.dataset = {"displacements": displacements}
+    phe.run_derivatives(phelel_input_CdAs2_111)
+    np.testing.assert_allclose(phe.dVdu.dVdu, phelel_CdAs2_111.dVdu.dVdu, atol=1e-8)
+    np.testing.assert_allclose(
+        phe.dDijdu.dDijdu, phelel_CdAs2_111.dDijdu.dDijdu, atol=1e-8
+    )
+    np.testing.assert_allclose(
+        phe.dDijdu.dqijdu, phelel_CdAs2_111.dDijdu.dqijdu, atol=1e-8
+    )
+
+    # Displacements of one of inequivalent atoms are insufficient.
+    phei = phelel_input_CdAs2_111
+    phe.dataset = {"displacements": displacements[:1]}
+    with pytest.raises(RuntimeError):
+        phe.run_derivatives(
+            PhelelDataset(
+                local_potentials=phei.local_potentials[:2],
+                Dijs=phei.Dijs[:2],
+                qijs=phei.qijs[:2],
+                lm_channels=phei.lm_channels,
+            )
+        )
+
+
+@pytest.mark.parametrize("n_workers", [None, 2])
+def test_api_phelel_CdAs2_111_profiler(
+    phelel_input_CdAs2_111: PhelelDataset, tmp_path: pathlib.Path, n_workers
+):
+    """Test recording costs of derivatives calculation by CdAs2."""
+    phe = phelel.load(cwd / "phelel_disp_CdAs2.yaml", profiler=Profiler())
+    phe.fft_mesh = [14, 14, 14]
+    phe.run_derivatives(phelel_input_CdAs2_111, n_workers=n_workers)
+    phe.save_hdf5(filename=tmp_path / "phelel_params.hdf5")
+    _compare(cwd / "phelel_params_CdAs2_111.hdf5", phe)
+
+    summary = {s["name"]: s for s in phe.profiler.get_summary()}
+    disp_atoms = np.unique([d["number"] for d in phe.dataset["first_atoms"]])
+    for name in ("dVdu/displaced_atom", "dDijdu/displaced_atom"):
+        records = [
+            r for r in phe.profiler.records if r["name"] == f"run_derivatives/{name}"
+        ]
+        assert sorted(r["atom"] for r in records) == disp_atoms.tolist()
+    for name in (
+        "run_derivatives",
+        "run_derivatives/dVdu/displaced_atom/atom/ifft",
+        "run_derivatives/dVdu/displaced_atom/atom/nufft_execute",
+        "run_derivatives/dDijdu/displaced_atom/atom/rotation",
+        "write_hdf5",
+    ):
+        assert summary[name]["count"] > 0
+    assert summary["run_derivatives"]["wall"] >= summary["run_derivatives/dVdu"]["wall"]
+
+
+@pytest.mark.parametrize("n_workers", [None, 2])
+def test_api_phelel_CdAs2_111_memmap(
+    phelel_input_CdAs2_111: PhelelDataset, tmp_path: pathlib.Path, n_workers
+):
+    """Test dV/du calculation stored in np.memmap by CdAs2."""
+    phe = phelel.load(cwd / "phelel_disp_CdAs2.yaml")
+    phe.fft_mesh = [14, 14, 14]
+    phe.run_derivatives(
+        phelel_input_CdAs2_111, n_workers=n_workers, memmap_dir=tmp_path
+    )
+    assert isinstance(phe.dVdu.dVdu, np.memmap)
+    assert (tmp_path / "dVdu.dat").exists()
+    _compare(cwd / "phelel_params_CdAs2_111.hdf5", phe)
+
+    filename = tmp_path / "phelel_params.hdf5"
+    phe.save_hdf5(filename=filename)
+    _compare(filename, phe)
+
+
+def test_api_phelel_CdAs2_111_single(
+    phelel_input_CdAs2_111: PhelelDataset, tmp_path: pathlib.Path
+):
+    """Test dV/du calculation in single precision by CdAs2.
+
+    Difference from double precision results is expected to be of the order of
+    1e-6 relative to the largest element of dV/du.
+
+    """
+    phe = phelel.load(cwd / "phelel_disp_CdAs2.yaml", precision="single")
+    phe.fft_mesh = [14, 14, 14]
+    phe.run_derivatives(phelel_input_CdAs2_111)
+    assert phe.dVdu.dVdu.dtype == np.complex64
+    _compare(cwd / "phelel_params_CdAs2_111.hdf5", phe)
+
+    with h5py.File(cwd / "phelel_params_CdAs2_111.hdf5", "r") as f:
+        dVdu_ref = real2cmplx(f["dVdu"][:])
+    diff = abs(phe.dVdu.dVdu - dVdu_ref).max() / abs(dVdu_ref).max()
+    assert diff < 1e-5
+
+    filename = tmp_path / "phelel_params.hdf5"
+    phe.save_hdf5(filename=filename)
+    with h5py.File(filename, "r") as f:
+        assert f["dVdu"].dtype == np.float32
+    dVdu, _, _, _ = read_phelel_params_hdf5(filename=filename)
+    assert dVdu.dVdu.dtype == np.complex64
+    np.testing.assert_array_equal(dVdu.dVdu, phe.dVdu.dVdu)
+
+
 def test_read_phelel_params_hdf5(phelel_CdAs2_111: Phelel):
     """Test reading phelel_params using CdAs2."""
     filename = cwd / "phelel_params_CdAs2_111.hdf5"
@@ -42,6 +326,143 @@ def test_read_phelel_params_hdf5(phelel_CdAs2_111: Phelel):
     )
 
 
+def test_read_phelel_params_hdf5_lazy(phelel_CdAs2_111: Phelel):
+    """Test lazily reading phelel_params using CdAs2."""
+    filename = cwd / "phelel_params_CdAs2_111.hdf5"
+    dVdu, dDijdu, _, fc = read_phelel_params_hdf5(filename=filename, lazy=True)
+    phe_ref = phelel_CdAs2_111
+
+    assert isinstance(dVdu.dVdu, LazyComplexArray)
+    assert dVdu.dVdu.shape == phe_ref.dVdu.dVdu.shape
+    np.testing.assert_allclose(
+        dVdu.dVdu[:, 1, 2], phe_ref.dVdu.dVdu[:, 1, 2], rtol=1e-5, atol=1e-5
+    )
+    np.testing.assert_allclose(
+        np.asarray(dVdu.dVdu), phe_ref.dVdu.dVdu, rtol=1e-5, atol=1e-5
+    )
+    np.testing.assert_allclose(
+        dDijdu.dDijdu[..., 0, :, :], phe_ref.dDijdu.dDijdu[..., 0, :, :], atol=1e-5
+    )
+    with h5py.File(filename, "r") as f:
+        np.testing.assert_allclose(fc[0], f["force_constants"][0])
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_read_phelel_params_hdf5_reduce_by_symmetry(
+    phelel_CdAs2_111: Phelel, tmp_path: pathlib.Path, lazy: bool
+):
+    """Test dV/du of irreducible atoms written and reconstructed using CdAs2."""
+    phe = phelel_CdAs2_111
+    filename = tmp_path / "phelel_params.hdf5"
+    phe.save_hdf5(filename=filename, reduce_by_symmetry=True)
+    with h5py.File(filename, "r") as f:
+        assert f["dVdu"].shape[1] == 3
+        np.testing.assert_array_equal(f["dVdu_atom_map"][:], [0, 1, 2, 2, 2, 2])
+    dVdu, _, _, _ = read_phelel_params_hdf5(filename=filename, lazy=lazy)
+
+    assert isinstance(dVdu.dVdu, SymmetryReducedDVdu)
+    assert dVdu.dVdu.shape == phe.dVdu.dVdu.shape
+    np.testing.assert_allclose(
+        dVdu.dVdu[:, 4, 1], phe.dVdu.dVdu[:, 4, 1], rtol=1e-5, atol=1e-5
+    )
+    np.testing.assert_allclose(
+        np.asarray(dVdu.dVdu), phe.dVdu.dVdu, rtol=1e-5, atol=1e-5
+    )
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_api_phelel_CdAs2_111_dDijdu_cutoff_radius(
+    phelel_CdAs2_111: Phelel,
+    phelel_input_CdAs2_111: PhelelDataset,
+    tmp_path: pathlib.Path,
+    lazy: bool,
+):
+    """Test dDij/du and dqij/du stored at neighbor atoms using CdAs2."""
+    phe = phelel.load(cwd / "phelel_disp_CdAs2.yaml", dDijdu_cutoff_radius=4.0)
+    phe.fft_mesh = [14, 14, 14]
+    phe.run_derivatives(phelel_input_CdAs2_111)
+    neighbors = phe.dDijdu.neighbors
+    assert isinstance(phe.dDijdu.dDijdu, DDijQijNeighborArray)
+    np.testing.assert_array_equal((neighbors >= 0).sum(axis=1), [5, 5, 8, 8, 8, 8])
+
+    filename = tmp_path / "phelel_params.hdf5"
+    phe.save_hdf5(filename=filename)
+    with h5py.File(filename, "r") as f:
+        assert f["dDijdu"].shape[3] == 8
+    _, dDijdu, _, _ = read_phelel_params_hdf5(filename=filename, lazy=lazy)
+    assert isinstance(dDijdu.dqijdu, DDijQijNeighborArray)
+    np.testing.assert_array_equal(dDijdu.neighbors, neighbors)
+
+    phe_ref = phelel_CdAs2_111
+    for i, row in enumerate(neighbors):
+        atoms = row[row >= 0]
+        others = np.setdiff1d(np.arange(len(phe.supercell)), atoms)
+        for obj in (phe.dDijdu, dDijdu):
+            for vals, vals_ref in (
+                (obj.dDijdu[:, i], phe_ref.dDijdu.dDijdu[:, i]),
+                (obj.dqijdu[:, i], phe_ref.dDijdu.dqijdu[:, i]),
+            ):
+                np.testing.assert_allclose(
+                    vals[:, :, atoms], vals_ref[:, :, atoms], atol=1e-8
+                )
+                assert (vals[:, :, others] == 0).all()
+
+
+@pytest.mark.parametrize("compression", ["gzip", "lzf"])
+def test_save_hdf5_compression(
+    phelel_CdAs2_111: Phelel, tmp_path: pathlib.Path, compression: str
+):
+    """Test derivatives written in compressed chunks using CdAs2."""
+    phe = phelel_CdAs2_111
+    filename = tmp_path / "phelel_params.hdf5"
+    phe.save_hdf5(filename=filename, compression=compression)
+    with h5py.File(filename, "r") as f:
+        for name in ("dVdu", "dDijdu", "dqijdu"):
+            shape = f[name].shape
+            assert f[name].compression == compression
+            assert f[name].shuffle
+            assert f[name].chunks == (shape[0], 1, 1) + shape[3:]
+    dVdu, dDijdu, _, _ = read_phelel_params_hdf5(filename=filename, lazy=True)
+    np.testing.assert_array_equal(np.asarray(dVdu.dVdu), phe.dVdu.dVdu)
+    np.testing.assert_array_equal(dDijdu.dqijdu[:, 1], phe.dDijdu.dqijdu[:, 1])
+
+
+def _get_stream_dataset(
+    phei: PhelelDataset, displacements: list[dict], disp_atoms=None
+) -> PhelelStreamDataset:
+    """Return PhelelStreamDataset yielding data of displaced atoms lazily."""
+    if disp_atoms is None:
+        disp_atoms = np.unique([d["number"] for d in displacements])
+
+    def displaced_atoms():
+        for disp_atom in disp_atoms:
+            indices = [
+                i + 1 for i, d in enumerate(displacements) if d["number"] == disp_atom
+            ]
+            yield PhelelDisplacedAtomData(
+                displacements=[displacements[i - 1] for i in indices],
+                local_potentials=[phei.local_potentials[i] for i in indices],
+                Dijs=[phei.Dijs[i] for i in indices],
+                qijs=[phei.qijs[i] for i in indices],
+                kinetic_potentials=(
+                    None
+                    if phei.kinetic_potentials is None
+                    else [phei.kinetic_potentials[i] for i in indices]
+                ),
+            )
+
+    return PhelelStreamDataset(
+        local_potential=phei.local_potentials[0],
+        Dij=phei.Dijs[0],
+        qij=phei.qijs[0],
+        lm_channels=phei.lm_channels,
+        displaced_atoms=displaced_atoms(),
+        kinetic_potential=(
+            None if phei.kinetic_potentials is None else phei.kinetic_potentials[0]
+        ),
+    )
+
+
 def _compare(filename: pathlib.Path, phe: Phelel):
     """Assert results.
 
@@ -10,7 +10,7 @@ from phonopy.interface.phonopy_yaml import read_cell_yaml
 from phonopy.structure.atoms import PhonopyAtoms
 from phonopy.structure.cells import apply_site_mixture, get_primitive
 
-from phelel.file_IO import write_phelel_params_hdf5
+from phelel.file_IO import _read_cell_info_hdf5, write_phelel_params_hdf5
 
 cwd_called = pathlib.Path.cwd()
 
@@ -132,3 +132,36 @@ def test_write_phelel_params_hdf5_spacegroup_number():
             assert "spacegroup_number" in f
             assert "magnetic_spacegroup_uni_number" not in f
         file_path.unlink()
+
+
+def test_read_cell_info_hdf5(tmp_path):
+    """Test p2s matrix from primitive_matrix with respect to unit cell.
+
+    The same p2s matrix is obtained from primitive_matrix and supercell_matrix,
+    and from primitive_lattice when supercell_matrix is not stored.
+
+    """
+    lattice = np.eye(3) * 3.5
+    smat = np.diag([2, 2, 1])
+    pmat = np.array([[0, 0.5, 0.5], [0.5, 0, 0.5], [0.5, 0.5, 0]])
+    filename = tmp_path / "phelel_params.hdf5"
+    with h5py.File(filename, "w") as w:
+        w.create_dataset("supercell_lattice", data=lattice @ smat)
+        w.create_dataset("supercell_positions", data=[[0.0, 0.0, 0.0]])
+        w.create_dataset("supercell_numbers", data=[6])
+        w.create_dataset("supercell_masses", data=[12.011])
+        w.create_dataset("p2s_map", data=[0])
+        w.create_dataset("primitive_matrix", data=pmat)
+        w.create_dataset("supercell_matrix", data=smat)
+        w.create_dataset("primitive_lattice", data=lattice @ pmat)
+    ref = np.rint(np.linalg.inv(pmat) @ smat).astype("int64")
+
+    with h5py.File(filename) as f:
+        _, _, p2s_matrix = _read_cell_info_hdf5(f)
+    np.testing.assert_array_equal(p2s_matrix, ref)
+
+    with h5py.File(filename, "a") as f:
+        del f["supercell_matrix"]
+    with h5py.File(filename) as f:
+        _, _, p2s_matrix = _read_cell_info_hdf5(f)
+    np.testing.assert_array_equal(p2s_matrix, ref)
@@ -0,0 +1,29 @@
+"""Test for concurrency utilities."""
+
+import threading
+
+import pytest
+
+from phelel.utils.concurrency import iter_read_ahead
+
+
+@pytest.mark.parametrize("n_workers", [None, 2])
+def test_iter_read_ahead(n_workers):
+    """Test results in order and number of calls ahead of consumed results."""
+    lock = threading.Lock()
+    called = []
+
+    def func(i, j):
+        with lock:
+            called.append(i)
+        return i * j
+
+    results = iter_read_ahead(func, range(6), range(6, 12), n_workers=n_workers)
+    for i, value in enumerate(results):
+        assert value == i * (i + 6)
+        with lock:
+            assert len(called) <= i + 1 + (n_workers or 0)
+    assert sorted(called) == list(range(6))
+
+    with pytest.raises(ValueError):
+        list(iter_read_ahead(func, range(2), range(3), n_workers=n_workers))
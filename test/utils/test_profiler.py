@@ -0,0 +1,44 @@
+"""Test for Profiler."""
+
+import json
+import pathlib
+
+import numpy as np
+
+from phelel.utils.profiler import Profiler, profiling_stage
+
+
+def test_Profiler(tmp_path: pathlib.Path):
+    """Test nested stages, summary, and JSON output."""
+    profiler = Profiler(trace_allocations=True)
+    with profiler.stage("run"):
+        for i in range(2):
+            with profiler.stage("atom", atom=i):
+                a = np.ones(2**20)
+                del a
+        with profiling_stage(None, "ignored"):
+            pass
+    assert profiler.path == ""
+    names = [r["name"] for r in profiler.records]
+    assert names == ["run/atom", "run/atom", "run"]
+    assert [r["atom"] for r in profiler.records] == [0, 1, None]
+    for r in profiler.records:
+        assert r["allocated"] >= 8 * 2**20
+        assert r["wall"] >= 0
+    summary = profiler.get_summary()
+    assert [s["name"] for s in summary] == ["run/atom", "run"]
+    assert summary[0]["count"] == 2
+
+    profiler.add_records([{**profiler.records[0], "name": "worker"}])
+    assert profiler.records[-1]["name"] == "worker"
+    with profiler.stage("pool"):
+        profiler.add_records([{**profiler.records[0], "name": "worker"}])
+    assert profiler.records[-2]["name"] == "pool/worker"
+
+    filename = tmp_path / "phelel_profile.json"
+    profiler.write_json(filename)
+    with open(filename) as f:
+        data = json.load(f)
+    assert data["summary"][0]["name"] == "run/atom"
+    assert len(data["records"]) == len(profiler.records)
+    assert "run/atom" in str(profiler)
@@ -0,0 +1,56 @@
+"""Test for classes in rotations.py."""
+
+import numpy as np
+from phonopy.structure.atoms import PhonopyAtoms
+from phonopy.structure.symmetry import Symmetry
+from phonopy.utils import similarity_transformation
+
+from phelel.utils.rotations import get_symmetry_rotation_table
+from phelel.utils.spherical_harmonics import (
+    LxLyLzMatrices,
+    SHRotationMatrices,
+    get_n_and_rotation_order,
+)
+from phelel.utils.spinor import SpinorRotationMatrices
+
+
+def test_SymmetryRotationTable():
+    """Test of SymmetryRotationTable by rutile-like structure."""
+    a, c, x = 4.6, 3.0, 0.3
+    cell = PhonopyAtoms(
+        cell=np.diag([a, a, c]),
+        scaled_positions=[
+            [0, 0, 0],
+            [0.5, 0.5, 0.5],
+            [x, x, 0],
+            [-x, -x, 0],
+            [0.5 + x, 0.5 - x, 0.5],
+            [0.5 - x, 0.5 + x, 0.5],
+        ],
+        symbols=["Ti"] * 2 + ["O"] * 4,
+    )
+    symmetry = Symmetry(cell)
+    lattice = cell.cell.T
+    table = get_symmetry_rotation_table(symmetry, lattice)
+    assert table is get_symmetry_rotation_table(symmetry, lattice)
+
+    rotations = symmetry.symmetry_operations["rotations"]
+    assert len(table.r_carts) == len(rotations)
+    lxlylz = LxLyLzMatrices().run()
+    for i_op, r in enumerate(rotations):
+        np.testing.assert_allclose(
+            table.r_carts[i_op], similarity_transformation(lattice, r), atol=1e-12
+        )
+        n, r_order, detR = get_n_and_rotation_order(r, lattice)
+        n_t, r_order_t, detR_t = table.get_axis_and_order(i_op)
+        np.testing.assert_allclose(n_t, n)
+        assert (r_order_t, detR_t) == (r_order, detR)
+        shr = SHRotationMatrices(r, lattice, lxlylz)
+        shr.run()
+        for D_t, D in zip(table.get_sh_Delta(i_op), shr.Delta, strict=True):
+            np.testing.assert_allclose(D_t, D, atol=1e-12)
+        np.testing.assert_allclose(
+            table.get_spinor_Delta(i_op),
+            SpinorRotationMatrices(r, lattice).run().Delta,
+            atol=1e-12,
+        )